@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Projet TL : évaluation d'un grand nombre de petites entrées - requires Python version >= 3.10
+
+calc.parse prépare tout pour chaque entrée : un lexer (alphabet, séparateurs, EOI), un flux
+io.StringIO, un analyseur. Ici, un seul lexer et un seul moteur servent à toutes les entrées :
+chaque texte est découpé d'un coup en TokenStream puis donné directement au moteur.
+"""
+
+import sys
+
+assert sys.version_info >= (3, 10), "Use Python 3.10 or newer !"
+
+import engine
+import lexer
+
+
+class BatchResults:
+    """
+    Résultats d'un lot d'entrées : values[k] est la liste des valeurs des calculs de la
+    k-ième entrée (comme calc.parse), ou None si elle a levé une erreur, rangée dans errors[k].
+    """
+    __slots__ = ('values', 'errors')
+
+    def __init__(self):
+        self.values = []
+        self.errors = {}
+
+    def __len__(self):
+        return len(self.values)
+
+    def __getitem__(self, k):
+        # Valeurs de l'entrée k, ou son erreur
+        k = range(len(self.values))[k] # indices négatifs compris, IndexError hors des bornes
+        if k in self.errors:
+            raise self.errors[k]
+        return self.values[k]
+
+    def __iter__(self):
+        return iter(self.values)
+
+    def __repr__(self):
+        return 'BatchResults(' + str(len(self.values)) + ' inputs, ' + str(len(self.errors)) + ' errors)'
+
+
+def evaluate_many(inputs, eoi=None):
+    """
+    Évalue chaque texte de inputs (une liste ou un itérateur) comme calc.parse le ferait
+    sur io.StringIO(texte + EOI), et renvoie un BatchResults. Une erreur dans une entrée
+    n'arrête pas les suivantes.
+    """
+    lex = lexer.Lexer(eoi)
+    tokenize = lex.tokenize_all
+    evaluator = engine.Evaluator()
+    batch = BatchResults()
+    values = batch.values
+    for k, text in enumerate(inputs):
+        evaluator.restart()
+        try:
+            values.append(evaluator.evaluate_tokens(tokenize(text)))
+        except Exception as e:
+            values.append(None)
+            batch.errors[k] = e
+    return batch
@@ -0,0 +1,378 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Projet TL : mesures de performance de la calculatrice
+
+Usage : python3 bench.py [nom_du_bench ...]
+Sans argument, tous les benchs sont lancés.
+"""
+
+import collections
+import io
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+from concurrent.futures import ProcessPoolExecutor
+
+import bytecode
+import calc
+import codecache
+import definitions as defs
+import lexer
+import parallel
+import parser
+import rattrapage
+import resultcache
+import sharedcache
+import sqlitecache
+
+
+#################################
+## Outils de mesure
+
+def best_time(function, repeat=3):
+    """
+    Renvoie le meilleur temps (en secondes) de plusieurs appels à function.
+    """
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        elapsed = time.perf_counter() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return best
+
+def report(name, size, unit, elapsed):
+    print("@ {0:<40} {1:>12.2f} {2}/s".format(name, size / elapsed, unit))
+
+def sample_input(n_calc):
+    """
+    Construit une entrée de n_calc calculs, sans EOI final.
+    """
+    calcs = ["1.5e+2 * (3 - #{0}) / 7;".format(i) if i else "12 + 3.25^2;" for i in range(n_calc)]
+    return " ".join(calcs)
+
+
+#################################
+## Benchs
+
+def bench_lexer(n_calc=20000):
+    """
+    Caractères lus par seconde par next_token, avec une lecture caractère par caractère
+    (BLOCK_SIZE = 1, comportement historique) puis avec la lecture par blocs.
+    """
+    text = sample_input(n_calc) + defs.EOI
+
+    def lex_all():
+        lexer.reinit(io.StringIO(text))
+        while lexer.next_token()[0] != defs.V_T.END:
+            pass
+
+    saved = lexer.BLOCK_SIZE
+    try:
+        for size in (1, saved):
+            lexer.BLOCK_SIZE = size
+            report("lexer, BLOCK_SIZE=" + str(size), len(text), "chars", best_time(lex_all))
+    finally:
+        lexer.BLOCK_SIZE = saved
+
+
+def bench_tokenize(n_calc=20000):
+    """
+    Lexer seul : next_token jusqu'au END contre tokenize_all.
+    Parser seul : calc.parse_tokens sur une TokenStream déjà produite.
+    """
+    text = sample_input(n_calc) + defs.EOI
+
+    def lex_all():
+        lexer.reinit(io.StringIO(text))
+        while lexer.next_token()[0] != defs.V_T.END:
+            pass
+
+    tokens = lexer.tokenize_all(text)
+    report("next_token", len(tokens), "tokens", best_time(lex_all))
+    report("tokenize_all", len(tokens), "tokens", best_time(lambda: lexer.tokenize_all(text)))
+    report("calc.parse_tokens", len(tokens), "tokens", best_time(lambda: calc.parse_tokens(tokens)))
+
+
+def bench_bytes(n_calc=20000):
+    """
+    next_token sur une str décodée (Lexer) contre next_token sur les octets (BytesLexer).
+    """
+    data = (sample_input(n_calc) + defs.EOI).encode()
+
+    def lex_str():
+        lex = lexer.Lexer()
+        lex.reinit(io.StringIO(data.decode()))
+        while lex.next_token()[0] != defs.V_T.END:
+            pass
+
+    def lex_bytes():
+        lex = lexer.BytesLexer(data)
+        while lex.next_token()[0] != defs.V_T.END:
+            pass
+        lex.release()
+
+    report("Lexer (decode + str)", len(data), "bytes", best_time(lex_str))
+    report("BytesLexer", len(data), "bytes", best_time(lex_bytes))
+
+
+def bench_engine(n_calc=20000):
+    """
+    Le même moteur avec chacune de ses actions sémantiques, sur une TokenStream déjà produite.
+    """
+    tokens = lexer.tokenize_all(sample_input(n_calc) + defs.EOI)
+    for name, parser_class in [("parser (reconnaissance)", parser.Parser), ("calc (évaluation)", calc.Parser),
+                               ("rattrapage (évaluation)", rattrapage.Parser), ("calc.TreeParser (arbres)", calc.TreeParser)]:
+        report(name, len(tokens), "tokens", best_time(lambda: parser_class().parse_tokens(tokens)))
+
+
+def bench_validate(n_calc=20000):
+    """
+    Accepter ou refuser une entrée binaire : parser.validate (un automate sur les octets)
+    contre parser.parse_bytes (lexer et moteur).
+    """
+    data = (sample_input(n_calc) + defs.EOI).encode()
+    report("parser.parse_bytes", len(data) / 1e6, "MB", best_time(lambda: parser.parse_bytes(data)))
+    report("parser.validate", len(data) / 1e6, "MB", best_time(lambda: parser.validate(data)))
+    rejected = data[:-2] + b")" + defs.EOI.encode()
+    report("parser.validate (refus à la fin)", len(rejected) / 1e6, "MB", best_time(lambda: parser.validate(rejected)))
+
+
+def bench_compile(n_calc=20000):
+    """
+    Évaluer plusieurs fois la même entrée : calc.parse à chaque fois,
+    contre une seule analyse (calc.compile) suivie de Program.run.
+    """
+    text = sample_input(n_calc)
+    report("calc.parse", n_calc, "calcs", best_time(lambda: calc.parse(io.StringIO(text + defs.EOI))))
+    report("calc.compile", n_calc, "calcs", best_time(lambda: calc.compile(text)))
+    program = calc.compile(text)
+    report("Program.run", n_calc, "calcs", best_time(program.run))
+    # Sous-expressions répétées : elles ne sont calculées qu'une fois, à la compilation
+    text = " ".join("(#{0} * #{0}) / 2^30 + 20! / 19! ;".format(i) if i else "1;" for i in range(n_calc))
+    report("calc.parse (répétitions)", n_calc, "calcs", best_time(lambda: calc.parse(io.StringIO(text + defs.EOI))))
+    report("calc.compile (répétitions)", n_calc, "calcs", best_time(lambda: calc.compile(text)))
+    report("calc.compile optimize (répétitions)", n_calc, "calcs", best_time(lambda: calc.compile(text, optimize=True)))
+    program = calc.compile(text, optimize=True)
+    report("Program.run optimize (répétitions)", n_calc, "calcs", best_time(program.run))
+
+
+def bench_selected(n_calc=20000):
+    """
+    Les derniers résultats seulement : calc.parse calcule tout,
+    calc.evaluate_selected seulement ce dont ils dépendent.
+    """
+    # Des chaînes indépendantes de 100 calculs : le dernier ne dépend que de sa chaîne
+    text = " ".join("8000! / 7999! ;" if i % 100 == 0 else "#{0} + 1 ;".format(i) for i in range(n_calc))
+    report("calc.parse", n_calc, "calcs", best_time(lambda: calc.parse(io.StringIO(text + defs.EOI))))
+    report("calc.evaluate_selected (dernier)", n_calc, "calcs", best_time(lambda: calc.evaluate_selected(text, [n_calc])))
+    program = calc.compile(text)
+    report("Program.evaluate (dernier)", n_calc, "calcs", best_time(lambda: program.evaluate([n_calc])))
+
+
+def bench_liveness(n_calc=20000):
+    """
+    Mémoire maximale : Program.run garde tous les résultats,
+    Program.iter_run seulement ceux auxquels un #i fera encore référence.
+    """
+    text = " ".join("2000! ;" if i % 2 == 0 else "#{0} / 1999! ;".format(i) for i in range(n_calc))
+    program = calc.compile(text)
+    program.dependencies()
+    for name, run in [("Program.run", program.run), ("Program.iter_run", lambda: collections.deque(program.iter_run(), 0))]:
+        tracemalloc.start()
+        run()
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        print("@ {0:<40} {1:>12.2f} MB max".format(name, peak / 1e6))
+    report("Program.run", n_calc, "calcs", best_time(program.run))
+    report("Program.iter_run", n_calc, "calcs", best_time(lambda: collections.deque(program.iter_run(), 0)))
+
+
+def bench_stream(n_calc=200000):
+    """
+    Fichier lu en flux : calc.parse garde tous les résultats,
+    calc.iter_results seulement une fenêtre, le reste sur disque.
+    """
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'input.txt')
+        with open(path, 'w') as f:
+            f.write(sample_input(n_calc) + defs.EOI)
+
+        def parse():
+            with open(path) as f:
+                calc.parse(f)
+
+        def iter_results():
+            with open(path) as f:
+                collections.deque(calc.iter_results(f, window=1024, directory=tmp), 0)
+
+        for name, run in [("calc.parse", parse), ("calc.iter_results", iter_results)]:
+            tracemalloc.start()
+            run()
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            print("@ {0:<40} {1:>12.2f} MB max".format(name, peak / 1e6))
+            report(name, n_calc, "calcs", best_time(run, 1))
+
+
+def bench_session(n_calc=20000):
+    """
+    Modification d'un calcul au milieu de l'entrée : calc.parse sur tout le texte,
+    contre Session.edit qui ne recalcule que ce qui en dépend.
+    """
+    # Des chaînes indépendantes de 100 calculs
+    text = " ".join("1.5e+2 * (3 - #{0}) / 7;".format(i) if i % 100 else "12 + 3.25^2;" for i in range(n_calc))
+    report("calc.parse", n_calc, "calcs", best_time(lambda: calc.parse(io.StringIO(text + defs.EOI))))
+    report("calc.open_session", n_calc, "calcs", best_time(lambda: calc.open_session(text)))
+    session = calc.open_session(text)
+    middle = len(session) // 2
+    sources = [session.source(middle), " 1234 ;"]
+    edits = 1000
+    def edit():
+        for k in range(edits):
+            session.edit(middle, sources[k % 2])
+    report("Session.edit", edits, "edits", best_time(edit))
+
+
+def bench_resultcache(n_inputs=20000):
+    """
+    Petites entrées qui reviennent souvent, aux séparateurs près :
+    calc.parse sur chacune, contre calc.parse_cached.
+    """
+    inputs = [" " * (k % 3) + "{0}! / {1}! ; #1 * 3 ;".format(2000 + k % 50, 1999 + k % 50) for k in range(n_inputs)]
+    def parse():
+        for text in inputs:
+            calc.parse(io.StringIO(text + defs.EOI))
+    report("calc.parse", n_inputs, "inputs", best_time(parse))
+    cache = resultcache.ResultCache()
+    def parse_cached():
+        for text in inputs:
+            calc.parse_cached(text, cache=cache)
+    report("calc.parse_cached", n_inputs, "inputs", best_time(parse_cached))
+    print("@", cache.stats())
+
+
+def bench_sqlitecache(n_calc=2000):
+    """
+    Fichier de calculs coûteux relancé sans changement : calc.parse,
+    puis calc.parse_cached avec une base SQLite vide, puis déjà remplie.
+    """
+    text = " ".join("{0}! / {1}! ;".format(3000 + i % 200, 2999 + i % 200) if i % 2 else "2 ^ 0.{0} ;".format(i)
+                    for i in range(n_calc))
+    report("calc.parse", n_calc, "calcs", best_time(lambda: calc.parse(io.StringIO(text + defs.EOI)), 1))
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'results.sqlite')
+        with sqlitecache.SQLiteCache(path) as cache:
+            report("SQLiteCache (base vide)", n_calc, "calcs", best_time(lambda: calc.parse_cached(text, cache=cache), 1))
+        with sqlitecache.SQLiteCache(path) as cache:
+            report("SQLiteCache (base remplie)", n_calc, "calcs", best_time(lambda: calc.parse_cached(text, cache=cache), 1))
+            print("@", cache.stats())
+
+
+def bench_parallel(n_calc=200):
+    """
+    Calculs lourds et presque indépendants : calc.parse sur un seul cœur
+    contre parallel.run avec 1, 2, 4... processus (jusqu'au nombre de cœurs).
+    """
+    text = " ".join("#{0} + 1 ;".format(i) if i % 10 == 9 else "{0}! / {1}! ;".format(20000 + i, 19999 + i)
+                    for i in range(n_calc))
+    report("calc.parse", n_calc, "calcs", best_time(lambda: calc.parse(io.StringIO(text + defs.EOI)), 1))
+    program = calc.compile(text)
+    workers = 1
+    while workers <= (os.cpu_count() or 1):
+        with ProcessPoolExecutor(workers) as executor:
+            report("parallel.run, " + str(workers) + " processus", n_calc, "calcs",
+                   best_time(lambda: parallel.run(program, executor), 1))
+        workers *= 2
+
+
+def bench_bytecode(n_calc=20000):
+    """
+    Machine à pile : compilation, exécution et aller-retour par le bloc binaire,
+    contre les fermetures de calc.compile.
+    """
+    text = sample_input(n_calc)
+    report("calc.compile_bytecode", n_calc, "calcs", best_time(lambda: calc.compile_bytecode(text)))
+    code = calc.compile_bytecode(text)
+    report("Bytecode.run", n_calc, "calcs", best_time(code.run))
+    blob = code.to_bytes()
+    report("Bytecode.from_bytes", len(blob) / 1e6, "MB", best_time(lambda: bytecode.Bytecode.from_bytes(blob)))
+    program = calc.compile(text)
+    report("Program.run", n_calc, "calcs", best_time(program.run))
+
+
+def bench_codecache(n_calc=20000):
+    """
+    Compilation d'un fichier sans cache, puis depuis le cache sur disque.
+    """
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'input.txt')
+        with open(path, 'w') as f:
+            f.write(sample_input(n_calc) + defs.EOI)
+        cache = codecache.CodeCache(os.path.join(tmp, 'cache'))
+        report("compile_file (sans cache)", n_calc, "calcs",
+               best_time(lambda: bytecode.BytecodeParser().parse_file(path)))
+        cache.compile_file(path)
+        report("CodeCache.compile_file (depuis le cache)", n_calc, "calcs",
+               best_time(lambda: cache.compile_file(path)))
+
+
+def bench_sharedcache(n_calc=400, workers=2):
+    """
+    Mêmes factorielles dans beaucoup de calculs répartis entre processus :
+    parallel.run sans cache, puis avec un sharedcache.SharedCache commun.
+    """
+    text = " ".join("{0}! / {1}! ;".format(20000 + i % 10, 19999 + i % 10) for i in range(n_calc))
+    program = calc.compile(text)
+    with ProcessPoolExecutor(workers) as executor:
+        report("parallel.run", n_calc, "calcs", best_time(lambda: parallel.run(program, executor), 1))
+        with sharedcache.SharedCache() as cache:
+            report("parallel.run + SharedCache", n_calc, "calcs",
+                   best_time(lambda: parallel.run(program, executor, cache=cache), 1))
+            print("@ entrées dans le cache :", len(cache))
+
+
+def bench_many(n_inputs=20000):
+    """
+    Beaucoup de petites entrées : calc.parse sur un io.StringIO pour chacune,
+    contre calc.evaluate_many sur toutes.
+    """
+    inputs = ["{0} + 2 * 3 ; #1 ^ 2 ;".format(k) if k % 10 else "1 / 0 ;" for k in range(n_inputs)]
+    def parse_loop():
+        for text in inputs:
+            try:
+                calc.parse(io.StringIO(text + defs.EOI))
+            except ZeroDivisionError:
+                pass
+    report("calc.parse (boucle)", n_inputs, "inputs", best_time(parse_loop))
+    report("calc.evaluate_many", n_inputs, "inputs", best_time(lambda: calc.evaluate_many(inputs)))
+
+
+BENCHS = {
+    'lexer': bench_lexer,
+    'tokenize': bench_tokenize,
+    'bytes': bench_bytes,
+    'engine': bench_engine,
+    'validate': bench_validate,
+    'compile': bench_compile,
+    'selected': bench_selected,
+    'liveness': bench_liveness,
+    'stream': bench_stream,
+    'session': bench_session,
+    'resultcache': bench_resultcache,
+    'sqlitecache': bench_sqlitecache,
+    'parallel': bench_parallel,
+    'bytecode': bench_bytecode,
+    'codecache': bench_codecache,
+    'sharedcache': bench_sharedcache,
+    'many': bench_many,
+}
+
+if __name__ == "__main__":
+    for name in sys.argv[1:] or BENCHS:
+        print("@---- bench", name)
+        BENCHS[name]()
@@ -0,0 +1,201 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Projet TL : bytecode des calculs et machine à pile - requires Python version >= 3.10
+
+Le moteur d'analyse réduit les opérateurs dans l'ordre postfixe : les actions sémantiques
+de BytecodeActions n'ont donc qu'à émettre une instruction par action pour obtenir le code
+d'une machine à pile. Les instructions sont rangées dans trois tableaux (codes, indices
+des #i, littéraux) qui s'écrivent tels quels dans un bloc binaire compact.
+"""
+
+import math
+import struct
+import sys
+from array import array
+
+assert sys.version_info >= (3, 10), "Use Python 3.10 or newer !"
+
+import engine
+import lexer
+from engine import ParserError, ADD, SUB, MUL, DIV, POW
+
+#####
+# Jeu d'instructions
+
+PUSH = 0    # empile le littéral suivant
+LOAD = 1    # empile le résultat #i (indice suivant, à partir de 0)
+OP_ADD = 2
+OP_SUB = 3
+OP_MUL = 4
+OP_DIV = 5
+OP_POW = 6
+OP_NEG = 7
+OP_FACT = 8
+STORE = 9   # fin d'un calcul : dépile sa valeur et l'ajoute aux résultats
+
+OPCODE = {ADD: OP_ADD, SUB: OP_SUB, MUL: OP_MUL, DIV: OP_DIV, POW: OP_POW}
+
+# Format du bloc binaire : en-tête puis les trois tableaux, en petit-boutiste
+MAGIC = b'TLBC'
+VERSION = 1
+HEADER = struct.Struct('<4sBIIII') # MAGIC, VERSION, nombre de codes, d'indices, de littéraux, de calculs
+
+assert array('I').itemsize == 4 and array('d').itemsize == 8
+
+
+#####
+# Le code d'une suite de calculs
+
+class Bytecode:
+    """
+    Code d'une suite de calculs : codes des instructions (array('B')), indices des #i
+    lus par LOAD (array('I')) et littéraux empilés par PUSH (array('d')).
+    run() renvoie la liste des valeurs des calculs, exactement comme calc.parse.
+    """
+    def __init__(self, code=None, args=None, consts=None, n_calcs=0):
+        self.code = code if code is not None else array('B')
+        self.args = args if args is not None else array('I')
+        self.consts = consts if consts is not None else array('d')
+        self.n_calcs = n_calcs
+
+    def __len__(self):
+        return self.n_calcs
+
+    def __eq__(self, other):
+        return (isinstance(other, Bytecode) and self.code == other.code and self.args == other.args
+                and self.consts == other.consts and self.n_calcs == other.n_calcs)
+
+    def run(self):
+        r = []
+        store = r.append
+        stack = []
+        push = stack.append
+        pop = stack.pop
+        next_const = iter(self.consts).__next__
+        next_arg = iter(self.args).__next__
+        factorial = math.factorial
+        for op in self.code:
+            if op == PUSH:
+                push(next_const())
+            elif op == LOAD:
+                push(r[next_arg()]) # IndexError si le calcul #i n'existe pas (encore)
+            elif op == OP_ADD:
+                n = pop()
+                stack[-1] += n
+            elif op == OP_MUL:
+                n = pop()
+                stack[-1] *= n
+            elif op == OP_SUB:
+                n = pop()
+                stack[-1] -= n
+            elif op == OP_DIV:
+                n = pop()
+                stack[-1] /= n
+            elif op == STORE:
+                store(pop())
+            elif op == OP_NEG:
+                stack[-1] = -stack[-1]
+            elif op == OP_POW:
+                n = pop()
+                stack[-1] = math.pow(stack[-1], n)
+            else:
+                stack[-1] = factorial(int(stack[-1]))
+        return r
+
+    #####
+    # Bloc binaire
+
+    def to_bytes(self):
+        arrays = [self.code, self.args, self.consts]
+        if sys.byteorder == 'big':
+            arrays = [array(a.typecode, a) for a in arrays]
+            for a in arrays:
+                a.byteswap()
+        header = HEADER.pack(MAGIC, VERSION, len(self.code), len(self.args), len(self.consts), self.n_calcs)
+        return header + b''.join(a.tobytes() for a in arrays)
+
+    @classmethod
+    def from_bytes(cls, blob):
+        """
+        Relit un bloc produit par to_bytes. Lève ValueError si le bloc n'est pas valide.
+        """
+        blob = memoryview(blob).cast('B')
+        if len(blob) < HEADER.size:
+            raise ValueError("bytecode too short")
+        magic, version, n_code, n_args, n_consts, n_calcs = HEADER.unpack_from(blob)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError("not a bytecode of version " + str(VERSION))
+        sizes = (n_code, 4 * n_args, 8 * n_consts)
+        if len(blob) != HEADER.size + sum(sizes):
+            raise ValueError("bytecode size does not match its header")
+        arrays = []
+        start = HEADER.size
+        for typecode, size in zip('BId', sizes):
+            a = array(typecode)
+            a.frombytes(blob[start:start + size])
+            if sys.byteorder == 'big':
+                a.byteswap()
+            arrays.append(a)
+            start += size
+        code = arrays[0]
+        if (code.count(PUSH) != n_consts or code.count(LOAD) != n_args or code.count(STORE) != n_calcs
+                or (code and max(code) > STORE)):
+            raise ValueError("bytecode instructions do not match its header")
+        return cls(*arrays, n_calcs)
+
+    # Les processus échangent le bloc binaire (pickle, multiprocessing)
+    def __reduce__(self):
+        return (Bytecode.from_bytes, (self.to_bytes(),))
+
+
+#####
+# Émission du code par le moteur
+
+class BytecodeActions(engine.Actions):
+    """
+    Actions sémantiques qui émettent le code : une instruction par action, dans l'ordre
+    où le moteur évalue. Les erreurs d'analyse sont levées ici, les autres par run.
+    """
+    def __init__(self):
+        self.results = Bytecode()
+        self.emit = self.results.code.append
+        self.binary = [None] * (engine.NEG + 1)
+        for op, opcode in OPCODE.items():
+            self.binary[op] = lambda n_1, n_0, opcode=opcode: self.emit(opcode)
+
+    def num(self, value):
+        self.emit(PUSH)
+        self.results.consts.append(value)
+
+    def calc(self, i):
+        if not i:
+            raise ParserError("Erreur dans parse_exp0: i n'a pas de valeur")
+        self.emit(LOAD)
+        # Un #i qui n'existe pas encore donne IndexError à l'exécution : on le ramène
+        # au calcul en cours, qui n'existe pas non plus, pour que l'indice tienne dans 32 bits
+        self.results.args.append(min(i - 1, self.results.n_calcs))
+
+    def neg(self, n):
+        self.emit(OP_NEG)
+
+    def fact(self, n):
+        self.emit(OP_FACT)
+
+    def store(self, n):
+        self.emit(STORE)
+        self.results.n_calcs += 1
+
+
+# Le moteur avec ces actions : parse, parse_bytes, parse_file... renvoient un Bytecode
+class BytecodeParser(engine.Parser):
+    actions = BytecodeActions
+
+
+def compile(source, eoi=None):
+    """
+    Analyse une entrée complète (jusqu'au premier EOI ou jusqu'à la fin du texte)
+    et renvoie son Bytecode.
+    """
+    parser = BytecodeParser(lexer.Lexer(eoi))
+    return parser.parse_tokens(parser.lexer.tokenize_all(source))
@@ -3,222 +3,163 @@
 """
 Projet TL : parser - requires Python version >= 3.10
 """
-import math
+import argparse
 import sys
-from math import factorial
-
-from lexer import next_token
 
 assert sys.version_info >= (3, 10), "Use Python 3.10 or newer !"
 
+import batch
+import bytecode
+import compiler
+import engine
+import history
 import lexer
-from definitions import V_T, str_attr_token
+import resultcache
+import session
+from definitions import V_T
+from engine import ParserError
+
 
 #####
-# Variables internes (à ne pas utiliser directement)
+# L'analyseur : le moteur de engine, qui évalue les calculs.
+# parse n'est pas récursive : le moteur garde son état dans deux piles explicites,
+# la profondeur de la pile de Python ne dépend donc ni du nombre de calculs ni de leur imbrication
+
+class Parser(engine.Parser):
+    actions = engine.EvaluateActions
+
+    # Comme parse, mais renvoie directement l'historique des résultats (voir history.History)
+    def parse_history(self, stream=sys.stdin):
+        self.init_parser(stream)
+        results = self.evaluate_input().results
+        self.consume_token(V_T.END)
+        return results
+
+
+# Le même moteur, qui construit l'arbre de chaque calcul (voir engine.TreeActions)
+class TreeParser(engine.Parser):
+    actions = engine.TreeActions
 
-_current_token = V_T.END
-_value = None  # attribut du token renvoyé par le lexer
 
 #####
-# Fonctions génériques
+# Fonctions du module : elles utilisent un analyseur partagé,
+# sauf les fonctions parse* qui créent un nouvel analyseur à chaque appel
 
-class ParserError(Exception):
-    pass
+_parser = Parser()
 
 def unexpected_token(expected):
-    return ParserError("Found token '" + str_attr_token(_current_token, _value) + "' but expected " + expected)
+    return _parser.unexpected_token(expected)
 
 def get_current():
-    return _current_token
+    return _parser.get_current()
 
 def get_value():
-    return _value
+    return _parser.get_value()
 
 def init_parser(stream):
-    global _current_token, _value
-    lexer.reinit(stream)
-    _current_token, _value = lexer.next_token()
-    # print("@ init parser on",  repr(str_attr_token(_current, _value)))  # for DEBUGGING
+    return _parser.init_parser(stream)
+
+def init_parser_tokens(tokens):
+    return _parser.init_parser_tokens(tokens)
 
 def consume_token(tok):
-    # Vérifie que le prochain token est tok ;
-    # si oui, le consomme et renvoie son attribut ; si non, lève une exception
-    global _current_token, _value
-    if _current_token != tok:
-        raise unexpected_token(tok.name)
-    if _current_token != V_T.END:
-        old = _value
-        _current_token, _value = lexer.next_token()
-        return old
-
-#########################
-## Définition des méthodes de parsing pour les non terminaux
-
-def parse_exp5(l):
-    tok = get_current()
-    if tok in [V_T.SUB, V_T.OPAR, V_T.NUM, V_T.CALC]:
-        n_1 = parse_exp4(l)
-        n = parse_exp5_p(l, n_1)
-        return n
-    else:
-        raise ParserError("Impossible de parser dans parse_exp5")
-
-def parse_exp5_p(l, n_1):
-    tok = get_current()
-    if tok  == V_T.ADD:
-        consume_token(V_T.ADD)
-        n_0 = parse_exp4(l)
-        n = parse_exp5_p(l, n_1 + n_0)
-        return n
-    elif tok == V_T.SUB:
-        consume_token(V_T.SUB)
-        n_0 = parse_exp4(l)
-        n = parse_exp5_p(l, n_1 - n_0)
-        return n
-    elif tok in [V_T.CPAR, V_T.SEQ]:
-        return n_1
-    else:
-        raise ParserError("Impossible de parser dans parse_exp5_p")
-
-def parse_exp4(l):
-    tok = get_current()
-    if tok in [V_T.SUB, V_T.OPAR, V_T.NUM, V_T.CALC]:
-        n_1 = parse_exp3(l)
-        n = parse_exp4_p(l, n_1)
-        return n
-    else:
-        raise ParserError("Impossible de parser dans parse_exp4")
-
-def parse_exp4_p(l, n_1):
-    tok = get_current()
-    if tok == V_T.MUL:
-        consume_token(V_T.MUL)
-        n_0 = parse_exp3(l)
-        n = parse_exp4_p(l, n_1 * n_0)
-        return n
-    elif tok == V_T.DIV:
-        consume_token(V_T.DIV)
-        n_0 = parse_exp3(l)
-        n = parse_exp4_p(l, n_1 / n_0)
-        return n
-    elif tok in [V_T.ADD, V_T.SUB, V_T.CPAR, V_T.SEQ]:
-        return n_1
-    else:
-        raise ParserError("Impossible de parser dans parse_exp4_p")
-
-def parse_exp3(l):
-    tok = get_current()
-    if tok == V_T.SUB:
-        consume_token(V_T.SUB)
-        n_0 = parse_exp3(l)
-        return -n_0
-    elif tok in [V_T.OPAR, V_T.NUM, V_T.CALC]:
-        n_0 = parse_exp2(l)
-        return n_0
-    else:
-        raise ParserError("Impossible de parser dans parse3")
-
-def parse_exp2(l):
-    tok = get_current()
-    if tok in [ V_T.OPAR, V_T.NUM, V_T.CALC]:
-        n_1 = parse_exp1(l)
-        n = parse_exp2_p(l, n_1)
-        return n
-    else:
-        raise ParserError("Impossible de parser dans parse_exp2")
-
-def parse_exp2_p(l, n_1):
-    tok = get_current()
-    if tok == V_T.FACT:
-        consume_token(V_T.FACT)
-        n = parse_exp2_p(l, math.factorial(int(n_1)))
-        return n
-    elif tok in [V_T.MUL, V_T.DIV, V_T.ADD, V_T.SUB, V_T.CPAR, V_T.SEQ]:
-        return n_1
-    else:
-        raise ParserError("Impossible de parser dans parse_exp2_p")
-
-def parse_exp1(l):
-    tok = get_current()
-    if tok in [V_T.OPAR, V_T.NUM, V_T.CALC]:
-        n_1 = parse_exp0(l)
-        n = parse_exp1_p(l, n_1)
-        return n
-    else:
-        raise ParserError("Impossible de parser dans parse_exp1")
-
-def parse_exp1_p(l, n_1):
-    tok = get_current()
-    if tok == V_T.POW:
-        consume_token(V_T.POW)
-        n_2 = parse_exp1(l)
-        return math.pow(n_1, n_2)
-    elif tok in [V_T.FACT, V_T.MUL, V_T.DIV, V_T.ADD, V_T.SUB, V_T.CPAR, V_T.SEQ]:
-        return n_1
-    else:
-        raise ParserError("Impossible de parser dans parse_exp1_p")
-
-def parse_exp0(l):
-    tok = get_current()
-    if tok == V_T.OPAR:
-        consume_token(V_T.OPAR)
-        n = parse_exp5(l)
-        consume_token(V_T.CPAR)
-        return n
-    elif tok == V_T.NUM:
-        val = consume_token(V_T.NUM)
-        return val
-    elif tok == V_T.CALC:
-        i = consume_token(V_T.CALC)
-        if not i:
-            raise ParserError("Erreur dans parse_exp0: i n'a pas de valeur")
-        return l[i-1]
-    else:
-        raise ParserError("Impossible de parser dans parse_exp0")
-
-#########################
-## Parsing de input
-
-def parse_input_p(l):
-    tok = get_current()
-    if tok in [V_T.SUB, V_T.OPAR, V_T.NUM, V_T.CALC]:
-        n = parse_exp5(l)
-        consume_token(V_T.SEQ)
-        l_0 = parse_input_p(l + [n])
-        return l_0
-    elif tok == V_T.END:
-        return l
-    else:
-        raise ParserError("Impossible de parser dans parse_input")
+    return _parser.consume_token(tok)
 
 def parse_input():
-    tok = get_current()
-    if tok in [V_T.SUB, V_T.OPAR, V_T.NUM, V_T.CALC, V_T.END]:
-        l = parse_input_p([])
-        return l
-    else:
-        raise ParserError("Impossible de parser dans parse_input")
-
-#####################################
-## Fonction principale de la calculatrice
-## Appelle l'analyseur grammatical et retourne
-## - None sans les attributs
-## - la liste des valeurs des calculs avec les attributs
+    return _parser.parse_input()
 
 def parse(stream=sys.stdin):
-    init_parser(stream)
-    l = parse_input()
-    consume_token(V_T.END)
-    return l
+    return Parser().parse(stream)
+
+def parse_tokens(tokens):
+    return Parser().parse_tokens(tokens)
+
+def parse_history(stream=sys.stdin):
+    return Parser().parse_history(stream)
+
+def parse_bytes(data):
+    return Parser().parse_bytes(data)
+
+def parse_file(path):
+    return Parser().parse_file(path)
+
+def parse_trees(stream=sys.stdin):
+    return TreeParser().parse(stream)
+
+def iter_results(stream=sys.stdin, window=history.WINDOW, directory=None, eoi=None, size=1 << 16):
+    """
+    Générateur des valeurs des calculs lus sur stream (texte ou binaire), par morceaux
+    de size caractères : chaque valeur est produite dès que le ';' de son calcul est lu.
+    Seuls les window derniers résultats environ restent en mémoire, les autres sont rangés
+    dans un fichier temporaire du répertoire directory (voir history.PagedHistory).
+    """
+    with history.PagedHistory(window, directory) as results:
+        push_lexer = lexer.PushLexer(eoi)
+        evaluator = engine.Evaluator(results)
+        feed = evaluator.feed
+        while not evaluator.finished():
+            chunk = stream.read(size)
+            if isinstance(chunk, bytes):
+                chunk = chunk.decode('latin-1')
+            for tok, value in push_lexer.feed(chunk) if chunk else push_lexer.close():
+                n = feed(tok, value)
+                if n is not None:
+                    yield n
+            if not chunk:
+                break
+
+# Analyse source une seule fois et renvoie un compiler.Program, à exécuter avec run()
+# (avec optimize, les constantes sont calculées et les sous-arbres identiques partagés).
+# Pas de limite d'imbrication des parenthèses : au-delà de compiler.MAX_DEPTH niveaux, un calcul
+# est évalué sans fermetures imbriquées, plus lentement (voir compiler.lower)
+def compile(source, eoi=None, optimize=False):
+    return compiler.compile(source, eoi, optimize)
+
+# Même chose vers le code de la machine à pile : un bytecode.Bytecode, à exécuter avec run()
+def compile_bytecode(source, eoi=None):
+    return bytecode.compile(source, eoi)
+
+# Valeurs des seuls calculs demandés (numérotés comme #i), sans évaluer ceux dont ils ne dépendent pas :
+# renvoie le dictionnaire {i: valeur} ; même imbrication possible que pour compile
+def evaluate_selected(source, wanted, eoi=None):
+    return compiler.evaluate_selected(source, wanted, eoi)
+
+# Itérateur sur les valeurs des calculs : chaque résultat est libéré après sa dernière
+# utilisation par un #i (voir compiler.Program.iter_run)
+def iter_values(source, eoi=None):
+    return compiler.compile(source, eoi).iter_run()
+
+# Beaucoup de petites entrées (des textes, sans io.StringIO) avec un seul lexer et un seul moteur :
+# renvoie un batch.BatchResults, où chaque entrée a ses valeurs ou son erreur
+def evaluate_many(inputs, eoi=None):
+    return batch.evaluate_many(inputs, eoi)
+
+# Comme parse, sur un texte, à travers un cache des valeurs des calculs déjà vus
+# (par défaut result_cache, partagé par tous les appels ; voir resultcache.ResultCache)
+result_cache = resultcache.ResultCache()
+
+def parse_cached(source, eoi=None, cache=None):
+    return (cache if cache is not None else result_cache).parse(source, eoi)
+
+# Session d'édition : modifier un calcul ne recalcule que ce qui en dépend (voir session.Session) ;
+# même imbrication possible que pour compile
+def open_session(source='', eoi=None):
+    return session.Session(source, eoi)
+
+# Valeurs de tous les calculs, évalués en parallèle par max_workers processus (voir parallel.run) ;
+# cache, un sharedcache.SharedCache, est partagé par ces processus
+def evaluate_parallel(source, max_workers=None, eoi=None, cache=None):
+    import parallel # multiprocessing n'est chargé que s'il sert
+    return parallel.run(compiler.compile(source, eoi), max_workers=max_workers, cache=cache)
+
 
 #####################################
 ## Test depuis la ligne de commande
 
-def test_manuel():
+def test_manuel(cache=None):
     print("@ Testing the calculator in infix syntax.")
 
-    result = parse()
+    result = parse() if cache is None else cache.parse(sys.stdin)
     print(result)
     if result is None:
         print("@ Input OK ")
@@ -226,5 +167,20 @@ def test_manuel():
         print("@ result = ", repr(result))
     return
 
+def main(argv=None):
+    import sqlitecache # sqlite3 n'est chargé que par la ligne de commande
+    arguments = argparse.ArgumentParser(description="Calculatrice : lit une entrée sur l'entrée standard.")
+    arguments.add_argument('--cache', nargs='?', const=sqlitecache.default_path(), metavar='PATH',
+                           help="garde les résultats des calculs dans la base SQLite PATH, "
+                                "d'une exécution à l'autre (par défaut " + sqlitecache.default_path() + ")")
+    arguments.add_argument('--cache-max-bytes', type=int, default=sqlitecache.MAX_BYTES, metavar='N',
+                           help="taille maximale de la base (par défaut %(default)s octets)")
+    args = arguments.parse_args(argv)
+    if args.cache is None:
+        test_manuel()
+    else:
+        with sqlitecache.SQLiteCache(args.cache, args.cache_max_bytes) as cache:
+            test_manuel(cache)
+
 if __name__ == "__main__":
-    test_manuel()
+    main()
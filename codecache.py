@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Projet TL : cache sur disque des calculs compilés - requires Python version >= 3.10
+
+Le bytecode d'une entrée est rangé dans un fichier dont le nom est l'empreinte (SHA-256)
+de l'entrée, du caractère de fin et des versions de la grammaire et du bytecode :
+une entrée inchangée n'est ni relue par le lexer ni analysée à nouveau.
+
+Plusieurs processus peuvent partager le même répertoire sans verrou : chaque fichier est
+écrit sous un nom temporaire puis renommé (os.replace est atomique), un fichier illisible
+ou disparu entre-temps compte simplement comme absent. Quand la taille totale dépasse
+la limite, les fichiers utilisés le moins récemment (date de modification, mise à jour
+à chaque lecture) sont supprimés.
+"""
+
+import hashlib
+import mmap
+import os
+import sys
+import tempfile
+
+assert sys.version_info >= (3, 10), "Use Python 3.10 or newer !"
+
+import bytecode
+import definitions as defs
+import lexer
+
+SUFFIX = '.tlbc'
+MAX_BYTES = 64 << 20
+
+def default_directory():
+    base = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(base, 'calculatrice-tl')
+
+
+class CodeCache:
+    """
+    Cache de Bytecode dans le répertoire directory, limité à max_bytes octets.
+    hits et misses comptent les compilations évitées et effectuées.
+    """
+    def __init__(self, directory=None, max_bytes=MAX_BYTES):
+        self.directory = directory if directory is not None else default_directory()
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(self.directory, exist_ok=True)
+
+    def key(self, data, eoi=None):
+        """
+        Empreinte de l'entrée data (str ou entrée binaire) pour le caractère de fin eoi.
+        """
+        eoi = eoi if eoi is not None else defs.EOI
+        h = hashlib.sha256('{0}.{1}.{2!r}\0'.format(defs.GRAMMAR_VERSION, bytecode.VERSION, eoi).encode())
+        h.update(data.encode('latin-1', 'replace') if isinstance(data, str) else data)
+        return h.hexdigest()
+
+    def path(self, key):
+        return os.path.join(self.directory, key + SUFFIX)
+
+    def get(self, key):
+        # Renvoie le Bytecode rangé sous key, ou None
+        path = self.path(key)
+        try:
+            with open(path, 'rb') as f:
+                code = bytecode.Bytecode.from_bytes(f.read())
+            os.utime(path)
+            return code
+        except FileNotFoundError:
+            return None
+        except ValueError:
+            # Fichier abîmé (ou d'une autre version) : on le remplacera
+            self.discard(path)
+            return None
+
+    def put(self, key, code):
+        fd, tmp = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(code.to_bytes())
+            os.replace(tmp, self.path(key))
+        except BaseException:
+            self.discard(tmp)
+            raise
+        self.evict()
+
+    def discard(self, path):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+    def entries(self):
+        # Liste des (date de modification, taille, chemin) des fichiers du cache
+        entries = []
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith(SUFFIX):
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime_ns, stat.st_size, entry.path))
+        return entries
+
+    def size(self):
+        return sum(size for _, size, _ in self.entries())
+
+    def evict(self):
+        # Supprime les fichiers les moins récemment utilisés jusqu'à repasser sous max_bytes
+        entries = self.entries()
+        total = sum(size for _, size, _ in entries)
+        if total <= self.max_bytes:
+            return
+        entries.sort()
+        for _, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            self.discard(path)
+            total -= size
+
+    def clear(self):
+        for _, _, path in self.entries():
+            self.discard(path)
+
+    #####
+    # Compilation à travers le cache
+
+    def compile(self, source, eoi=None):
+        """
+        Comme bytecode.compile : le bytecode vient du cache si source y est déjà.
+        """
+        key = self.key(source, eoi)
+        code = self.get(key)
+        if code is not None:
+            self.hits += 1
+            return code
+        self.misses += 1
+        code = bytecode.compile(source, eoi)
+        self.put(key, code)
+        return code
+
+    def compile_file(self, path, eoi=None):
+        """
+        Bytecode du fichier path, lu directement dans sa projection en mémoire.
+        """
+        with open(path, 'rb') as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                return self.compile('', eoi)
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                key = self.key(data, eoi)
+                code = self.get(key)
+                if code is not None:
+                    self.hits += 1
+                    return code
+                self.misses += 1
+                code = bytecode.BytecodeParser(lexer.Lexer(eoi)).parse_bytes(data)
+        self.put(key, code)
+        return code
@@ -0,0 +1,506 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Projet TL : compilation des calculs - requires Python version >= 3.10
+
+Une entrée est analysée une seule fois en arbres (voir engine.TreeActions), puis chaque
+arbre est traduit en fonctions Python imbriquées (des fermetures). Le Program obtenu
+peut être exécuté autant de fois qu'on veut sans repasser par le lexer ni par le moteur.
+
+Sur demande, les arbres sont d'abord optimisés : #i est remplacé par l'arbre du calcul i,
+les sous-arbres identiques ne sont gardés qu'une fois et ceux dont les opérandes sont
+constants sont calculés à la compilation. Comme l'entrée n'a pas de variables, tout calcul
+sans erreur devient une constante ; seuls restent à l'exécution les sous-arbres qui lèvent
+une erreur, pour la lever au même moment qu'avant.
+"""
+
+import math
+import operator
+import struct
+import sys
+
+assert sys.version_info >= (3, 10), "Use Python 3.10 or newer !"
+
+import engine
+import lexer
+from engine import NUM, ADD, SUB, MUL, DIV, POW, FACT, CALC, NEG
+
+
+#####
+# Traduction d'un arbre en fermeture : chaque fermeture reçoit la liste r des
+# résultats déjà calculés et renvoie la valeur de son nœud.
+# Les suites d'un même opérateur (1+2-3+..., -(-(...)), 3!!, 2^3^4...) sont traduites
+# en une seule fermeture qui boucle : la profondeur des fermetures, et donc de la pile
+# de Python à l'exécution, ne dépend que de l'imbrication des parenthèses.
+# Au-delà de MAX_DEPTH fermetures imbriquées, l'arbre est évalué par evaluate_tree, qui
+# n'utilise pas la pile de Python, à la place d'une fermeture.
+
+DOUBLE = struct.Struct('<d')
+
+MAX_DEPTH = 200
+
+OPERATOR = {ADD: operator.add, SUB: operator.sub, MUL: operator.mul, DIV: operator.truediv}
+
+# Nœuds propres aux arbres optimisés
+SLOT = NEG + 1     # (SLOT, j) : sous-arbre partagé numéro j
+MISSING = NEG + 2  # (MISSING, i) : #i qui n'existe pas (encore) : IndexError à l'exécution
+
+def chain(node, codes):
+    """
+    Descend le long des opérandes gauches tant que l'opérateur est dans codes.
+    Renvoie le premier opérande et la liste des (opérateur, opérande droit) dans l'ordre de l'entrée.
+    """
+    rest = []
+    while node[0] in codes:
+        rest.append((node[0], node[2]))
+        node = node[1]
+    rest.reverse()
+    return node, rest
+
+def depth(node):
+    # Profondeur des fermetures que lower_node imbriquerait pour l'arbre node
+    deepest = 0
+    stack = [(node, 1)]
+    while stack:
+        node, level = stack.pop()
+        deepest = max(deepest, level)
+        code = node[0]
+        if code in (NUM, CALC, SLOT, MISSING):
+            continue
+        if code in (NEG, FACT):
+            while node[0] == code:
+                node = node[1]
+            stack.append((node, level + 1))
+        elif code == POW:
+            while node[0] == POW:
+                stack.append((node[1], level + 1))
+                node = node[2]
+            stack.append((node, level + 1))
+        else:
+            first, rest = chain(node, (ADD, SUB) if code in (ADD, SUB) else (MUL, DIV))
+            stack.append((first, level + 1))
+            stack.extend((operand, level + 1) for _, operand in rest)
+    return deepest
+
+def evaluate_tree(tree, r, slots=None):
+    """
+    Valeur de l'arbre tree, comme lower_node(tree, slots)(r), mais avec une pile explicite :
+    les opérandes sont évalués dans le même ordre, les erreurs sont donc les mêmes.
+    """
+    values = []
+    stack = [(tree, False)]
+    while stack:
+        node, ready = stack.pop()
+        code = node[0]
+        if code == NUM:
+            values.append(node[1])
+            continue
+        if code == CALC:
+            values.append(r[node[1] - 1]) # IndexError si le calcul #i n'existe pas (encore)
+            continue
+        if code == SLOT:
+            j = node[1]
+            if r[j] is None:
+                r[j] = slots[j](r)
+            values.append(r[j])
+            continue
+        if code == MISSING:
+            raise IndexError("#" + str(node[1]) + " n'existe pas")
+        if not ready:
+            stack.append((node, True))
+            stack.extend((child, False) for child in reversed(node[1:]))
+            continue
+        if code == NEG:
+            values[-1] = -values[-1]
+        elif code == FACT:
+            values[-1] = math.factorial(int(values[-1]))
+        else:
+            n = values.pop()
+            if code == POW:
+                values[-1] = math.pow(values[-1], n)
+            else:
+                values[-1] = OPERATOR[code](values[-1], n)
+    return values[0]
+
+def lower(node, slots=None):
+    """
+    Renvoie la fermeture qui calcule la valeur de l'arbre node.
+    Dans un arbre optimisé, les fermetures reçoivent à la place de r la liste des valeurs
+    des sous-arbres partagés (None tant qu'ils n'ont pas été calculés) et slots est la liste
+    des fermetures qui les calculent.
+    Un arbre trop imbriqué pour la pile de Python (plus de MAX_DEPTH niveaux de fermetures)
+    est évalué par evaluate_tree, plus lentement mais sans RecursionError.
+    """
+    if depth(node) > MAX_DEPTH:
+        return lambda r: evaluate_tree(node, r, slots)
+    return lower_node(node, slots)
+
+def lower_node(node, slots):
+    # Traduction récursive : une fermeture par nœud, sauf le long des suites d'un même opérateur
+    code = node[0]
+    if code == NUM:
+        value = node[1]
+        return lambda r: value
+    if code == CALC:
+        j = node[1] - 1
+        return lambda r: r[j] # IndexError si le calcul #i n'existe pas (encore), comme pour calc.parse
+    if code == SLOT:
+        j = node[1]
+        def shared(s):
+            n = s[j]
+            if n is None:
+                n = s[j] = slots[j](s)
+            return n
+        return shared
+    if code == MISSING:
+        i = node[1]
+        def missing(s):
+            raise IndexError("#" + str(i) + " n'existe pas")
+        return missing
+    if code == NEG:
+        count = 0
+        while node[0] == NEG:
+            count += 1
+            node = node[1]
+        f = lower_node(node, slots)
+        if count % 2 == 0: # -(-x) == x, en flottant comme en entier
+            return f
+        return lambda r: -f(r)
+    if code == FACT:
+        count = 0
+        while node[0] == FACT:
+            count += 1
+            node = node[1]
+        f = lower_node(node, slots)
+        if count == 1:
+            return lambda r: math.factorial(int(f(r)))
+        def fact_chain(r):
+            n = f(r)
+            for _ in range(count):
+                n = math.factorial(int(n))
+            return n
+        return fact_chain
+    if code == POW:
+        # ^ est associatif à droite : on descend le long des opérandes droits
+        operands = []
+        while node[0] == POW:
+            operands.append(lower_node(node[1], slots))
+            node = node[2]
+        operands.append(lower_node(node, slots))
+        if len(operands) == 2:
+            f_1, f_0 = operands
+            return lambda r: math.pow(f_1(r), f_0(r))
+        def pow_chain(r):
+            values = [f(r) for f in operands]
+            n = values.pop()
+            while values:
+                n = math.pow(values.pop(), n)
+            return n
+        return pow_chain
+    # Opérateur binaire de gauche à droite : + et - , ou * et /
+    codes = (ADD, SUB) if code in (ADD, SUB) else (MUL, DIV)
+    first, rest = chain(node, codes)
+    f_1 = lower_node(first, slots)
+    rest = [(OPERATOR[op], lower_node(operand, slots)) for op, operand in rest]
+    if len(rest) == 1:
+        op, f_0 = rest[0]
+        match op:
+            case operator.add:
+                return lambda r: f_1(r) + f_0(r)
+            case operator.sub:
+                return lambda r: f_1(r) - f_0(r)
+            case operator.mul:
+                return lambda r: f_1(r) * f_0(r)
+            case _:
+                return lambda r: f_1(r) / f_0(r)
+    def binary_chain(r):
+        n = f_1(r)
+        for op, f in rest:
+            n = op(n, f(r))
+        return n
+    return binary_chain
+
+
+class References(dict):
+    """
+    Résultats déjà calculés, indexés à partir de 0, quand on n'en garde qu'une partie :
+    un #i absent est un calcul qui n'existe pas (encore), comme pour calc.parse.
+    """
+    def __missing__(self, j):
+        raise IndexError("#" + str(j + 1) + " n'existe pas")
+
+
+def references(tree):
+    # Indices (à partir de 0) des calculs auxquels l'arbre fait référence
+    refs = set()
+    stack = [tree]
+    while stack:
+        node = stack.pop()
+        if node[0] == CALC:
+            refs.add(node[1] - 1)
+        elif node[0] != NUM:
+            stack.extend(node[1:])
+    return refs
+
+
+#####
+# Optimisation : calcul des constantes et partage des sous-arbres identiques
+
+def fold(code, values):
+    """
+    Valeur du nœud code sur des opérandes constants, calculée exactement comme à l'exécution.
+    Lève l'erreur de ce calcul le cas échéant.
+    """
+    if code == NEG:
+        return -values[0]
+    if code == FACT:
+        return math.factorial(int(values[0]))
+    if code == POW:
+        return math.pow(*values)
+    return OPERATOR[code](*values)
+
+def constant_key(value):
+    # 1 == 1.0 et 0.0 == -0.0 : la clé d'une constante garde son type et tous ses bits
+    # (float.hex ne distingue pas nan de -nan)
+    if type(value) is float:
+        return (NUM, DOUBLE.pack(value))
+    return (NUM, type(value), value)
+
+class Interner:
+    """
+    Table des nœuds uniques : chaque nœud est un tuple (code, ...) dont les opérandes sont
+    les numéros d'autres nœuds, toujours plus petits que le sien. Un nœud dont tous les
+    opérandes sont constants est remplacé par sa valeur, sauf si le calcul lève une erreur :
+    le nœud est alors gardé et l'erreur sera levée à l'exécution, au même moment qu'avant.
+    """
+    def __init__(self):
+        self.nodes = []
+        self.index = {}
+        self.roots = [] # numéro du nœud de chaque calcul
+
+    def node(self, key, node):
+        k = self.index.get(key)
+        if k is None:
+            k = self.index[key] = len(self.nodes)
+            self.nodes.append(node)
+        return k
+
+    def constant(self, value):
+        return self.node(constant_key(value), (NUM, value))
+
+    def operation(self, code, args):
+        node = (code,) + tuple(args)
+        k = self.index.get(node)
+        if k is not None: # déjà vu : déjà calculé s'il est constant
+            return k
+        nodes = self.nodes
+        if all(nodes[a][0] == NUM for a in args):
+            try:
+                k = self.constant(fold(code, [nodes[a][1] for a in args]))
+                self.index[node] = k
+                return k
+            except (ArithmeticError, ValueError):
+                pass
+        return self.node(node, node)
+
+    def calc(self, i):
+        # #i est le nœud du calcul i, s'il existe déjà
+        if i <= len(self.roots):
+            return self.roots[i - 1]
+        return self.node((MISSING, i), (MISSING, i))
+
+    def add_tree(self, tree):
+        """
+        Range les nœuds de l'arbre d'un calcul (parcours postfixe, sans récursion).
+        """
+        stack = [(tree, False)]
+        done = []
+        while stack:
+            node, visited = stack.pop()
+            code = node[0]
+            if code == NUM:
+                done.append(self.constant(node[1]))
+            elif code == CALC:
+                done.append(self.calc(node[1]))
+            elif visited:
+                n = len(node) - 1
+                args = done[-n:]
+                del done[-n:]
+                done.append(self.operation(code, args))
+            else:
+                stack.append((node, True))
+                stack.extend((child, False) for child in reversed(node[1:]))
+        self.roots.append(done[0])
+
+
+def optimize_trees(trees):
+    """
+    Optimise les arbres des calculs. Renvoie (racines, partagés) : l'arbre de chaque calcul
+    et l'arbre de chaque sous-arbre partagé, où (SLOT, j) désigne le partagé numéro j.
+    Un nœud est partagé s'il est utilisé plusieurs fois ou si c'est le résultat d'un calcul.
+    """
+    interner = Interner()
+    for tree in trees:
+        interner.add_tree(tree)
+    nodes = interner.nodes
+    uses = [0] * len(nodes)
+    for node in nodes:
+        if node[0] not in (NUM, MISSING):
+            for k in node[1:]:
+                uses[k] += 1
+    for k in interner.roots:
+        uses[k] += 2
+    slot = {}
+    for k, node in enumerate(nodes):
+        if uses[k] > 1 and node[0] not in (NUM, MISSING):
+            slot[k] = len(slot)
+    # Arbre de chaque nœud, où les nœuds partagés sont remplacés par (SLOT, j)
+    expanded = [None] * len(nodes)
+    refs = [None] * len(nodes)
+    for k, node in enumerate(nodes):
+        if node[0] in (NUM, MISSING):
+            expanded[k] = node
+        else:
+            expanded[k] = (node[0],) + tuple(refs[a] for a in node[1:])
+        refs[k] = (SLOT, slot[k]) if k in slot else expanded[k]
+    return [refs[k] for k in interner.roots], [expanded[k] for k in slot]
+
+
+#####
+# Le programme compilé
+
+class Program:
+    """
+    Suite de calculs compilés. run() renvoie la liste de leurs valeurs,
+    exactement comme calc.parse sur l'entrée d'origine.
+    Avec optimize, les arbres passent d'abord par optimize_trees.
+    """
+    def __init__(self, trees, optimize=False):
+        self.trees = trees
+        self.graph = None # graphe des #i, calculé à la demande
+        self.optimized = optimize
+        if optimize:
+            self.roots, self.shared = optimize_trees(trees)
+            self.slots = []
+            self.slots.extend(lower(tree, self.slots) for tree in self.shared)
+            self.functions = [lower(tree, self.slots) for tree in self.roots]
+        else:
+            self.functions = [lower(tree) for tree in trees]
+
+    def __len__(self):
+        return len(self.functions)
+
+    def dependencies(self):
+        """
+        Graphe des #i : pour chaque calcul, le tuple trié des indices (à partir de 0)
+        des calculs auxquels il fait référence.
+        """
+        if self.graph is None:
+            self.graph = [tuple(sorted(references(tree))) for tree in self.trees]
+        return self.graph
+
+    def last_uses(self):
+        """
+        Analyse de durée de vie des résultats : pour chaque calcul, l'indice (à partir de 0)
+        du dernier calcul qui y fait référence, ou -1 si aucun calcul suivant n'en a besoin.
+        """
+        last = [-1] * len(self.trees)
+        for k, refs in enumerate(self.dependencies()):
+            for j in refs:
+                if j < k:
+                    last[j] = k # les calculs sont parcourus dans l'ordre : le dernier gagne
+        return last
+
+    def iter_run(self):
+        """
+        Renvoie un itérateur sur les valeurs des calculs, dans l'ordre, comme run().
+        Un résultat n'est gardé que jusqu'au dernier calcul qui y fait référence
+        (voir last_uses) : la mémoire occupée ne dépend que des résultats encore utiles,
+        pas de la longueur de l'entrée.
+        """
+        if self.optimized:
+            # Plus de #i dans les arbres optimisés
+            s = [None] * len(self.slots)
+            for f in self.functions:
+                yield f(s)
+            return
+        last = self.last_uses()
+        # Calculs qui ne servent plus après chaque calcul
+        dead = {}
+        for j, k in enumerate(last):
+            if k >= 0:
+                dead.setdefault(k, []).append(j)
+        live = References()
+        for k, f in enumerate(self.functions):
+            value = f(live)
+            for j in dead.pop(k, ()):
+                del live[j]
+            if last[k] >= 0:
+                live[k] = value
+            yield value
+
+    def needed(self, wanted):
+        # Indices des calculs wanted (numérotés comme #i) et de tout ce dont ils dépendent
+        graph = self.dependencies()
+        stack = []
+        for i in wanted:
+            if not 1 <= i <= len(graph):
+                raise IndexError("#" + str(i) + " n'existe pas")
+            stack.append(i - 1)
+        needed = set()
+        while stack:
+            k = stack.pop()
+            if k not in needed:
+                needed.add(k)
+                stack.extend(j for j in graph[k] if j < k)
+        return sorted(needed)
+
+    def evaluate(self, wanted):
+        """
+        Renvoie le dictionnaire {i: valeur de #i} pour les numéros i de wanted (à partir de 1),
+        en ne calculant que ces calculs et ceux dont ils dépendent, dans l'ordre de l'entrée.
+        Les autres calculs ne sont pas évalués : leurs erreurs éventuelles ne sont pas levées.
+        """
+        wanted = list(wanted)
+        needed = self.needed(wanted)
+        functions = self.functions
+        if self.optimized:
+            # Les sous-arbres partagés sont déjà calculés à la demande
+            s = [None] * len(self.slots)
+            values = {k: functions[k](s) for k in needed}
+            return {i: values[i - 1] for i in wanted}
+        graph = self.graph
+        r = [None] * len(functions)
+        for k in needed:
+            if graph[k] and graph[k][-1] >= k:
+                # #i qui n'existe pas encore : comme pour run, r ne contient que les calculs précédents
+                r[k] = functions[k](r[:k])
+            else:
+                r[k] = functions[k](r)
+        return {i: r[i - 1] for i in wanted}
+
+    def run(self):
+        if self.optimized:
+            s = [None] * len(self.slots)
+            return [f(s) for f in self.functions]
+        r = []
+        append = r.append
+        for f in self.functions:
+            append(f(r))
+        return r
+
+
+def parse_trees(source, eoi=None):
+    """
+    Analyse une entrée complète (jusqu'au premier EOI ou jusqu'à la fin du texte)
+    et renvoie la liste des arbres de ses calculs.
+    """
+    parser = engine.Parser(lexer.Lexer(eoi))
+    parser.actions = engine.TreeActions
+    return parser.parse_tokens(parser.lexer.tokenize_all(source))
+
+def compile(source, eoi=None, optimize=False):
+    return Program(parse_trees(source, eoi), optimize)
+
+def evaluate_selected(source, wanted, eoi=None):
+    return Program(parse_trees(source, eoi)).evaluate(wanted)
@@ -11,6 +11,8 @@ assert sys.version_info >= (3, 10), "Use Python 3.10 or newer !"
 
 INPUT_STREAM = sys.stdin # où lire les caractères d'entrée
 
+GRAMMAR_VERSION = 1 # à incrémenter à chaque changement de la grammaire ou de sa sémantique
+
 
 #######################################
 # Definition des caractères d'entrées
@@ -0,0 +1,501 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Projet TL : moteur d'analyse commun aux calculatrices - requires Python version >= 3.10
+
+Le moteur est un analyseur par précédence d'opérateurs : une machine à états avec deux piles
+explicites (opérandes et opérateurs), dirigée par une table de priorités. Il peut s'interrompre
+entre deux tokens quelconques et reprendre plus tard, sans rien garder sur la pile d'appels de Python.
+Ce qu'il fait des opérandes et des opérateurs est délégué à des actions sémantiques :
+reconnaissance seule (parser.py), évaluation (calc.py), évaluation avec rattrapage des erreurs
+(rattrapage.py) ou construction d'arbres.
+"""
+
+import math
+import operator
+import sys
+
+assert sys.version_info >= (3, 10), "Use Python 3.10 or newer !"
+
+import lexer
+from definitions import V_T, str_attr_token
+from history import History
+
+
+class ParserError(Exception):
+    pass
+
+
+#####
+# Codes des tokens et des opérateurs
+
+# Le moteur travaille sur la valeur entière des tokens : les comparaisons d'entiers
+# sont bien plus rapides que celles des membres de V_T
+NUM, ADD, SUB, MUL, DIV, POW, FACT, OPAR, CPAR, CALC, SEQ, END = (t.value for t in V_T)
+# Le moins unaire n'est pas un token : il a son propre code
+NEG = len(V_T)
+
+BINARY = frozenset((ADD, SUB, MUL, DIV))
+FIRST = frozenset((SUB, OPAR, NUM, CALC, END)) # tokens qui peuvent commencer l'entrée
+
+# Priorité de chaque opérateur : le moins unaire porte sur exp3 (donc sur ^ et !),
+# la factorielle (35) sur exp1 (donc sur ^), ^ est associatif à droite
+PRIORITY = [0] * (NEG + 1)
+PRIORITY[ADD] = PRIORITY[SUB] = 10
+PRIORITY[MUL] = PRIORITY[DIV] = 20
+PRIORITY[NEG] = 30
+PRIORITY[POW] = 40
+FACT_PRIORITY = 35
+
+# États du moteur
+START = 0              # début d'un calcul (ou fin de l'entrée)
+OPERAND = 1            # on attend un opérande
+OPERAND_AFTER_POW = 2  # on attend un exp0, sans moins unaire
+OPERATOR = 3           # on attend un opérateur, ')' ou ';'
+OPERATOR_AFTER_FACT = 4  # comme OPERATOR, mais '^' est interdit
+FINISHED = 5           # END lu
+
+EXPECTED = {
+    START: "SUB, OPAR, NUM, CALC or END",
+    OPERAND: "SUB, OPAR, NUM or CALC",
+    OPERAND_AFTER_POW: "OPAR, NUM or CALC",
+    OPERATOR: "POW, FACT, MUL, DIV, ADD, SUB, CPAR or SEQ",
+    OPERATOR_AFTER_FACT: "FACT, MUL, DIV, ADD, SUB, CPAR or SEQ",
+    FINISHED: "nothing after END",
+}
+
+
+#####
+# Actions sémantiques : binary[op](n_1, n_0) applique l'opérateur binaire de code op,
+# neg, fact, num et calc construisent les autres opérandes,
+# store(n) reçoit le résultat de chaque calcul terminé et output() donne ce que renvoie parse
+
+def _nothing(*args):
+    return None
+
+class Actions:
+    """
+    Reconnaissance seule : aucun opérande n'a de valeur et parse renvoie None.
+    """
+    recover = False # si vrai, un calcul erroné est ignoré au lieu d'arrêter l'analyse
+    binary = [_nothing] * (NEG + 1)
+    neg = fact = num = calc = store = staticmethod(_nothing)
+
+    def __init__(self):
+        self.results = None
+
+    def output(self):
+        return self.results
+
+
+def _factorial(n):
+    return math.factorial(int(n))
+
+def _identity(n):
+    return n
+
+class EvaluateActions(Actions):
+    """
+    Évaluation : les résultats des calculs sont rangés dans un History
+    (ou dans results, par exemple un history.PagedHistory).
+    """
+    binary = [None] * (NEG + 1)
+    binary[ADD] = operator.add
+    binary[SUB] = operator.sub
+    binary[MUL] = operator.mul
+    binary[DIV] = operator.truediv
+    binary[POW] = math.pow
+    neg = staticmethod(operator.neg)
+    fact = staticmethod(_factorial)
+    num = staticmethod(_identity)
+
+    def __init__(self, results=None):
+        self.results = results if results is not None else History()
+        self.store = self.results.append
+
+    def calc(self, i):
+        # Valeur de #i
+        if not i:
+            raise ParserError("Erreur dans parse_exp0: i n'a pas de valeur")
+        return self.results[i-1]
+
+    def output(self):
+        return self.results.tolist()
+
+
+class RecoverActions(EvaluateActions):
+    """
+    Évaluation avec rattrapage : un calcul erroné est signalé puis ignoré,
+    y compris s'il fait référence à un calcul qui n'existe pas.
+    """
+    recover = True
+
+    def calc(self, i):
+        if not i:
+            raise ParserError("Erreur dans parse_exp0: i n'a pas de valeur")
+        if i > len(self.results) or i <= 0:
+            raise ParserError("Erreur dans parse_exp0: #"+str(i)+" n'existe pas")
+        return self.results[i-1]
+
+
+def _node(op):
+    return lambda n_1, n_0: (op, n_1, n_0)
+
+class TreeActions(Actions):
+    """
+    Construction d'arbres : un nœud est un tuple dont le premier élément est un code,
+    (NUM, valeur), (CALC, i), (NEG, n), (FACT, n) ou (op, n_1, n_0) pour un opérateur binaire.
+    Les arbres des calculs sont rangés dans une liste.
+    """
+    binary = [None] * (NEG + 1)
+    for op in (ADD, SUB, MUL, DIV, POW):
+        binary[op] = _node(op)
+    del op
+
+    def __init__(self):
+        self.results = []
+        self.store = self.results.append
+
+    @staticmethod
+    def num(value):
+        return (NUM, value)
+
+    @staticmethod
+    def neg(n):
+        return (NEG, n)
+
+    @staticmethod
+    def fact(n):
+        return (FACT, n)
+
+    @staticmethod
+    def calc(i):
+        if not i:
+            raise ParserError("Erreur dans parse_exp0: i n'a pas de valeur")
+        return (CALC, i)
+
+
+#####
+# Le moteur
+
+class Engine:
+    """
+    Reçoit les tokens un par un avec feed (ou feed_code, avec la valeur entière du token)
+    et applique les actions sémantiques.
+    """
+    def __init__(self, actions):
+        self.actions = actions
+        self.reset()
+
+    def reset(self):
+        # Abandonne le calcul en cours
+        self.state = START
+        self.operands = []
+        self.operators = []
+
+    def finished(self):
+        return self.state == FINISHED
+
+    def unexpected_token(self, k, value, expected=None):
+        expected = expected or EXPECTED[self.state]
+        return ParserError("Found token '" + str_attr_token(V_T(k), value) + "' but expected " + expected)
+
+    def reduce(self):
+        # Applique l'opérateur en haut de la pile
+        op = self.operators.pop()
+        operands = self.operands
+        if op == NEG:
+            operands[-1] = self.actions.neg(operands[-1])
+        else:
+            n_0 = operands.pop()
+            operands[-1] = self.actions.binary[op](operands[-1], n_0)
+
+    def feed(self, tok, value=None):
+        """
+        Donne le token suivant (et son attribut) au moteur.
+        Renvoie le résultat du calcul qu'il termine si tok est SEQ, None sinon.
+        """
+        return self.feed_code(tok._value_, value)
+
+    def feed_code(self, k, value=None):
+        state = self.state
+        operators = self.operators
+        if state <= OPERAND_AFTER_POW:
+            if k == NUM:
+                self.operands.append(self.actions.num(value))
+                self.state = OPERATOR
+            elif k == CALC:
+                self.operands.append(self.actions.calc(value))
+                self.state = OPERATOR
+            elif k == OPAR:
+                operators.append(OPAR)
+                self.state = OPERAND
+            elif k == SUB and state != OPERAND_AFTER_POW:
+                operators.append(NEG)
+                self.state = OPERAND
+            elif k == END and state == START:
+                self.state = FINISHED
+            else:
+                raise self.unexpected_token(k, value)
+            return None
+        if state == FINISHED:
+            raise self.unexpected_token(k, value)
+        if k in BINARY:
+            priority = PRIORITY[k]
+            while operators and PRIORITY[operators[-1]] >= priority:
+                self.reduce()
+            operators.append(k)
+            self.state = OPERAND
+        elif k == POW and state == OPERATOR:
+            operators.append(POW)
+            self.state = OPERAND_AFTER_POW
+        elif k == FACT:
+            while operators and PRIORITY[operators[-1]] > FACT_PRIORITY:
+                self.reduce()
+            self.operands[-1] = self.actions.fact(self.operands[-1])
+            self.state = OPERATOR_AFTER_FACT
+        elif k == CPAR:
+            while operators and operators[-1] != OPAR:
+                self.reduce()
+            if not operators:
+                raise self.unexpected_token(k, value, "an operator or SEQ")
+            operators.pop()
+            self.state = OPERATOR
+        elif k == SEQ:
+            while operators and operators[-1] != OPAR:
+                self.reduce()
+            if operators:
+                raise self.unexpected_token(k, value, "an operator or CPAR")
+            n = self.operands.pop()
+            self.actions.store(n)
+            self.state = START
+            return n
+        else:
+            raise self.unexpected_token(k, value)
+        return None
+
+
+class Evaluator(Engine):
+    """
+    Le moteur avec les actions d'évaluation : même sémantique que calc.parse,
+    les résultats sont rangés dans results (un History, sauf si on en donne un autre).
+    """
+    def __init__(self, results=None):
+        super().__init__(EvaluateActions(results))
+        self.results = self.actions.results
+
+    def restart(self, results=None):
+        # Prêt pour une nouvelle entrée, avec un nouvel historique
+        self.reset()
+        self.actions.__init__(results)
+        self.results = self.actions.results
+
+    def evaluate_tokens(self, tokens):
+        """
+        Donne au moteur les tokens d'une lexer.TokenStream jusqu'au END
+        et renvoie la liste des valeurs des calculs, comme calc.parse.
+        """
+        kinds, nums, ints = tokens.kinds, tokens.nums, tokens.ints
+        feed = self.feed_code
+        for t, kind in enumerate(kinds):
+            if kind == NUM:
+                feed(kind, nums[t])
+            elif kind == CALC:
+                feed(kind, ints[t])
+            else:
+                if kind == END and tokens.error is not None:
+                    raise tokens.error
+                feed(kind)
+                if kind == END:
+                    break
+        return self.results.tolist()
+
+
+#####
+# L'analyseur : lit les tokens d'une source et les donne au moteur.
+# Chaque instance a son propre lexer et son propre état,
+# plusieurs analyses peuvent donc avoir lieu en même temps
+
+class Parser:
+    actions = Actions # classe des actions sémantiques, choisie par chaque calculatrice
+
+    def __init__(self, lex=None):
+        self.lexer = lex if lex is not None else lexer.Lexer()
+        self.current_token = V_T.END
+        self.value = None  # attribut du token renvoyé par le lexer
+        self.next_token = self.lexer.next_token  # source des tokens : le lexer ou un curseur sur une TokenStream
+
+    #####
+    # Fonctions génériques
+
+    def unexpected_token(self, expected):
+        return ParserError("Found token '" + str_attr_token(self.current_token, self.value) + "' but expected " + expected)
+
+    def get_current(self):
+        return self.current_token
+
+    def get_value(self):
+        return self.value
+
+    def init_parser(self, stream):
+        self.lexer.reinit(stream)
+        self.next_token = self.lexer.next_token
+        self.current_token, self.value = self.next_token()
+
+    def init_parser_tokens(self, tokens):
+        # Comme init_parser, mais sur une TokenStream déjà produite par lexer.tokenize_all
+        self.next_token = tokens.cursor().next_token
+        self.current_token, self.value = self.next_token()
+
+    def init_parser_bytes(self, lex):
+        # Comme init_parser, mais sur une entrée binaire lue par un lexer.BytesLexer
+        self.next_token = lex.next_token
+        self.current_token, self.value = self.next_token()
+
+    def consume_token(self, tok):
+        # Vérifie que le prochain token est tok ;
+        # si oui, le consomme et renvoie son attribut ; si non, lève une exception
+        if self.current_token != tok:
+            raise self.unexpected_token(tok.name)
+        if self.current_token != V_T.END:
+            old = self.value
+            self.current_token, self.value = self.next_token()
+            return old
+
+    #########################
+    ## Rattrapage des erreurs
+
+    def rattrapage(self, suiv):
+        """
+        Consomme les tokens jusqu'à trouver un token présent dans la liste 'suiv'
+        ou la fin du flux (END).
+        """
+        tok = self.get_current()
+        while tok not in suiv and tok != V_T.END:
+            self.consume_token(tok)
+            tok = self.get_current()
+        return
+
+    def recover(self, engine):
+        # Signale le calcul erroné, l'abandonne et repart après son ';'
+        print("Le calcul à l'emplacement #"+ str(len(engine.actions.results)+1) +" contient une erreur, il a été ignoré")
+        engine.reset()
+        self.rattrapage([V_T.SEQ, V_T.END])
+        if self.current_token == V_T.SEQ:
+            self.consume_token(V_T.SEQ)
+
+    #########################
+    ## Analyse de input
+
+    def evaluate_input(self):
+        """
+        Donne au moteur les tokens jusqu'au END (qui reste le token courant)
+        et renvoie les actions sémantiques utilisées.
+        """
+        actions = self.actions()
+        engine = Engine(actions)
+        feed = engine.feed_code
+        next_token = self.next_token
+        tok, value = self.current_token, self.value
+        first = True
+        try:
+            while True:
+                try:
+                    feed(tok._value_, value)
+                except ParserError:
+                    # une entrée qui ne commence pas par un token de FIRST n'est jamais rattrapée
+                    if not actions.recover or (first and tok._value_ not in FIRST):
+                        raise
+                    self.current_token, self.value = tok, value
+                    self.recover(engine)
+                    tok, value = self.current_token, self.value
+                    first = False # le calcul suivant n'est plus le début de l'entrée
+                    continue
+                if engine.state == FINISHED:
+                    break
+                first = False
+                tok, value = next_token()
+        finally:
+            self.current_token, self.value = tok, value
+        return actions
+
+    def parse_input(self):
+        return self.evaluate_input().output()
+
+    #####################################
+    ## Fonction principale de la calculatrice
+    ## Appelle l'analyseur grammatical et retourne
+    ## - None sans les attributs
+    ## - la liste des valeurs des calculs avec les attributs
+
+    def parse(self, stream=sys.stdin):
+        self.init_parser(stream)
+        l = self.parse_input()
+        self.consume_token(V_T.END)
+        return l
+
+    # Même chose sur une TokenStream (voir lexer.tokenize_all)
+    def parse_tokens(self, tokens):
+        self.init_parser_tokens(tokens)
+        l = self.parse_input()
+        self.consume_token(V_T.END)
+        return l
+
+    # Même chose sur une entrée binaire (bytes, bytearray, memoryview, mmap)
+    def parse_bytes(self, data):
+        lex = lexer.BytesLexer(data, self.lexer.eoi_choice)
+        try:
+            self.init_parser_bytes(lex)
+            l = self.parse_input()
+            self.consume_token(V_T.END)
+            return l
+        finally:
+            lex.release()
+
+    # Même chose sur un fichier, lu directement dans sa projection en mémoire (voir lexer.MappedInput)
+    def parse_file(self, path):
+        with lexer.MappedInput(path) as mapped:
+            return self.parse_bytes(mapped.data)
+
+
+#####
+# Évaluation d'une entrée reçue par morceaux
+
+class ChunkEvaluator:
+    """
+    Lexer incrémental et évaluateur réunis : feed(chunk) renvoie la liste des valeurs
+    des calculs terminés par ce morceau, close() signale la fin de l'entrée.
+    """
+    def __init__(self, eoi=None):
+        self.lexer = lexer.PushLexer(eoi)
+        self.evaluator = Evaluator()
+        self.results = self.evaluator.results
+
+    def feed_tokens(self, tokens):
+        values = []
+        for tok, value in tokens:
+            n = self.evaluator.feed(tok, value)
+            if n is not None:
+                values.append(n)
+        return values
+
+    def feed(self, chunk):
+        return self.feed_tokens(self.lexer.feed(chunk))
+
+    def close(self):
+        return self.feed_tokens(self.lexer.close())
+
+
+async def aiter_results(reader, eoi=None, size=1 << 16):
+    """
+    Générateur asynchrone des valeurs des calculs lus sur un asyncio.StreamReader :
+    chaque valeur est produite dès que le ';' de son calcul est reçu.
+    """
+    evaluator = ChunkEvaluator(eoi)
+    while not evaluator.evaluator.finished():
+        chunk = await reader.read(size)
+        values = evaluator.feed(chunk.decode('latin-1')) if chunk else evaluator.close()
+        for n in values:
+            yield n
+        if not chunk:
+            break
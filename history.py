@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Projet TL : historique des résultats des calculs
+"""
+
+import mmap
+import struct
+import tempfile
+from array import array
+
+# Taille par défaut de la fenêtre d'un PagedHistory
+WINDOW = 1 << 16
+
+
+class History:
+    """
+    Résultats des calculs dans l'ordre : ajout en O(1) amorti et accès à #i en O(1).
+    Les flottants sont rangés dans un array('d') ; les autres valeurs (par exemple les
+    grands entiers produits par !) sont gardées telles quelles dans un dictionnaire à part,
+    indexé par leur position.
+    """
+    def __init__(self, values=()):
+        self.floats = array('d')
+        self.exact = {}
+        for n in values:
+            self.append(n)
+
+    def append(self, n):
+        if type(n) is not float:
+            self.exact[len(self.floats)] = n
+            n = 0.0
+        self.floats.append(n)
+
+    def __len__(self):
+        return len(self.floats)
+
+    def __getitem__(self, i):
+        n = self.floats[i] # lève IndexError si i n'existe pas
+        if self.exact:
+            if i < 0:
+                i += len(self.floats)
+            return self.exact.get(i, n)
+        return n
+
+    def __iter__(self):
+        exact = self.exact
+        for i, n in enumerate(self.floats):
+            yield exact.get(i, n) if exact else n
+
+    def tolist(self):
+        return list(self)
+
+    def __repr__(self):
+        return 'History(' + repr(self.tolist()) + ')'
+
+
+# Un enregistrement par résultat sorti de la fenêtre : le flottant, ou la position de la
+# valeur exacte dans le fichier annexe (-1 pour un flottant)
+RECORD = struct.Struct('<dq')
+LENGTH = struct.Struct('<Q')
+
+class PagedHistory:
+    """
+    Comme History, mais seuls les derniers résultats (entre window et 2 * window) restent
+    en mémoire : les plus anciens sont écrits dans un fichier temporaire, relu par projection
+    en mémoire (mmap) quand un #i y fait référence. Les grands entiers y sont rangés en
+    binaire (int.to_bytes) dans un second fichier. La mémoire occupée ne dépend pas du
+    nombre de calculs. close() supprime les fichiers.
+    """
+    def __init__(self, window=WINDOW, directory=None):
+        if window < 1:
+            raise ValueError("window must be positive")
+        self.window = window
+        self.start = 0 # numéro du premier résultat de la fenêtre
+        self.recent = History()
+        self.records = tempfile.TemporaryFile(dir=directory)
+        self.values = tempfile.TemporaryFile(dir=directory)
+        self.values_size = 0
+        self.maps = [None, None] # projections de records et de values, refaites quand ils grandissent
+
+    def append(self, n):
+        self.recent.append(n)
+        if len(self.recent) >= 2 * self.window:
+            self.spill(len(self.recent) - self.window)
+
+    def spill(self, count):
+        # Écrit les count plus anciens résultats de la fenêtre sur disque
+        recent = self.recent
+        block = bytearray(count * RECORD.size)
+        exact = recent.exact
+        for k in range(count):
+            n = recent.floats[k]
+            position = -1
+            if k in exact:
+                position = self.write_exact(exact[k])
+            RECORD.pack_into(block, k * RECORD.size, n, position)
+        self.records.write(block)
+        self.recent = History(recent[k] for k in range(count, len(recent)))
+        self.start += count
+
+    def write_exact(self, n):
+        data = n.to_bytes((n.bit_length() + 8) // 8, 'little', signed=True)
+        self.values.write(LENGTH.pack(len(data)) + data)
+        position = self.values_size
+        self.values_size += LENGTH.size + len(data)
+        return position
+
+    def mapped(self, which, end):
+        # Projection du fichier which (0 : records, 1 : values) couvrant au moins end octets
+        m = self.maps[which]
+        if m is None or len(m) < end:
+            f = (self.records, self.values)[which]
+            f.flush()
+            if m is not None:
+                m.close()
+            m = self.maps[which] = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        return m
+
+    def __len__(self):
+        return self.start + len(self.recent)
+
+    def __getitem__(self, i):
+        if i < 0:
+            i += len(self)
+        if i >= self.start:
+            return self.recent[i - self.start] # lève IndexError si i n'existe pas
+        if i < 0:
+            raise IndexError("history index out of range")
+        offset = i * RECORD.size
+        n, position = RECORD.unpack_from(self.mapped(0, offset + RECORD.size), offset)
+        if position < 0:
+            return n
+        values = self.mapped(1, position + LENGTH.size)
+        size, = LENGTH.unpack_from(values, position)
+        position += LENGTH.size
+        values = self.mapped(1, position + size)
+        return int.from_bytes(values[position:position + size], 'little', signed=True)
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    def tolist(self):
+        return list(self)
+
+    def close(self):
+        for m in self.maps:
+            if m is not None:
+                m.close()
+        self.maps = [None, None]
+        self.records.close()
+        self.values.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __repr__(self):
+        return 'PagedHistory(' + str(len(self)) + ' results, window=' + str(self.window) + ')'
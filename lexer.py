@@ -6,6 +6,8 @@ Projet TL : lexer de la calculatrice
 
 import sys
 import enum
+import mmap
+from array import array
 import definitions as defs
 
 
@@ -17,77 +19,8 @@ class LexerError(Exception):
 #################################
 # Variables et fonctions internes (privées)
 
-# Variables privées : les trois prochains caractères de l'entrée
-current_char1 = ''
-current_char2 = ''
-current_char3 = ''
-
-# Initialisation : on vérifie que EOI n'est pas dans V_C et on initialise les prochains caractères
-def init_char():
-    global current_char1, current_char2, current_char3
-    # Vérification de cohérence : EOI n'est pas dans V_C ni dans SEP
-    if defs.EOI in defs.V_C:
-        raise LexerError('character ' + repr(defs.EOI) + ' in V_C')
-    defs.SEP = {' ', '\n', '\t'} - set(defs.EOI)
-    defs.V = set(tuple(defs.V_C) + (defs.EOI,) + tuple(defs.SEP))
-    current_char1 = defs.INPUT_STREAM.read(1)
-    # print("@", repr(current_char1))  # decomment this line may help debugging
-    if current_char1 not in defs.V:
-        raise LexerError('Character ' + repr(current_char1) + ' unsupported')
-    if current_char1 == defs.EOI:
-        current_char2 = defs.EOI
-        current_char3 = defs.EOI
-    else:
-        current_char2 = defs.INPUT_STREAM.read(1)
-        # print("@", repr(current_char2))  # decomment this line may help debugging
-        if current_char2 not in defs.V:
-            raise LexerError('Character ' + repr(current_char2) + ' unsupported')
-        if current_char2 == defs.EOI:
-            current_char3 = defs.EOI
-        else:
-            current_char3 = defs.INPUT_STREAM.read(1)
-            # print("@", repr(current_char3))  # decomment this line may help debugging
-            if current_char3 not in defs.V:
-                raise LexerError('Character ' + repr(current_char3) + ' unsupported')
-
-    return
-
-# Accès aux caractères de prévision
-def peek_char3():
-    global current_char1, current_char2, current_char3
-    return (current_char1 + current_char2 + current_char3)
-
-
-def peek_char1():
-    """
-    Renvoie le prochain caractère de l'entrée
-    """
-    global current_char1
-    return current_char1
-
-
-def consume_char():
-    """
-    Permet d’avancer d’un caractère et ne renvoie rien (None).
-    Une fois que la lecture est terminée, faire un appel à la fonction
-    renverra toujours EOI.
-    """
-    global current_char1, current_char2, current_char3
-    if current_char2 == defs.EOI: # pour ne pas lire au delà du dernier caractère
-        current_char1 = defs.EOI
-        return
-    if current_char3 == defs.EOI: # pour ne pas lire au delà du dernier caractère
-        current_char1 = current_char2
-        current_char2 = defs.EOI
-        return
-    next_char = defs.INPUT_STREAM.read(1)
-    # print("@", repr(next_char))  # decommenting this line may help debugging
-    if next_char in defs.V:
-        current_char1 = current_char2
-        current_char2 = current_char3
-        current_char3 = next_char
-        return
-    raise LexerError('Character ' + repr(next_char) + ' unsupported')
+# Taille des blocs lus sur l'entrée (un appel à read par bloc et non par caractère)
+BLOCK_SIZE = 1 << 16
 
 def expected_digit_error(char):
     return LexerError('Expected a digit, but found ' + repr(char))
@@ -95,56 +28,10 @@ def expected_digit_error(char):
 def unknown_token_error(char):
     return LexerError('Unknown start of token ' + repr(char))
 
-# Initialisation de l'entrée
-def reinit(stream=sys.stdin):
-    global input_stream, current_char1, current_char2, current_char3
-    assert stream.readable()
-    defs.INPUT_STREAM = stream
-    current_char1 = ''
-    current_char2 = ''
-    current_char3 = ''
-    init_char()
-
 
 #################################
 ## Automates pour les entiers et les flottants
 
-def read_full_word(initial, automate, acceptant):
-    """
-    Lit le mot courant en entier (du premier caractère au caractère EOI).
-    À la fin de l'exécution, l'entrée entière sera consommée
-    """
-    current_state = initial
-    char = peek_char1()
-    consume_char()
-    # Cas de base : uniquement le EOI (dans ce cas ce n'est pas reconnu, le mot vide n'étant pas reconnu)
-    if (char == defs.EOI):
-        return False
-
-    while (char != defs.EOI):
-        adjacent_node = automate[current_state]
-        transition = False
-        # Vérifie s'il est possible de faire une transition
-        for sommet, f in adjacent_node:
-            if (f(char)):
-                current_state = sommet
-                transition = True
-                break
-        # Si on n'a pas réussi à faire une transition alors le mot n'est pas reconnu, on renvoie False
-        # On consomme tous les caractères mais sans faire toutes les autres vérifications
-        if (not transition):
-            consume_char()
-            while (peek_char1() != defs.EOI):
-                consume_char()
-            return False
-        char = peek_char1()
-        consume_char()
-
-    # On vérifie que le mot se termine sur l'état acceptant
-    if not (current_state in acceptant):
-        return False
-    return True
-
 '''
 Ancienne version avec un peak de 1 uniquement
 def read_word(initial, automate, acceptant):
@@ -192,57 +79,6 @@ def read_word(initial, automate, acceptant):
     return full_word
 '''
 
-def read_word(initial, automate, acceptant):
-    """
-    Lit sur l'entrée jusqu'à trouver le plus grand mot étant accepté par l'automate en paramètre
-    Fonctionne avec un peek de 3 caractères en avant afin de dire si un mot est correct ou non.
-
-    Retourne le mot ou une exception
-    """
-    current_state = initial
-    full_word = ""
-    current_making_word = ""
-    chars = peek_char3()
-
-    while chars:
-        # On parcourt les trois caractères
-        for char in chars:
-            # On effectue le traitement si le caractère n'est pas le caractère de fin
-            if char != defs.EOI:
-                adjacent_node = automate[current_state]
-                transition = False
-                # Vérifie s'il est possible de faire une transition
-                for sommet, f in adjacent_node:
-                    if (f(char)):
-                        current_state = sommet
-                        transition = True
-                        break
-                # Si on n'a pas réussi à faire une transition alors le nouveau caractère forme un mot non reconnu.
-                # Dans ce cas, on renvoie si c'est possible le mot précédant faisant partie du langage
-                if (not transition):
-                    if (full_word == ""):
-                        return None
-                    return full_word
-
-                current_making_word += char
-                # Si on est sur un état acceptant alors le mot actuel + les nouveaux caractères sont valides
-                if (current_state in acceptant):
-                    full_word += current_making_word
-                    for i in range(len(current_making_word)):
-                        consume_char()
-                    current_making_word = ""
-                    chars = peek_char3()
-                    break
-            # Si le caractère courant est le EOI alors, on a terminé de lire l'entrée et on peut retourner le dernier
-            # mot reconnu par l'automate.
-            else:
-                if (full_word == ""):
-                    return None
-                return full_word
-    if (full_word == ""):
-        return None
-    return full_word
-
 # Représentation en dictionnaire de l'automate "integer".
 # Pour chaque sommet est associé un dictionnaire de sommets adjacents,
 # la fonction lambda en valeur correspond à la condition nécessaire pour passer à l'autre sommet
@@ -311,44 +147,333 @@ NUMBER_AUTOMATE = {
 NUMBER_AUTOMATE_INITIAL = "q0"
 NUMBER_AUTOMATE_ACCEPTANT = ["q2", "q3", "q6"]
 
-def read_INT_to_EOI():
-    return read_full_word(INT_INITIAL, INT_AUTOMATE, INT_AUTOMATE_ACCEPTANT)
-
-def read_FLOAT_to_EOI():
-    return read_full_word(FLOAT_AUTOMATE_INITIAL, FLOAT_AUTOMATE, FLOAT_AUTOMATE_ACCEPTANT)
-
 
 #################################
-## Lecture de l'entrée : entiers, nombres, tokens
+## Compilation des automates en tables de transitions
 
+def compile_automate(initial, automate, acceptant):
+    """
+    Compile un automate représenté en dictionnaire en une table de transitions dense.
+    Les caractères sont regroupés en classes ayant les mêmes transitions dans tous les états,
+    la classe 0 regroupant les caractères sans aucune transition.
+    Chaque état est numéroté par le début de sa ligne dans la table, l'état 0 étant l'état puits :
+    une transition se fait donc en un seul accès table[état + classe].
 
-# Lecture d'un chiffre, puis avancée et renvoi de sa valeur
-def read_digit():
-    current_char = peek_char1()
-    if current_char not in defs.DIGITS:
-        raise expected_digit_error(current_char)
-    value = eval(current_char)
-    consume_char()
-    return value
+    Retourne le quadruplet (classe de chaque caractère, table, état initial, états acceptants)
+    """
+    states = list(automate)
+    # Signature d'un caractère : l'état atteint depuis chacun des états (None si aucune transition)
+    signatures = {}
+    for code in range(256):
+        char = chr(code)
+        signature = tuple(next((sommet for sommet, f in automate[q] if f(char)), None) for q in states)
+        if any(signature):
+            signatures.setdefault(signature, []).append(char)
+    n_classes = len(signatures) + 1
+    number = {q: (k + 1) * n_classes for k, q in enumerate(states)}
+    class_of = {}
+    table = [0] * ((len(states) + 1) * n_classes)
+    for cls, (signature, chars) in enumerate(signatures.items(), start=1):
+        for char in chars:
+            class_of[char] = cls
+        for q, sommet in zip(states, signature):
+            if sommet is not None:
+                table[number[q] + cls] = number[sommet]
+    return (class_of, table, number[initial], frozenset(number[q] for q in acceptant))
 
+INT_DFA = compile_automate(INT_INITIAL, INT_AUTOMATE, INT_AUTOMATE_ACCEPTANT)
+FLOAT_DFA = compile_automate(FLOAT_AUTOMATE_INITIAL, FLOAT_AUTOMATE, FLOAT_AUTOMATE_ACCEPTANT)
+NUMBER_DFA = compile_automate(NUMBER_AUTOMATE_INITIAL, NUMBER_AUTOMATE, NUMBER_AUTOMATE_ACCEPTANT)
 
-# Lecture d'un entier en renvoyant sa valeur
-def read_INT():
-    word = read_word(INT_INITIAL, INT_AUTOMATE, INT_AUTOMATE_ACCEPTANT)
-    if word :
-        return int(word)
-    return None
+# Classes des 256 octets possibles, pour lire directement des entrées binaires
+def byte_classes(automate):
+    return bytes(automate[0].get(chr(code), 0) for code in range(256))
 
+INT_BYTE_CLASSES = byte_classes(INT_DFA)
+NUMBER_BYTE_CLASSES = byte_classes(NUMBER_DFA)
 
-global int_value
-global exp_value
-global sign_value
 
-# Lecture d'un nombre en renvoyant sa valeur
-def read_NUM():
-    word = read_word(NUMBER_AUTOMATE_INITIAL, NUMBER_AUTOMATE, NUMBER_AUTOMATE_ACCEPTANT)
-    if not word:
+#################################
+## Le lexer
+
+class Lexer:
+    """
+    Un lexer et tout son état : plusieurs lexers peuvent être utilisés en même temps,
+    par exemple dans des threads différents.
+    Le caractère de fin est celui donné à la création, ou à défaut defs.EOI au moment de reinit.
+    """
+    def __init__(self, eoi=None):
+        self.eoi_choice = eoi
+        self.stream = None
+        self.block_size = BLOCK_SIZE
+        self.buffer = ''        # caractères lus et déjà validés
+        self.pos = 0            # position du prochain caractère dans buffer
+        self.offset = 0         # nombre de caractères de l'entrée lus avant le bloc courant
+        self.eoi_seen = False   # vrai dès que le EOI est dans le tampon : on ne lit plus l'entrée
+        self.seekable = False
+        self.eoi = None
+        self.init_char_set()
+
+    # Calcule SEP, V et les préfixes des tokens en fonction de EOI
+    # (une seule fois tant que EOI ne change pas : le lexer peut servir à beaucoup d'entrées)
+    def init_char_set(self):
+        eoi = self.eoi_choice if self.eoi_choice is not None else defs.EOI
+        if eoi == self.eoi:
+            return
+        # Vérification de cohérence : EOI n'est pas dans V_C ni dans SEP
+        if eoi in defs.V_C:
+            raise LexerError('character ' + repr(eoi) + ' in V_C')
+        self.eoi = eoi
+        self.sep = frozenset({' ', '\n', '\t'} - set(eoi))
+        self.v = frozenset(tuple(defs.V_C) + (eoi,) + tuple(self.sep))
+        self.forbidden = str.maketrans('', '', ''.join(self.v))  # efface les caractères de V
+        self.token_map = {defs.PREFIX[t.value]: t for t in defs.V_T if t not in (defs.V_T.NUM, defs.V_T.END)}
+        self.token_map[eoi] = defs.V_T.END
+        # Codes des tokens d'un seul caractère, pour tokenize_all
+        self.prefix_codes = {char: t.value for char, t in self.token_map.items() if t not in (defs.V_T.CALC, defs.V_T.END)}
+
+    # Initialisation de l'entrée
+    def reinit(self, stream=sys.stdin):
+        assert stream.readable()
+        self.stream = stream
+        self.block_size = BLOCK_SIZE
+        self.buffer = ''
+        self.pos = 0
+        self.offset = 0
+        self.eoi_seen = False
+        self.seekable = stream.seekable()
+        self.init_char()
+
+    # Initialisation : on vérifie que EOI n'est pas dans V_C et on initialise les prochains caractères
+    def init_char(self):
+        self.init_char_set()
+        self.fill()
+
+    def check_block(self, block, offset):
+        """
+        Vérifie en une seule passe que tous les caractères du bloc sont dans V.
+        Lève une LexerError donnant la position du premier caractère invalide.
+        """
+        bad = block.translate(self.forbidden)
+        if bad:
+            raise LexerError('Character ' + repr(bad[0]) + ' unsupported at offset ' + str(offset + block.index(bad[0])))
+
+    def read_block(self):
+        """
+        Lit un bloc de l'entrée, le valide et l'ajoute à la fin du tampon.
+        Les caractères déjà consommés sont retirés du tampon : renvoie le décalage
+        à retrancher aux positions calculées avant l'appel.
+        Comme une lecture caractère par caractère, ce qui suit le EOI reste dans le flux.
+        """
+        if self.seekable:
+            start = self.stream.tell()
+            block = self.stream.read(self.block_size)
+        else:
+            # Tube ou terminal : on lit ligne par ligne pour ne pas attendre un bloc complet,
+            # et sans rien lire au delà du EOI s'il est '\n'
+            block = self.stream.readline(self.block_size)
+        if not block:
+            raise LexerError('Character ' + repr('') + ' unsupported at offset ' + str(self.offset))
+        end = block.find(self.eoi)
+        if end >= 0:
+            if self.seekable and end + 1 < len(block):
+                # On remet le flux juste après le EOI
+                self.stream.seek(start)
+                self.stream.read(end + 1)
+            # On complète avec deux EOI pour que peek_char3 renvoie toujours trois caractères
+            block = block[:end + 1] + self.eoi + self.eoi
+            self.eoi_seen = True
+        self.check_block(block, self.offset)
+        self.offset += len(block)
+        shift = self.pos
+        self.buffer = self.buffer[shift:] + block
+        self.pos = 0
+        return shift
+
+    def fill(self):
+        """
+        Lit l'entrée par blocs jusqu'à avoir au moins trois caractères d'avance dans le tampon,
+        ou jusqu'au EOI. Les caractères situés après le EOI dans un bloc sont ignorés.
+        """
+        while not self.eoi_seen and len(self.buffer) - self.pos < 3:
+            self.read_block()
+
+    # Accès aux caractères de prévision
+    def peek_char3(self):
+        return self.buffer[self.pos:self.pos + 3]
+
+    def peek_char1(self):
+        """
+        Renvoie le prochain caractère de l'entrée
+        """
+        return self.buffer[self.pos]
+
+    def consume_char(self):
+        """
+        Permet d’avancer d’un caractère et ne renvoie rien (None).
+        Une fois que la lecture est terminée, faire un appel à la fonction
+        renverra toujours EOI.
+        """
+        if self.buffer[self.pos] == self.eoi: # pour ne pas lire au delà du dernier caractère
+            return
+        self.pos += 1
+        if not self.eoi_seen and len(self.buffer) - self.pos < 3:
+            self.fill()
+
+    def read_full_word(self, automate):
+        """
+        Lit le mot courant en entier (du premier caractère au caractère EOI).
+        À la fin de l'exécution, l'entrée entière sera consommée
+        """
+        class_of, table, state, acceptant = automate
+        # Cas de base : uniquement le EOI (dans ce cas ce n'est pas reconnu, le mot vide n'étant pas reconnu)
+        if self.peek_char1() == self.eoi:
+            return False
+        # Une fois dans l'état puits (0), on consomme le reste sans faire de transition
+        while self.peek_char1() != self.eoi:
+            if state:
+                state = table[state + class_of.get(self.peek_char1(), 0)]
+            self.consume_char()
+        return state in acceptant
+
+    def read_word(self, automate):
+        """
+        Lit sur l'entrée le plus grand mot accepté par l'automate compilé en paramètre.
+        Le tampon est parcouru une seule fois en retenant la position qui suit le dernier
+        état acceptant, puis on revient à cette position : une transition par caractère.
+
+        Retourne le mot ou None
+        """
+        class_of, table, state, acceptant = automate
+        buffer = self.buffer
+        start = i = last = self.pos
+        while True:
+            if i == len(buffer):
+                # Le mot continue au delà du tampon : on lit un bloc de plus
+                shift = self.read_block()
+                buffer = self.buffer
+                start -= shift
+                i -= shift
+                last -= shift
+            state = table[state + class_of.get(buffer[i], 0)]
+            if not state:
+                break
+            i += 1
+            if state in acceptant:
+                last = i
+        if last == start:
+            return None
+        word = buffer[start:last]
+        self.pos = last
+        if not self.eoi_seen and len(buffer) - last < 3:
+            self.fill()
+        return word
+
+    def read_INT_to_EOI(self):
+        return self.read_full_word(INT_DFA)
+
+    def read_FLOAT_to_EOI(self):
+        return self.read_full_word(FLOAT_DFA)
+
+    # Lecture d'un chiffre, puis avancée et renvoi de sa valeur
+    def read_digit(self):
+        current_char = self.peek_char1()
+        if current_char not in defs.DIGITS:
+            raise expected_digit_error(current_char)
+        value = eval(current_char)
+        self.consume_char()
+        return value
+
+    # Lecture d'un entier en renvoyant sa valeur
+    def read_INT(self):
+        word = self.read_word(INT_DFA)
+        if word :
+            return int(word)
         return None
+
+    # Lecture d'un nombre en renvoyant sa valeur
+    def read_NUM(self):
+        word = self.read_word(NUMBER_DFA)
+        if not word:
+            return None
+        return num_value(word)
+
+    # Parse un lexème (sans séparateurs) de l'entrée et renvoie son token.
+    # Cela consomme tous les caractères du lexème lu.
+    def read_token_after_separators(self):
+        char = self.peek_char1()
+        if char == '#':
+            self.consume_char() # Consommation du '#'
+            val = self.read_INT()
+            if val is not None:
+                return (defs.V_T.CALC, val)
+        elif char in self.token_map:
+            self.consume_char()
+            return (self.token_map[char], None)
+        else:
+            val = self.read_NUM()
+            if val is not None:
+                return (defs.V_T.NUM, val)
+        return (defs.V_T.END, None) # par défaut, on renvoie la fin de l'entrée
+
+    # Donne le prochain token de l'entrée, en sautant les séparateurs éventuels en tête
+    # et en consommant les caractères du lexème reconnu.
+    def next_token(self):
+        while self.peek_char1() in self.sep:
+            self.consume_char()
+        return self.read_token_after_separators()
+
+    def tokenize_all(self, text):
+        """
+        Découpe en tokens une entrée complète (jusqu'au premier EOI ou jusqu'à la fin du texte)
+        et renvoie une TokenStream. Les tokens sont les mêmes que ceux de next_token.
+        Un nombre qui ne peut pas être converti arrête le découpage : son erreur est gardée
+        dans la TokenStream et levée à la place du END, quand next_token l'aurait levée.
+        """
+        self.init_char_set()
+        end = text.find(self.eoi)
+        if end < 0:
+            end = len(text)
+        self.check_block(text[:end], 0)
+        prefix = self.prefix_codes
+        sep = self.sep
+        tokens = TokenStream()
+        i = 0
+        while True:
+            while i < end and text[i] in sep:
+                i += 1
+            if i == end:
+                break
+            char = text[i]
+            if char in prefix:
+                tokens.append(prefix[char], 0.0, 0, i)
+                i += 1
+            elif char == '#':
+                last = scan_word(INT_DFA, text, i + 1, end)
+                if last == i + 1:
+                    break
+                try:
+                    tokens.append(_CALC, 0.0, int(text[i + 1:last]), i)
+                except (OverflowError, ValueError):
+                    tokens.error = LexerError('Calculation number too large at offset ' + str(i))
+                    break
+                i = last
+            else:
+                last = scan_word(NUMBER_DFA, text, i, end)
+                if last == i:
+                    break
+                try:
+                    tokens.append(_NUM, num_value(text[i:last]), 0, i)
+                except OverflowError as e:
+                    tokens.error = e
+                    break
+                i = last
+        tokens.append(_END, 0.0, 0, i)
+        return tokens
+
+
+# Valeur d'un lexème reconnu par l'automate des nombres
+def num_value(word):
     if "E" in word:
         mantisse, exposant = word.split("E", maxsplit=2)
         return float(mantisse)*(10**(float(exposant)))
@@ -358,31 +483,401 @@ def read_NUM():
     return float(word)
 
 
-# Parse un lexème (sans séparateurs) de l'entrée et renvoie son token.
-# Cela consomme tous les caractères du lexème lu.
-def read_token_after_separators():
-    char = peek_char1()
-    if char == defs.PREFIX[defs.V_T.CALC.value]:
-        consume_char() # Consommation du '#'
-        val = read_INT()
-        if val:
-            return (defs.V_T.CALC, val)
-    elif char in defs.PREFIX:
-        consume_char()
-        return (defs.TOKEN_MAP.get(char), None)
-    else:
-        val = read_NUM()
-        if val:
-            return (defs.V_T.NUM, val)
-    return (defs.V_T.END, None) # par défaut, on renvoie la fin de l'entrée
+#################################
+## Lecture d'une entrée complète en une suite de tokens compacte
+
+class TokenStream:
+    """
+    Suite de tokens rangée dans des tableaux parallèles : pour le k-ième token,
+    kinds[k] est la valeur de son V_T, nums[k] l'attribut d'un NUM, ints[k] celui d'un CALC
+    et offsets[k] la position de son premier caractère dans l'entrée.
+    Le dernier token est toujours END ; si error n'est pas None, c'est l'erreur du lexer
+    à lever à sa place.
+    """
+    def __init__(self):
+        self.kinds = array('B')
+        self.nums = array('d')
+        self.ints = array('q')
+        self.offsets = array('q')
+        self.error = None
+
+    def __len__(self):
+        return len(self.kinds)
+
+    def append(self, kind, num, index, offset):
+        self.ints.append(index) # en premier : OverflowError si index est trop grand, sans rien ajouter
+        self.kinds.append(kind)
+        self.nums.append(num)
+        self.offsets.append(offset)
+
+    def token(self, k):
+        """
+        Renvoie le k-ième token sous la forme (V_T, attribut) donnée par next_token
+        """
+        kind = self.kinds[k]
+        if kind == _NUM:
+            return (defs.V_T.NUM, self.nums[k])
+        if kind == _CALC:
+            return (defs.V_T.CALC, self.ints[k])
+        if kind == _END and self.error is not None:
+            raise self.error
+        return (_TOKENS[kind], None)
+
+    def cursor(self):
+        return TokenCursor(self)
+
+
+class TokenCursor:
+    """
+    Parcours d'une TokenStream avec la même interface que next_token :
+    une fois le END atteint, next_token renvoie toujours END.
+    """
+    def __init__(self, tokens):
+        self.tokens = tokens
+        self.index = 0
+
+    def next_token(self):
+        k = self.index
+        if k < len(self.tokens) - 1:
+            self.index = k + 1
+        return self.tokens.token(k)
+
+
+_TOKENS = tuple(defs.V_T)
+_NUM = defs.V_T.NUM.value
+_CALC = defs.V_T.CALC.value
+_END = defs.V_T.END.value
+
+def scan_word(automate, text, start, end):
+    """
+    Renvoie la position qui suit le plus grand mot de text[start:end] accepté
+    par l'automate compilé (start si aucun mot n'est accepté).
+    """
+    class_of, table, state, acceptant = automate
+    last = start
+    for i in range(start, end):
+        state = table[state + class_of.get(text[i], 0)]
+        if not state:
+            break
+        if state in acceptant:
+            last = i + 1
+    return last
+
+
+#################################
+## Lexer incrémental, alimenté par morceaux
+
+class PushLexer:
+    """
+    Lexer alimenté par morceaux successifs de l'entrée, sans flux bloquant :
+    feed(chunk) renvoie la liste des tokens (V_T, attribut) déjà décidés,
+    close() signale la fin de l'entrée et renvoie les derniers tokens, terminés par END.
+    Seul le plus petit suffixe encore indécis est gardé (par exemple '1.5e' ou '#12',
+    qui peuvent encore se prolonger). Les tokens sont les mêmes que ceux de next_token.
+    """
+    def __init__(self, eoi=None):
+        self.chars = Lexer(eoi)   # ensembles de caractères et préfixes des tokens
+        self.pending = ''         # début d'un lexème pas encore décidé
+        self.offset = 0           # nombre de caractères reçus avant pending
+        self.done = False         # vrai une fois le END renvoyé
+
+    def feed(self, chunk):
+        if self.done:
+            return []
+        end = chunk.find(self.chars.eoi)
+        if end >= 0:
+            chunk = chunk[:end + 1]
+        self.chars.check_block(chunk, self.offset + len(self.pending))
+        return self.scan(self.pending + chunk, end >= 0)
+
+    def close(self):
+        if self.done:
+            return []
+        return self.scan(self.pending, True)
+
+    def scan(self, text, final):
+        """
+        Découpe text en tokens. Si final est faux, un lexème qui atteint la fin de text
+        en pouvant encore se prolonger est gardé dans pending pour le prochain feed.
+        """
+        chars = self.chars
+        sep, token_map, eoi = chars.sep, chars.token_map, chars.eoi
+        tokens = []
+        end = len(text)
+        i = 0
+        while True:
+            while i < end and text[i] in sep:
+                i += 1
+            if i == end:
+                if final:
+                    tokens.append((defs.V_T.END, None))
+                break
+            char = text[i]
+            if char == eoi:
+                tokens.append((defs.V_T.END, None))
+                final = True
+                break
+            if char == '#':
+                last, alive = scan_prefix(INT_DFA, text, i + 1, end)
+            elif char in token_map:
+                tokens.append((token_map[char], None))
+                i += 1
+                continue
+            else:
+                last, alive = scan_prefix(NUMBER_DFA, text, i, end)
+            if alive and not final:
+                break  # le lexème peut encore se prolonger : on attend la suite
+            if char == '#':
+                if last > i + 1:
+                    tokens.append((defs.V_T.CALC, int(text[i + 1:last])))
+                    i = last
+                    continue
+            elif last > i:
+                tokens.append((defs.V_T.NUM, num_value(text[i:last])))
+                i = last
+                continue
+            tokens.append((defs.V_T.END, None))
+            final = True
+            break
+        if final:
+            self.done = True
+            self.pending = ''
+        else:
+            self.offset += i
+            self.pending = text[i:]
+        return tokens
+
+
+def scan_prefix(automate, text, start, end):
+    """
+    Comme scan_word, mais renvoie aussi si l'automate était encore vivant à la fin de text,
+    c'est-à-dire si la suite de l'entrée pourrait encore allonger le mot.
+    """
+    class_of, table, state, acceptant = automate
+    last = start
+    for i in range(start, end):
+        state = table[state + class_of.get(text[i], 0)]
+        if not state:
+            return (last, False)
+        if state in acceptant:
+            last = i + 1
+    return (last, True)
+
+
+#################################
+## Lecture directe d'une entrée binaire (bytes, bytearray, memoryview, mmap)
+
+# Nature d'un octet en début de token
+_K_BAD, _K_SEP, _K_EOI, _K_OP, _K_CALC, _K_NUM = range(6)
+
+class BytesLexer:
+    """
+    Lexer sur une entrée binaire complète, avec la même fonction next_token que Lexer.
+    Chaque octet est classé par une table de 256 entrées, sans décodage en str, et les
+    nombres sont convertis directement depuis une tranche (sans copie) de l'entrée.
+    La fin des données vaut EOI. Comme pour tokenize_all, toute l'entrée jusqu'au EOI est
+    vérifiée dès la création : un octet hors de V est signalé même s'il suit un lexème
+    qui arrête le lexer. Appeler release une fois la lecture terminée (nécessaire avant de fermer un mmap).
+    """
+    def __init__(self, data, eoi=None):
+        eoi = eoi if eoi is not None else defs.EOI
+        if eoi in defs.V_C:
+            raise LexerError('character ' + repr(eoi) + ' in V_C')
+        self.data = memoryview(data).cast('B')
+        self.pos = 0
+        kinds = bytearray(256)
+        self.token_of = {}
+        for char in defs.V_C:
+            kinds[ord(char)] = _K_NUM
+        for t in defs.V_T:
+            if t not in (defs.V_T.NUM, defs.V_T.END):
+                kinds[ord(defs.PREFIX[t.value])] = _K_OP
+                self.token_of[ord(defs.PREFIX[t.value])] = t
+        kinds[ord('#')] = _K_CALC
+        for char in {' ', '\n', '\t'} - set(eoi):
+            kinds[ord(char)] = _K_SEP
+        code = ord(eoi)
+        if code < 256:
+            kinds[code] = _K_EOI
+        self.kinds = bytes(kinds)
+        self.valid = bytes(b for b in range(256) if kinds[b] != _K_BAD) # octets de V
+        try:
+            self.check(code)
+        except LexerError:
+            self.release()
+            raise
+
+    def release(self):
+        self.data.release()
+
+    def check(self, eoi_code):
+        """
+        Comme Lexer.check_block, par blocs, sur les données jusqu'au EOI (de code eoi_code) :
+        lève une LexerError donnant la position du premier octet hors de V.
+        """
+        data = self.data
+        for offset in range(0, len(data), BLOCK_SIZE):
+            block = data[offset:offset + BLOCK_SIZE].tobytes()
+            end = block.find(eoi_code) if eoi_code < 256 else -1
+            if end >= 0:
+                block = block[:end]
+            bad = block.translate(None, self.valid)
+            if bad:
+                raise LexerError('Character ' + repr(chr(bad[0])) + ' unsupported at offset '
+                                 + str(offset + block.index(bad[0])))
+            if end >= 0:
+                return
+
+    def next_token(self):
+        data, kinds = self.data, self.kinds
+        end = len(data)
+        i = self.pos
+        while i < end and kinds[data[i]] == _K_SEP:
+            i += 1
+        self.pos = i
+        if i == end:
+            return (defs.V_T.END, None)
+        kind = kinds[data[i]]
+        if kind == _K_OP:
+            self.pos = i + 1
+            return (self.token_of[data[i]], None)
+        if kind == _K_CALC:
+            self.pos = i + 1
+            last = scan_bytes(INT_DFA, INT_BYTE_CLASSES, data, i + 1, end)
+            if last == i + 1:
+                return (defs.V_T.END, None)
+            self.pos = last
+            return (defs.V_T.CALC, int(data[i + 1:last]))
+        if kind == _K_NUM:
+            last = self.scan_NUM(i, end)
+            if last == i:
+                return (defs.V_T.END, None)
+            self.pos = last
+            return (defs.V_T.NUM, self.num_value(i, last))
+        if kind == _K_EOI:
+            return (defs.V_T.END, None)
+        raise LexerError('Character ' + repr(chr(data[i])) + ' unsupported at offset ' + str(i))
+
+    def scan_NUM(self, start, end):
+        # Comme scan_bytes avec l'automate des nombres, en retenant la position de l'exposant
+        class_of, table, state, acceptant = NUMBER_DFA
+        data = self.data
+        last = start
+        self.exponent = -1
+        for i in range(start, end):
+            byte = data[i]
+            state = table[state + NUMBER_BYTE_CLASSES[byte]]
+            if not state:
+                break
+            if byte == 0x45 or byte == 0x65: # 'E' ou 'e'
+                self.exponent = i
+            if state in acceptant:
+                last = i + 1
+        return last
+
+    def num_value(self, start, last):
+        # Même calcul que num_value, sur les tranches de l'entrée
+        data, exponent = self.data, self.exponent
+        if start < exponent < last:
+            return float(data[start:exponent])*(10**(float(data[exponent + 1:last])))
+        return float(data[start:last])
+
 
+def scan_bytes(automate, classes, data, start, end):
+    """
+    Comme scan_word, sur une entrée binaire avec la table des classes d'octets.
+    """
+    class_of, table, state, acceptant = automate
+    last = start
+    for i in range(start, end):
+        state = table[state + classes[data[i]]]
+        if not state:
+            break
+        if state in acceptant:
+            last = i + 1
+    return last
+
+
+#################################
+## Lecture d'un fichier projeté en mémoire
+
+class MappedInput:
+    """
+    Fichier projeté en mémoire (mmap) : data donne son contenu en lecture seule, sans
+    le charger en entier dans une str. Il est lu par un BytesLexer (voir Parser.parse_file),
+    pour lequel la fin des données vaut EOI : le fichier n'a pas à se terminer par EOI.
+    """
+    def __init__(self, path):
+        self.file = open(path, 'rb')
+        try:
+            self.data = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError: # fichier vide
+            self.data = b''
+
+    def close(self):
+        if isinstance(self.data, mmap.mmap):
+            self.data.close()
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+#################################
+## Fonctions du module : elles utilisent un lexer partagé
+
+_lexer = Lexer()
+
+def reinit(stream=sys.stdin):
+    global _lexer
+    _lexer = Lexer()
+    defs.INPUT_STREAM = stream
+    _lexer.reinit(stream)
+
+def init_char():
+    _lexer.init_char()
+
+def peek_char3():
+    return _lexer.peek_char3()
+
+def peek_char1():
+    return _lexer.peek_char1()
+
+def consume_char():
+    _lexer.consume_char()
+
+def read_full_word(automate):
+    return _lexer.read_full_word(automate)
+
+def read_word(automate):
+    return _lexer.read_word(automate)
+
+def read_INT_to_EOI():
+    return _lexer.read_INT_to_EOI()
+
+def read_FLOAT_to_EOI():
+    return _lexer.read_FLOAT_to_EOI()
+
+def read_digit():
+    return _lexer.read_digit()
+
+def read_INT():
+    return _lexer.read_INT()
+
+def read_NUM():
+    return _lexer.read_NUM()
+
+def read_token_after_separators():
+    return _lexer.read_token_after_separators()
 
-# Donne le prochain token de l'entrée, en sautant les séparateurs éventuels en tête
-# et en consommant les caractères du lexème reconnu.
 def next_token():
-    while peek_char1() in defs.SEP:
-        consume_char()
-    return read_token_after_separators()
+    return _lexer.next_token()
+
+def tokenize_all(text):
+    return Lexer().tokenize_all(text)
 
 
 #################################
@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Projet TL : évaluation parallèle des calculs - requires Python version >= 3.10
+
+Les calculs ne dépendent les uns des autres que par leurs #i. Un calcul est prêt dès que
+les calculs auxquels il fait référence sont terminés : il est alors envoyé, par lots, à un
+ProcessPoolExecutor avec les seules valeurs dont il a besoin. Il n'y a pas de vagues
+successives : chaque lot terminé rend aussitôt prêts les calculs qui l'attendaient.
+"""
+
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+
+assert sys.version_info >= (3, 10), "Use Python 3.10 or newer !"
+
+import compiler
+import sharedcache
+
+
+# Cache partagé ouvert par ce processus, par nom : seul le dernier utilisé reste ouvert,
+# pour que les blocs des caches qui ne servent plus soient libérés
+attached = {}
+
+def attach(cache_name, cache_lock):
+    cache = attached.get(cache_name)
+    if cache is None:
+        for old in attached.values():
+            old.close()
+        attached.clear()
+        if cache_name is not None:
+            cache = attached[cache_name] = sharedcache.SharedCache.attach(cache_name, cache_lock)
+    return cache
+
+def evaluate_batch(batch, cache_name=None, cache_lock=None):
+    """
+    Exécuté par les processus : évalue une liste de (indice, arbre, valeurs des #i)
+    et renvoie la liste des (indice, valeur, erreur). Avec cache_name, les sous-résultats
+    coûteux passent par le sharedcache.SharedCache de ce nom, de verrou cache_lock.
+    """
+    cache = attach(cache_name, cache_lock)
+    done = []
+    for k, tree, references in batch:
+        try:
+            references = compiler.References(references)
+            if cache is None:
+                done.append((k, compiler.lower(tree)(references), None))
+            else:
+                done.append((k, sharedcache.evaluate(tree, references, cache), None))
+        except Exception as e:
+            done.append((k, None, e))
+    return done
+
+
+def run(program, executor=None, max_workers=None, batch_size=None, cache=None):
+    """
+    Renvoie la liste des valeurs des calculs du compiler.Program program, comme program.run(),
+    en les évaluant dans les processus de executor (par défaut, un ProcessPoolExecutor
+    de max_workers processus créé pour l'occasion). Avec cache, un sharedcache.SharedCache,
+    les processus partagent les sous-résultats coûteux qu'ils ont déjà calculés.
+    Si des calculs lèvent une erreur, c'est celle du premier d'entre eux qui est levée,
+    comme pour calc.parse.
+    """
+    workers = max_workers or os.cpu_count() or 1
+    if executor is None:
+        with ProcessPoolExecutor(workers) as executor:
+            return run(program, executor, workers, batch_size, cache)
+    cache_name, cache_lock = (cache.name, cache.lock) if cache is not None else (None, None)
+    trees = program.trees
+    graph = program.dependencies()
+    n = len(trees)
+    # Nombre de #i attendus par chaque calcul, et calculs qui attendent chaque calcul
+    waiting = [0] * n
+    dependents = [[] for _ in range(n)]
+    for k, refs in enumerate(graph):
+        for j in refs:
+            if j < k:
+                waiting[k] += 1
+                dependents[j].append(k)
+    values = [None] * n
+    errors = {}
+    pending = set()
+
+    def submit(ready):
+        # Seuls comptent les calculs avant la première erreur connue
+        if errors:
+            limit = min(errors)
+            ready = [k for k in ready if k < limit]
+        size = batch_size or max(1, len(ready) // (4 * workers))
+        for start in range(0, len(ready), size):
+            batch = [(k, trees[k], {j: values[j] for j in graph[k] if j < k}) for k in ready[start:start + size]]
+            pending.add(executor.submit(evaluate_batch, batch, cache_name, cache_lock))
+
+    submit([k for k in range(n) if not waiting[k]])
+    while pending:
+        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+        ready = []
+        for future in done:
+            for k, value, error in future.result():
+                if error is not None:
+                    errors[k] = error # les calculs qui en dépendent ne seront jamais prêts
+                    continue
+                values[k] = value
+                for m in dependents[k]:
+                    waiting[m] -= 1
+                    if not waiting[m]:
+                        ready.append(m)
+        ready.sort()
+        submit(ready)
+    if errors:
+        raise errors[min(errors)]
+    return values
@@ -3,212 +3,206 @@
 """
 Projet TL : parser - requires Python version >= 3.10
 """
-
 import sys
-from math import factorial
-
-from lexer import next_token
 
 assert sys.version_info >= (3, 10), "Use Python 3.10 or newer !"
 
+import definitions as defs
+import engine
 import lexer
-from definitions import V_T, str_attr_token
+from engine import ParserError
+
 
 #####
-# Variables internes (à ne pas utiliser directement)
+# L'analyseur : le moteur de engine, en reconnaissance seule
+
+class Parser(engine.Parser):
+    actions = engine.Actions
 
-_current_token = V_T.END
-_value = None  # attribut du token renvoyé par le lexer
 
 #####
-# Fonctions génériques
+# Fonctions du module : elles utilisent un analyseur partagé,
+# sauf les fonctions parse* qui créent un nouvel analyseur à chaque appel
 
-class ParserError(Exception):
-    pass
+_parser = Parser()
 
 def unexpected_token(expected):
-    return ParserError("Found token '" + str_attr_token(_current_token, _value) + "' but expected " + expected)
+    return _parser.unexpected_token(expected)
 
 def get_current():
-    return _current_token
+    return _parser.get_current()
 
 def get_value():
-    return _value
+    return _parser.get_value()
 
 def init_parser(stream):
-    global _current_token, _value
-    lexer.reinit(stream)
-    _current_token, _value = lexer.next_token()
-    # print("@ init parser on",  repr(str_attr_token(_current, _value)))  # for DEBUGGING
+    return _parser.init_parser(stream)
+
+def init_parser_tokens(tokens):
+    return _parser.init_parser_tokens(tokens)
 
 def consume_token(tok):
-    # Vérifie que le prochain token est tok ;
-    # si oui, le consomme et renvoie son attribut ; si non, lève une exception
-    global _current_token, _value
-    if _current_token != tok:
-        raise unexpected_token(tok.name)
-    if _current_token != V_T.END:
-        old = _value
-        _current_token, _value = lexer.next_token()
-        return old
-
-#########################
-## Définition des méthodes de parsing pour les non terminaux
-
-def parse_exp5():
-    tok = get_current()
-    if tok in [V_T.SUB, V_T.OPAR, V_T.NUM, V_T.CALC]:
-        parse_exp4()
-        parse_exp5_p()
-        return
-    else:
-        raise ParserError("Impossible de parser dans parse_exp5")
-
-def parse_exp5_p():
-    tok = get_current()
-    if tok  == V_T.ADD:
-        consume_token(V_T.ADD)
-        parse_exp4()
-        parse_exp5_p()
-        return
-    elif tok == V_T.SUB:
-        consume_token(V_T.SUB)
-        parse_exp4()
-        parse_exp5_p()
-        return
-    elif tok in [V_T.CPAR, V_T.SEQ]:
-        return
-    else:
-        raise ParserError("Impossible de parser dans parse_exp5_p")
-
-def parse_exp4():
-    tok = get_current()
-    if tok in [V_T.SUB, V_T.OPAR, V_T.NUM, V_T.CALC]:
-        parse_exp3()
-        parse_exp4_p()
-        return
-    else:
-        raise ParserError("Impossible de parser dans parse_exp4")
-
-def parse_exp4_p():
-    tok = get_current()
-    if tok == V_T.MUL:
-        consume_token(V_T.MUL)
-        parse_exp3()
-        parse_exp4_p()
-        return
-    elif tok == V_T.DIV:
-        consume_token(V_T.DIV)
-        parse_exp3()
-        parse_exp4_p()
-        return
-    elif tok in [V_T.ADD, V_T.SUB, V_T.CPAR, V_T.SEQ]:
-        return
-    else:
-        raise ParserError("Impossible de parser dans parse_exp4_p")
-
-def parse_exp3():
-    tok = get_current()
-    if tok == V_T.SUB:
-        consume_token(V_T.SUB)
-        parse_exp3()
-        return
-    elif tok in [V_T.OPAR, V_T.NUM, V_T.CALC]:
-        parse_exp2()
-        return
-    else:
-        raise ParserError("Impossible de parser dans parse3")
-
-def parse_exp2():
-    tok = get_current()
-    if tok in [ V_T.OPAR, V_T.NUM, V_T.CALC]:
-        parse_exp1()
-        parse_exp2_p()
-        return
-    else:
-        raise ParserError("Impossible de parser dans parse_exp2")
-
-def parse_exp2_p():
-    tok = get_current()
-    if tok == V_T.FACT:
-        consume_token(V_T.FACT)
-        parse_exp2_p()
-        return
-    elif tok in [V_T.MUL, V_T.DIV, V_T.ADD, V_T.SUB, V_T.CPAR, V_T.SEQ]:
-        return
-    else:
-        raise ParserError("Impossible de parser dans parse_exp2_p")
-
-def parse_exp1():
-    tok = get_current()
-    if tok in [V_T.OPAR, V_T.NUM, V_T.CALC]:
-        parse_exp0()
-        parse_exp1_p()
-        return
-    else:
-        raise ParserError("Impossible de parser dans parse_exp1")
-
-def parse_exp1_p():
-    tok = get_current()
-    if tok == V_T.POW:
-        consume_token(V_T.POW)
-        parse_exp1()
-        return
-    elif tok in [V_T.FACT, V_T.MUL, V_T.DIV, V_T.ADD, V_T.SUB, V_T.CPAR, V_T.SEQ]:
-        return
-    else:
-        raise ParserError("Impossible de parser dans parse_exp1_p")
-
-def parse_exp0():
-    tok = get_current()
-    if tok == V_T.OPAR:
-        consume_token(V_T.OPAR)
-        parse_exp5()
-        consume_token(V_T.CPAR)
-        return
-    elif tok == V_T.NUM:
-        consume_token(V_T.NUM)
-        return
-    elif tok == V_T.CALC:
-        consume_token(V_T.CALC)
-        return
-    else:
-        raise ParserError("Impossible de parser dans parse_exp0")
-
-#########################
-## Parsing de input
-
-def parse_input_p():
-    tok = get_current()
-    if tok in [V_T.SUB, V_T.OPAR, V_T.NUM, V_T.CALC]:
-        parse_exp5()
-        consume_token(V_T.SEQ)
-        parse_input_p()
-        return
-    elif tok == V_T.END:
-        return
-    else:
-        raise ParserError("Impossible de parser dans parse_input")
+    return _parser.consume_token(tok)
 
 def parse_input():
-    tok = get_current()
-    if tok in [V_T.SUB, V_T.OPAR, V_T.NUM, V_T.CALC, V_T.END]:
-        parse_input_p()
-        return
-    else:
-        raise ParserError("Impossible de parser dans parse_input")
-
-#####################################
-## Fonction principale de la calculatrice
-## Appelle l'analyseur grammatical et retourne
-## - None sans les attributs
-## - la liste des valeurs des calculs avec les attributs
+    return _parser.parse_input()
 
 def parse(stream=sys.stdin):
-    init_parser(stream)
-    l = parse_input()
-    consume_token(V_T.END)
-    return l
+    return Parser().parse(stream)
+
+def parse_tokens(tokens):
+    return Parser().parse_tokens(tokens)
+
+def parse_bytes(data):
+    return Parser().parse_bytes(data)
+
+def parse_file(path):
+    return Parser().parse_file(path)
+
+
+#####
+# Reconnaissance directe sur le tampon : ni tokens, ni conversion des nombres.
+# Un seul automate lit les caractères un par un ; il réunit l'état de la grammaire
+# (ce qu'on attend : un opérande, un opérateur...) et l'état du lexème en cours (nombre, #i).
+# Seule la profondeur des parenthèses est gardée à côté.
+
+# Classes des caractères
+(C_BAD, C_SEP, C_EOI, C_DIGIT, C_DOT, C_E, C_ADD, C_SUB, C_MULDIV,
+ C_POW, C_FACT, C_OPAR, C_CPAR, C_HASH, C_SEQ) = range(15)
+N_CLASSES = 15
+
+# États de l'automate (numérotés par le début de leur ligne dans la table)
+(R_START, R_OPERAND, R_OPERAND_AFTER_POW, R_OPERATOR, R_OPERATOR_AFTER_FACT,
+ R_DOT_START, R_DOT, R_INT, R_FRAC, R_EXP, R_EXP_SIGN, R_EXP_DIGITS,
+ R_HASH_START, R_HASH, R_CALC) = (k * N_CLASSES for k in range(15))
+# Actions spéciales, au delà de la table
+R_OPEN = 15 * N_CLASSES  # '(' : profondeur + 1
+R_CLOSE = R_OPEN + 1     # ')' : profondeur - 1
+R_SEQ = R_OPEN + 2       # ';' : la profondeur doit être nulle
+R_ACCEPT = R_OPEN + 3    # fin de l'entrée acceptée
+R_ERROR = R_OPEN + 4     # erreur sur le caractère courant, R_ERROR+k : k caractères avant
+
+def _recognizer_table():
+    table = [R_ERROR] * (15 * N_CLASSES)
+
+    def row(state, **transitions):
+        for name, target in transitions.items():
+            table[state + globals()['C_' + name]] = target
+
+    # Entre deux tokens. Comme pour le lexer, un lexème qui ne peut pas commencer
+    # ('#' sans chiffre, '.' sans chiffre, 'e') est lu comme la fin de l'entrée
+    row(R_START, SEP=R_START, EOI=R_ACCEPT, E=R_ACCEPT, SUB=R_OPERAND, OPAR=R_OPEN,
+        DIGIT=R_INT, DOT=R_DOT_START, HASH=R_HASH_START)
+    for state in (R_OPERAND, R_OPERAND_AFTER_POW):
+        row(state, SEP=state, OPAR=R_OPEN, DIGIT=R_INT, DOT=R_DOT, HASH=R_HASH)
+    row(R_OPERAND, SUB=R_OPERAND)
+    for state in (R_OPERATOR, R_OPERATOR_AFTER_FACT):
+        row(state, SEP=state, ADD=R_OPERAND, SUB=R_OPERAND, MULDIV=R_OPERAND,
+            FACT=R_OPERATOR_AFTER_FACT, CPAR=R_CLOSE, SEQ=R_SEQ)
+    row(R_OPERATOR, POW=R_OPERAND_AFTER_POW)
+    # Dans un nombre ou un #i : un lexème qui se termine est suivi de ce que suit un opérande,
+    # un lexème qui ne peut pas se terminer est une erreur sur son premier caractère
+    for state in (R_INT, R_FRAC, R_EXP_DIGITS, R_CALC):
+        table[state:state + N_CLASSES] = table[R_OPERATOR:R_OPERATOR + N_CLASSES]
+    for state in (R_DOT, R_HASH, R_EXP):
+        table[state:state + N_CLASSES] = [R_ERROR + 1] * N_CLASSES
+    for state in (R_DOT_START, R_HASH_START):
+        table[state:state + N_CLASSES] = [R_ACCEPT] * N_CLASSES
+    table[R_EXP_SIGN:R_EXP_SIGN + N_CLASSES] = [R_ERROR + 2] * N_CLASSES
+    row(R_DOT_START, DIGIT=R_FRAC)
+    row(R_DOT, DIGIT=R_FRAC)
+    row(R_INT, DIGIT=R_INT, DOT=R_FRAC, E=R_EXP)
+    row(R_FRAC, DIGIT=R_FRAC, E=R_EXP)
+    row(R_EXP, ADD=R_EXP_SIGN, SUB=R_EXP_SIGN, DIGIT=R_EXP_DIGITS)
+    row(R_EXP_SIGN, DIGIT=R_EXP_DIGITS)
+    row(R_EXP_DIGITS, DIGIT=R_EXP_DIGITS)
+    row(R_HASH_START, DIGIT=R_CALC)
+    row(R_HASH, DIGIT=R_CALC)
+    row(R_CALC, DIGIT=R_CALC)
+    return table
+
+RECOGNIZER_TABLE = _recognizer_table()
+
+def recognizer_classes(eoi):
+    # Classe de chacun des 256 octets, qui dépend du caractère de fin
+    classes = bytearray(256)
+    for char in defs.DIGITS:
+        classes[ord(char)] = C_DIGIT
+    for chars, cls in [('.', C_DOT), ('eE', C_E), ('+', C_ADD), ('-', C_SUB), ('*/', C_MULDIV),
+                       ('^', C_POW), ('!', C_FACT), ('(', C_OPAR), (')', C_CPAR), ('#', C_HASH), (';', C_SEQ)]:
+        for char in chars:
+            classes[ord(char)] = cls
+    for char in {' ', '\n', '\t'} - set(eoi):
+        classes[ord(char)] = C_SEP
+    if ord(eoi) < 256:
+        classes[ord(eoi)] = C_EOI
+    return bytes(classes)
+
+def validate(data, eoi=None):
+    """
+    Reconnaît l'entrée sans construire de tokens ni convertir de nombres :
+    renvoie -1 si parse accepte l'entrée, sinon la position du premier caractère en erreur
+    (début du token refusé, caractère hors de V, ou fin des données).
+    data est une str ou une entrée binaire (bytes, bytearray, memoryview, mmap) ;
+    comme pour parse_bytes, la fin des données vaut EOI.
+    """
+    eoi = eoi if eoi is not None else defs.EOI
+    if eoi in defs.V_C:
+        raise lexer.LexerError('character ' + repr(eoi) + ' in V_C')
+    classes = recognizer_classes(eoi)
+    if isinstance(data, str):
+        # Un caractère hors de latin-1 devient '?', qui n'est pas dans V
+        data = data.encode('latin-1', 'replace')
+    data = memoryview(data).cast('B')
+    table = RECOGNIZER_TABLE
+    state = R_START
+    depth = 0
+    try:
+        # Les classes sont calculées par blocs (bytes.translate), puis lues une par une
+        for offset in range(0, len(data), lexer.BLOCK_SIZE):
+            block = data[offset:offset + lexer.BLOCK_SIZE].tobytes().translate(classes)
+            for i, cls in enumerate(block, offset):
+                state = table[state + cls]
+                if state >= R_OPEN:
+                    if state == R_OPEN:
+                        depth += 1
+                        state = R_OPERAND
+                    elif state == R_CLOSE:
+                        if not depth:
+                            return i
+                        depth -= 1
+                        state = R_OPERATOR
+                    elif state == R_SEQ:
+                        if depth:
+                            return i
+                        state = R_START
+                    elif state == R_ACCEPT:
+                        return first_bad(data, i, classes)
+                    else:
+                        return i - (state - R_ERROR)
+        state = table[state + C_EOI]
+        if state == R_ACCEPT:
+            return -1
+        return len(data) - (state - R_ERROR)
+    finally:
+        data.release()
+
+def first_bad(data, start, classes):
+    """
+    Position du premier caractère hors de V entre start et le EOI (ou la fin des données),
+    -1 s'il n'y en a pas : comme le lexer, qui vérifie toute l'entrée jusqu'au EOI même quand
+    l'analyse s'arrête avant.
+    """
+    for offset in range(start, len(data), lexer.BLOCK_SIZE):
+        block = data[offset:offset + lexer.BLOCK_SIZE].tobytes().translate(classes)
+        end = block.find(C_EOI)
+        bad = block.find(C_BAD, 0, end if end >= 0 else len(block))
+        if bad >= 0:
+            return offset + bad
+        if end >= 0:
+            break
+    return -1
+
 
 #####################################
 ## Test depuis la ligne de commande
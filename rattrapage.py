@@ -3,244 +3,64 @@
 """
 Projet TL : parser - requires Python version >= 3.10
 """
-import math
 import sys
-from math import factorial
-
-from lexer import next_token
 
 assert sys.version_info >= (3, 10), "Use Python 3.10 or newer !"
 
-import lexer
-from definitions import V_T, str_attr_token
+import engine
+from engine import ParserError
+
 
 #####
-# Variables internes (à ne pas utiliser directement)
+# L'analyseur : le moteur de engine, qui évalue les calculs
+# et ignore ceux qui contiennent une erreur
+
+class Parser(engine.Parser):
+    actions = engine.RecoverActions
 
-_current_token = V_T.END
-_value = None  # attribut du token renvoyé par le lexer
 
 #####
-# Fonctions génériques
+# Fonctions du module : elles utilisent un analyseur partagé,
+# sauf les fonctions parse* qui créent un nouvel analyseur à chaque appel
 
-class ParserError(Exception):
-    pass
+_parser = Parser()
 
 def unexpected_token(expected):
-    return ParserError("Found token '" + str_attr_token(_current_token, _value) + "' but expected " + expected)
+    return _parser.unexpected_token(expected)
 
 def get_current():
-    return _current_token
+    return _parser.get_current()
 
 def get_value():
-    return _value
+    return _parser.get_value()
 
 def init_parser(stream):
-    global _current_token, _value
-    lexer.reinit(stream)
-    _current_token, _value = lexer.next_token()
-    # print("@ init parser on",  repr(str_attr_token(_current, _value)))  # for DEBUGGING
+    return _parser.init_parser(stream)
 
-def consume_token(tok):
-    # Vérifie que le prochain token est tok ;
-    # si oui, le consomme et renvoie son attribut ; si non, lève une exception
-    global _current_token, _value
-    if _current_token != tok:
-        raise unexpected_token(tok.name)
-    if _current_token != V_T.END:
-        old = _value
-        _current_token, _value = lexer.next_token()
-        return old
+def init_parser_tokens(tokens):
+    return _parser.init_parser_tokens(tokens)
 
-#########################
-## Définition de la fonction de rattrapage.
+def consume_token(tok):
+    return _parser.consume_token(tok)
 
 def rattrapage(suiv):
-    """
-    Consomme les tokens jusqu'à trouver un token présent dans la liste 'suiv'
-    ou la fin du flux (END).
-    """
-    tok = get_current()
-    while tok not in suiv and tok != V_T.END:
-        consume_token(tok)
-        tok = get_current()
-    return
-
-
-#########################
-## Définition des méthodes de parsing pour les non terminaux
-
-def parse_exp5(l):
-    tok = get_current()
-    if tok in [V_T.SUB, V_T.OPAR, V_T.NUM, V_T.CALC]:
-        n_1 = parse_exp4(l)
-        n = parse_exp5_p(l, n_1)
-        return n
-    else:
-        raise ParserError("Impossible de parser dans parse_exp5")
-
-def parse_exp5_p(l, n_1):
-    tok = get_current()
-    if tok  == V_T.ADD:
-        consume_token(V_T.ADD)
-        n_0 = parse_exp4(l)
-        n = parse_exp5_p(l, n_1 + n_0)
-        return n
-    elif tok == V_T.SUB:
-        consume_token(V_T.SUB)
-        n_0 = parse_exp4(l)
-        n = parse_exp5_p(l, n_1 - n_0)
-        return n
-    elif tok in [V_T.CPAR, V_T.SEQ]:
-        return n_1
-    else:
-        raise ParserError("Impossible de parser dans parse_exp5_p")
-
-def parse_exp4(l):
-    tok = get_current()
-    if tok in [V_T.SUB, V_T.OPAR, V_T.NUM, V_T.CALC]:
-        n_1 = parse_exp3(l)
-        n = parse_exp4_p(l, n_1)
-        return n
-    else:
-        raise ParserError("Impossible de parser dans parse_exp4")
-
-def parse_exp4_p(l, n_1):
-    tok = get_current()
-    if tok == V_T.MUL:
-        consume_token(V_T.MUL)
-        n_0 = parse_exp3(l)
-        n = parse_exp4_p(l, n_1 * n_0)
-        return n
-    elif tok == V_T.DIV:
-        consume_token(V_T.DIV)
-        n_0 = parse_exp3(l)
-        n = parse_exp4_p(l, n_1 / n_0)
-        return n
-    elif tok in [V_T.ADD, V_T.SUB, V_T.CPAR, V_T.SEQ]:
-        return n_1
-    else:
-        raise ParserError("Impossible de parser dans parse_exp4_p")
-
-def parse_exp3(l):
-    tok = get_current()
-    if tok == V_T.SUB:
-        consume_token(V_T.SUB)
-        n_0 = parse_exp3(l)
-        return -n_0
-    elif tok in [V_T.OPAR, V_T.NUM, V_T.CALC]:
-        n_0 = parse_exp2(l)
-        return n_0
-    else:
-        raise ParserError("Impossible de parser dans parse3")
-
-def parse_exp2(l):
-    tok = get_current()
-    if tok in [ V_T.OPAR, V_T.NUM, V_T.CALC]:
-        n_1 = parse_exp1(l)
-        n = parse_exp2_p(l, n_1)
-        return n
-    else:
-        raise ParserError("Impossible de parser dans parse_exp2")
-
-def parse_exp2_p(l, n_1):
-    tok = get_current()
-    if tok == V_T.FACT:
-        consume_token(V_T.FACT)
-        n = parse_exp2_p(l, math.factorial(int(n_1)))
-        return n
-    elif tok in [V_T.MUL, V_T.DIV, V_T.ADD, V_T.SUB, V_T.CPAR, V_T.SEQ]:
-        return n_1
-    else:
-        raise ParserError("Impossible de parser dans parse_exp2_p")
-
-def parse_exp1(l):
-    tok = get_current()
-    if tok in [V_T.OPAR, V_T.NUM, V_T.CALC]:
-        n_1 = parse_exp0(l)
-        n = parse_exp1_p(l, n_1)
-        return n
-    else:
-        raise ParserError("Impossible de parser dans parse_exp1")
-
-def parse_exp1_p(l, n_1):
-    tok = get_current()
-    if tok == V_T.POW:
-        consume_token(V_T.POW)
-        n_2 = parse_exp1(l)
-        return math.pow(n_1, n_2)
-    elif tok in [V_T.FACT, V_T.MUL, V_T.DIV, V_T.ADD, V_T.SUB, V_T.CPAR, V_T.SEQ]:
-        return n_1
-    else:
-        raise ParserError("Impossible de parser dans parse_exp1_p")
+    return _parser.rattrapage(suiv)
 
-def parse_exp0(l):
-    tok = get_current()
-    if tok == V_T.OPAR:
-        consume_token(V_T.OPAR)
-        n = parse_exp5(l)
-        consume_token(V_T.CPAR)
-        return n
-    elif tok == V_T.NUM:
-        val = consume_token(V_T.NUM)
-        return val
-    elif tok == V_T.CALC:
-        i = consume_token(V_T.CALC)
-        if not i:
-            raise ParserError("Erreur dans parse_exp0: i n'a pas de valeur")
-        if i > len(l) or i <= 0:
-            raise ParserError("Erreur dans parse_exp0: #"+str(i)+" n'existe pas")
-        return l[i-1]
-    else:
-        raise ParserError("Impossible de parser dans parse_exp0")
-
-#########################
-## Parsing de input et exp
+def parse_input():
+    return _parser.parse_input()
 
-def parse_input_p(l):
-    tok = get_current()
-    try:
-        if tok in [V_T.SUB, V_T.OPAR, V_T.NUM, V_T.CALC]:
-            n = parse_exp5(l)
-            consume_token(V_T.SEQ)
-            l_0 = parse_input_p(l + [n])
-            return l_0
-        elif tok == V_T.END:
-            return l
-        else:
-            raise ParserError("Impossible de parser dans parse_input")
-    except ParserError:
-        print("Le calcul à l'emplacement #"+ str(len(l)+1) +" contient une erreur, il a été ignoré");
-        rattrapage([V_T.SEQ, V_T.END])
-        # On verifie si on vient de finir un calcul ou si on est au bout de l'entrée
-        tok = get_current()
-        if tok == V_T.SEQ:
-            consume_token(V_T.SEQ)
-            return parse_input_p(l) # On repart sur le prochain calcul
-        elif tok == V_T.END:
-            return l
+def parse(stream=sys.stdin):
+    return Parser().parse(stream)
 
-    return l
+def parse_tokens(tokens):
+    return Parser().parse_tokens(tokens)
 
-def parse_input():
-    tok = get_current()
-    if tok in [V_T.SUB, V_T.OPAR, V_T.NUM, V_T.CALC, V_T.END]:
-        l = parse_input_p([])
-        return l
-    else:
-        raise ParserError("Impossible de parser dans parse_input")
+def parse_bytes(data):
+    return Parser().parse_bytes(data)
 
-#####################################
-## Fonction principale de la calculatrice
-## Appelle l'analyseur grammatical et retourne
-## - None sans les attributs
-## - la liste des valeurs des calculs avec les attributs
+def parse_file(path):
+    return Parser().parse_file(path)
 
-def parse(stream=sys.stdin):
-    init_parser(stream)
-    l = parse_input()
-    consume_token(V_T.END)
-    return l
 
 #####################################
 ## Test depuis la ligne de commande
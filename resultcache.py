@@ -0,0 +1,169 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Projet TL : cache en mémoire des résultats des calculs - requires Python version >= 3.10
+
+La clé d'un calcul est la suite de ses tokens telle que la donne le lexer : les séparateurs
+et l'écriture des nombres (1, 1.0, 1e0...) n'y comptent donc pas. Chaque #i y est remplacé
+par la valeur à laquelle il fait référence, si bien qu'un même calcul sur les mêmes
+valeurs est retrouvé quelle que soit sa place dans l'entrée. Un calcul trouvé dans le cache
+n'est ni analysé ni évalué : sa valeur est directement ajoutée aux résultats.
+
+Le cache est limité en nombre d'entrées et en octets (taille estimée des clés et des valeurs) ;
+au delà, les entrées utilisées le moins récemment sont supprimées.
+"""
+
+import sys
+import threading
+from collections import OrderedDict
+
+assert sys.version_info >= (3, 10), "Use Python 3.10 or newer !"
+
+import compiler
+import definitions as defs
+import engine
+import lexer
+from engine import NUM, CALC, SEQ, END
+
+MAX_ENTRIES = 1 << 16
+MAX_BYTES = 64 << 20
+
+
+class ResultCache:
+    """
+    Cache LRU des valeurs des calculs, limité à max_entries entrées et max_bytes octets.
+    hits, misses et evictions comptent les calculs trouvés, les calculs évalués
+    et les entrées supprimées. Un même cache peut servir à plusieurs threads : sa table est
+    protégée par un verrou, qui n'est pas gardé pendant l'évaluation.
+    """
+    def __init__(self, max_entries=MAX_ENTRIES, max_bytes=MAX_BYTES):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict() # clé -> (valeur, taille)
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.lexers = {} # un lexer par caractère de fin
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.entries)
+
+    def stats(self):
+        with self.lock:
+            return {'entries': len(self.entries), 'bytes': self.size,
+                    'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions}
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.size = 0
+
+    def get(self, key):
+        # Renvoie (valeur,) si key est dans le cache, None sinon
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry[:1]
+
+    def put(self, key, value):
+        size = entry_size(key, value)
+        if size > self.max_bytes or self.max_entries <= 0:
+            return
+        with self.lock:
+            old = self.entries.pop(key, None)
+            if old is not None:
+                self.size -= old[1]
+            self.entries[key] = (value, size)
+            self.size += size
+            while len(self.entries) > self.max_entries or self.size > self.max_bytes:
+                _, (_, size) = self.entries.popitem(last=False)
+                self.size -= size
+                self.evictions += 1
+
+    #####
+    # Évaluation à travers le cache
+
+    def key(self, tokens, start, end, results):
+        """
+        Clé du calcul formé des tokens start à end (exclu) de la TokenStream tokens,
+        ou None si l'un de ses #i ne fait pas référence à un calcul de results.
+        """
+        kinds = tokens.kinds
+        attributes = []
+        for t in range(start, end):
+            kind = kinds[t]
+            if kind == NUM:
+                attributes.append(tokens.nums[t])
+            elif kind == CALC:
+                i = tokens.ints[t]
+                if not 1 <= i <= len(results):
+                    return None # l'erreur sera levée par l'évaluation
+                attributes.append(compiler.constant_key(results[i - 1]))
+            elif kind == END:
+                return None
+        return (kinds[start:end].tobytes(), tuple(attributes))
+
+    def evaluate(self, tokens):
+        """
+        Renvoie la liste des valeurs des calculs de la TokenStream tokens, comme calc.parse :
+        les calculs déjà dans le cache n'y passent pas.
+        """
+        evaluator = engine.Evaluator()
+        results = evaluator.results
+        feed = evaluator.feed_code
+        kinds, nums, ints = tokens.kinds, tokens.nums, tokens.ints
+        start = 0
+        while True:
+            try:
+                end = kinds.index(SEQ, start)
+                key = self.key(tokens, start, end, results)
+            except ValueError:
+                end = len(kinds) - 1 # le END final
+                key = None
+            if key is not None:
+                entry = self.get(key)
+                if entry is not None:
+                    results.append(entry[0])
+                    start = end + 1
+                    continue
+            # Pas dans le cache : le calcul passe par le moteur, qui lève ses erreurs comme calc.parse
+            for t in range(start, end + 1):
+                kind = kinds[t]
+                if kind == END and tokens.error is not None:
+                    raise tokens.error # levée par le lexer, après les tokens qui la précèdent
+                n = feed(kind, nums[t] if kind == NUM else ints[t] if kind == CALC else None)
+                if kind == END:
+                    return results.tolist()
+            if key is not None:
+                self.put(key, n)
+            start = end + 1
+
+    def parse(self, source, eoi=None):
+        """
+        Comme calc.parse sur le texte source (ou sur ce qu'on lit dans le flux source),
+        à travers le cache.
+        """
+        if not isinstance(source, str):
+            # Comme calc.parse, on ne lit pas au delà de la première ligne si EOI est '\n'
+            source = source.readline() if (eoi if eoi is not None else defs.EOI) == '\n' else source.read()
+        lex = self.lexers.get(eoi)
+        if lex is None:
+            lex = self.lexers.setdefault(eoi, lexer.Lexer(eoi))
+        return self.evaluate(lex.tokenize_all(source))
+
+
+def entry_size(key, value):
+    # Taille estimée d'une entrée : la clé, ses attributs et la valeur
+    codes, attributes = key
+    size = sys.getsizeof(key) + sys.getsizeof(codes) + sys.getsizeof(attributes) + sys.getsizeof(value)
+    for a in attributes:
+        size += sys.getsizeof(a)
+        if type(a) is tuple:
+            size += sum(sys.getsizeof(b) for b in a)
+    return size
@@ -0,0 +1,216 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Projet TL : session d'édition incrémentale - requires Python version >= 3.10
+
+Une Session garde, pour chaque calcul d'une entrée, son texte (de la fin du calcul
+précédent jusqu'à son ';' compris), son arbre, sa fermeture compilée, sa valeur et les #i
+qui y font référence. Quand le texte d'un calcul change, seul ce texte est relu et analysé,
+et seuls ce calcul et ceux qui en dépendent (directement ou non) sont recalculés : le coût
+d'une modification ne dépend que de ce qu'elle touche, pas de la taille de l'entrée.
+"""
+
+import heapq
+import math
+import sys
+
+assert sys.version_info >= (3, 10), "Use Python 3.10 or newer !"
+
+import compiler
+import definitions as defs
+from engine import ParserError
+
+
+def same(a, b):
+    # Même valeur au bit près : même type, et même signe pour les zéros
+    if type(a) is not type(b) or a != b:
+        return False
+    return type(a) is not float or math.copysign(1, a) == math.copysign(1, b)
+
+def same_tree(a, b):
+    # Mêmes arbres, nombres compris au sens de same ; sans récursion, les arbres pouvant
+    # être plus profonds que la pile de Python
+    stack = [(a, b)]
+    while stack:
+        a, b = stack.pop()
+        if a is b:
+            continue
+        if type(a) is tuple:
+            if type(b) is not tuple or len(a) != len(b):
+                return False
+            stack.extend(zip(a, b))
+        elif not same(a, b):
+            return False
+    return True
+
+
+class Earlier(compiler.References):
+    """
+    Valeurs des calculs auxquels le calcul k fait référence et qui le précèdent :
+    un #i en erreur lève son erreur, un #i qui ne précède pas k n'existe pas.
+    """
+    def __init__(self, session, k):
+        values, errors = session.values, session.errors
+        super().__init__((j, values[j]) for j in session.refs[k] if j < k and j not in errors)
+        self.errors = errors
+        self.k = k
+
+    def __missing__(self, j):
+        if 0 <= j < self.k and j in self.errors:
+            raise self.errors[j]
+        return super().__missing__(j)
+
+
+class Session:
+    """
+    Entrée de calculs modifiable calcul par calcul. Les calculs sont numérotés comme #i,
+    à partir de 1. results() renvoie la même chose que calc.parse sur text().
+    """
+    def __init__(self, text='', eoi=None):
+        self.eoi = eoi if eoi is not None else defs.EOI
+        end = text.find(self.eoi)
+        if end >= 0:
+            text = text[:end]
+        self.sources = []   # texte de chaque calcul
+        self.trees = []
+        self.functions = []
+        self.refs = []      # indices (à partir de 0) des calculs auxquels chaque calcul fait référence
+        self.dependents = []  # calculs qui font référence à chaque calcul
+        self.values = []
+        self.errors = {}    # erreur levée par un calcul (ou par un calcul dont il dépend)
+        # Le texte entier est analysé d'un coup : le k-ième ';' termine le k-ième calcul
+        start = 0
+        for tree in compiler.parse_trees(text, self.eoi):
+            end = text.index(';', start) + 1
+            self.add(text[start:end], tree)
+            start = end
+        self.tail = text[start:] # ce qui suit le dernier calcul, ignoré comme par calc.parse
+
+    def __len__(self):
+        return len(self.sources)
+
+    def text(self):
+        return ''.join(self.sources) + self.tail
+
+    def spans(self):
+        # (début, fin) de chaque calcul dans text()
+        spans = []
+        start = 0
+        for source in self.sources:
+            spans.append((start, start + len(source)))
+            start += len(source)
+        return spans
+
+    def source(self, i):
+        return self.sources[self.index(i)]
+
+    #####
+    # Analyse d'un calcul
+
+    def index(self, i):
+        if not 1 <= i <= len(self.sources):
+            raise IndexError("#" + str(i) + " n'existe pas")
+        return i - 1
+
+    def parse(self, source):
+        # Arbre du seul calcul de source, qui doit se terminer par son ';'
+        if source.count(';') != 1 or not source.endswith(';'):
+            raise ParserError("a calculation must end with its only SEQ")
+        if self.eoi in source:
+            raise ParserError("a calculation cannot contain END")
+        trees = compiler.parse_trees(source, self.eoi)
+        if len(trees) != 1:
+            raise ParserError("Found token 'END' but expected SUB, OPAR, NUM or CALC")
+        return trees[0]
+
+    def append(self, source):
+        """
+        Ajoute un calcul (terminé par ';') à la fin de l'entrée et le calcule.
+        """
+        self.add(source, self.parse(source))
+
+    def add(self, source, tree):
+        k = len(self.sources)
+        self.sources.append(source)
+        self.trees.append(tree)
+        self.functions.append(compiler.lower(tree))
+        self.refs.append(tuple(sorted(compiler.references(tree))))
+        self.dependents.append(set())
+        self.values.append(None)
+        for j in self.refs[k]:
+            if j < k:
+                self.dependents[j].add(k)
+        self.evaluate(k)
+
+    #####
+    # Modification
+
+    def edit(self, i, source):
+        """
+        Remplace le texte du calcul #i par source (un seul calcul, terminé par ';') et
+        recalcule ce calcul et ceux qui en dépendent. Renvoie les numéros des calculs
+        recalculés. Si source n'est pas un calcul, ParserError est levée et rien ne change.
+        """
+        k = self.index(i)
+        tree = self.parse(source)
+        self.sources[k] = source
+        if same_tree(tree, self.trees[k]):
+            return [] # seuls les séparateurs ont changé
+        for j in self.refs[k]:
+            if j < k:
+                self.dependents[j].discard(k)
+        self.trees[k] = tree
+        self.functions[k] = compiler.lower(tree)
+        self.refs[k] = tuple(sorted(compiler.references(tree)))
+        for j in self.refs[k]:
+            if j < k:
+                self.dependents[j].add(k)
+        return self.recompute(k)
+
+    def recompute(self, k):
+        # Recalcule k puis, dans l'ordre de l'entrée, les calculs qui en dépendent
+        done = []
+        heap = [k]
+        seen = {k}
+        while heap:
+            k = heapq.heappop(heap)
+            old = self.values[k]
+            was_error = k in self.errors
+            self.evaluate(k)
+            done.append(k + 1)
+            if not was_error and k not in self.errors and same(old, self.values[k]):
+                continue # même valeur : les calculs qui en dépendent ne changent pas
+            for m in self.dependents[k]:
+                if m not in seen:
+                    seen.add(m)
+                    heapq.heappush(heap, m)
+        return done
+
+    def evaluate(self, k):
+        # Le calcul ne voit que les calculs qui le précèdent : ses erreurs sont levées
+        # dans l'ordre de l'évaluation, comme par calc.parse
+        self.errors.pop(k, None)
+        self.values[k] = None
+        try:
+            self.values[k] = self.functions[k](Earlier(self, k))
+        except Exception as e:
+            self.errors[k] = e
+
+    #####
+    # Valeurs
+
+    def value(self, i):
+        # Valeur du calcul #i, ou son erreur
+        k = self.index(i)
+        if k in self.errors:
+            raise self.errors[k]
+        return self.values[k]
+
+    def results(self):
+        """
+        Liste des valeurs de tous les calculs, comme calc.parse : l'erreur du premier calcul
+        en erreur est levée.
+        """
+        if self.errors:
+            raise self.errors[min(self.errors)]
+        return list(self.values)
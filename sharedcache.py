@@ -0,0 +1,304 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Projet TL : cache des sous-résultats partagé entre processus - requires Python version >= 3.10
+
+Une table de hachage à adressage ouvert (sondage linéaire) dans un bloc
+multiprocessing.shared_memory : tous les processus qui l'ouvrent par son nom la lisent et
+l'écrivent directement, sans pickle ni processus gestionnaire. Chaque case associe
+l'empreinte (128 bits) de la forme canonique d'un sous-arbre, où les #i sont remplacés par
+leur valeur, à son résultat : un flottant, ou la position d'un grand entier rangé dans
+une zone annexe à la suite de la table.
+
+La table n'a pas de verrou. Une case n'est jamais réécrite une fois remplie, et elle porte
+une somme de contrôle de son contenu (et de l'entier de la zone annexe) : si deux processus
+écrivent en même temps dans la même case, elle ne passe plus le contrôle et compte comme
+absente. Le cache peut donc perdre des entrées, jamais donner une valeur fausse. Seule la
+zone annexe est partagée sous un verrou (celui d'un multiprocessing.Manager) : chaque
+processus y réserve une part qu'il remplit ensuite seul. Quand la table ou la zone annexe
+est pleine, les nouveaux résultats ne sont plus gardés.
+"""
+
+import hashlib
+import math
+import multiprocessing
+import os
+import struct
+import sys
+from multiprocessing import resource_tracker, shared_memory
+
+assert sys.version_info >= (3, 10), "Use Python 3.10 or newer !"
+
+import compiler
+from engine import NUM, POW, FACT, CALC, NEG
+
+MAGIC = 0x544c5348 # 'TLSH'
+HEADER = struct.Struct('<QQQQQQ') # MAGIC, nombre de cases, taille de la zone annexe, octets utilisés de la zone annexe,
+                                   # resource_tracker du créateur (voir tracker_id)
+SLOT = struct.Struct('<QQQQQQ') # empreinte (2 mots), type, valeur, empreinte de l'entier, contrôle
+LENGTH = struct.Struct('<Q')
+DOUBLE = struct.Struct('<d')
+WORD = struct.Struct('<Q')
+MASK = (1 << 64) - 1
+FLOAT, INT = 1, 2
+MAX_PROBES = 32
+
+N_SLOTS = 1 << 16
+SIDE_BYTES = 16 << 20
+ARENA_BYTES = 1 << 20 # part de la zone annexe réservée à la fois par un processus
+
+
+def check(h1, h2, kind, value, extra):
+    # Somme de contrôle d'une case : un mélange de tous ses mots
+    return (h1 * 0x9e3779b97f4a7c15 + h2 * 0xc2b2ae3d27d4eb4f + kind * 0x165667b19e3779f9
+            + value * 0x27d4eb2f165667c5 + extra * 0x94d049bb133111eb + 1) & MASK
+
+def int_bytes(n):
+    return n.to_bytes((n.bit_length() + 8) // 8, 'little', signed=True)
+
+def int_digest(data):
+    return WORD.unpack(hashlib.blake2b(data, digest_size=8).digest())[0]
+
+def tracked_name(name):
+    # Nom sous lequel le resource_tracker connaît le bloc (il n'est utilisé que sous POSIX)
+    return '/' + name
+
+def tracker_id():
+    # Le tube vers le resource_tracker de ce processus (sous POSIX) : les processus lancés par
+    # multiprocessing partagent celui de leur parent, et donc le même (st_dev, st_ino)
+    if os.name != 'posix':
+        return 0, 0
+    st = os.fstat(resource_tracker._resource_tracker.getfd())
+    return st.st_dev, st.st_ino
+
+
+class SharedCache:
+    """
+    Table partagée de n_slots cases (arrondi à une puissance de 2) et side_bytes octets
+    de zone annexe. SharedCache() crée le bloc, SharedCache.attach(name, lock) l'ouvre dans
+    un autre processus ; sans lock, ce processus ne range pas de grands entiers.
+    Un SharedCache passé à un autre processus (pickle) y est ouvert avec son verrou.
+    hits, misses et stores sont propres à chaque processus.
+    """
+    def __init__(self, n_slots=N_SLOTS, side_bytes=SIDE_BYTES, name=None, lock=None):
+        self.manager = None
+        if name is None:
+            n_slots = 1 << max(0, n_slots - 1).bit_length()
+            size = HEADER.size + n_slots * SLOT.size + side_bytes
+            self.shm = shared_memory.SharedMemory(create=True, size=size)
+            HEADER.pack_into(self.shm.buf, 0, MAGIC, n_slots, side_bytes, 0, *tracker_id())
+            self.manager = multiprocessing.Manager()
+            lock = self.manager.Lock()
+            self.owner = True
+        else:
+            # Le bloc appartient à celui qui l'a créé : seul lui le détruit. Avant Python 3.13,
+            # l'ouvrir l'inscrit aussi auprès du resource_tracker de ce processus. Si c'est celui
+            # du créateur (un processus lancé par multiprocessing), le bloc y est déjà inscrit
+            # jusqu'à unlink, et l'en retirer ferait échouer le retrait fait par unlink. Sinon
+            # on l'en retire, pour qu'il ne le détruise pas à la fin de ce processus
+            try:
+                self.shm = shared_memory.SharedMemory(name=name, track=False)
+            except TypeError:
+                self.shm = shared_memory.SharedMemory(name=name)
+                if os.name == 'posix' and tuple(HEADER.unpack_from(self.shm.buf, 0)[4:]) != tracker_id():
+                    resource_tracker.unregister(tracked_name(self.shm.name), 'shared_memory')
+            self.owner = False
+        self.lock = lock
+        self.arena = self.arena_end = 0 # part de la zone annexe que ce processus remplit
+        magic, self.n_slots, self.side_bytes = HEADER.unpack_from(self.shm.buf, 0)[:3]
+        if magic != MAGIC:
+            self.shm.close()
+            raise ValueError("not a shared cache: " + str(name))
+        self.buf = self.shm.buf
+        self.side = HEADER.size + self.n_slots * SLOT.size
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+
+    @classmethod
+    def attach(cls, name, lock=None):
+        return cls(name=name, lock=lock)
+
+    @property
+    def name(self):
+        return self.shm.name
+
+    def close(self):
+        self.buf = None
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
+            self.manager.shutdown()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    # Les processus s'échangent le nom du bloc (pickle, multiprocessing)
+    def __reduce__(self):
+        return (SharedCache.attach, (self.name, self.lock))
+
+    def __len__(self):
+        # Nombre de cases valides
+        return sum(1 for k in range(self.n_slots) if self.read_slot(k) is not None)
+
+    #####
+    # Cases
+
+    def read_slot(self, k):
+        # (h1, h2, type, valeur, empreinte de l'entier) de la case k si elle est valide, sinon None
+        h1, h2, kind, value, extra, control = SLOT.unpack_from(self.buf, HEADER.size + k * SLOT.size)
+        if h1 == 0 or control != check(h1, h2, kind, value, extra):
+            return None
+        return h1, h2, kind, value, extra
+
+    def probe(self, h1):
+        start = h1 & (self.n_slots - 1)
+        for p in range(min(MAX_PROBES, self.n_slots)):
+            yield (start + p) & (self.n_slots - 1)
+
+    def get(self, key):
+        """
+        Renvoie (valeur,) pour l'empreinte key (16 octets), ou None si elle n'est pas dans la table.
+        """
+        h1, h2 = struct.unpack('<QQ', key)
+        h1 = h1 or 1
+        buf = self.buf
+        for k in self.probe(h1):
+            if WORD.unpack_from(buf, HEADER.size + k * SLOT.size)[0] == 0:
+                break # case vide : la clé n'est pas dans la table
+            slot = self.read_slot(k)
+            if slot is None or slot[0] != h1 or slot[1] != h2:
+                continue
+            _, _, kind, value, extra = slot
+            if kind == FLOAT:
+                self.hits += 1
+                return (DOUBLE.unpack(WORD.pack(value))[0],)
+            n = self.read_int(value, extra)
+            if n is not None:
+                self.hits += 1
+                return (n,)
+            break
+        self.misses += 1
+        return None
+
+    def read_int(self, offset, extra):
+        if offset + LENGTH.size > self.side_bytes:
+            return None
+        size, = LENGTH.unpack_from(self.buf, self.side + offset)
+        start = self.side + offset + LENGTH.size
+        if offset + LENGTH.size + size > self.side_bytes:
+            return None
+        data = bytes(self.buf[start:start + size])
+        if int_digest(data) != extra:
+            return None # entier abîmé par une écriture concurrente
+        return int.from_bytes(data, 'little', signed=True)
+
+    def put(self, key, n):
+        h1, h2 = struct.unpack('<QQ', key)
+        h1 = h1 or 1
+        buf = self.buf
+        for k in self.probe(h1):
+            position = HEADER.size + k * SLOT.size
+            taken = WORD.unpack_from(buf, position)[0]
+            if taken == h1 and WORD.unpack_from(buf, position + 8)[0] == h2:
+                return # déjà rangée, par ce processus ou un autre
+            if taken != 0:
+                continue # case prise par une autre clé : on ne réécrit jamais
+            if type(n) is float:
+                kind, value, extra = FLOAT, WORD.unpack(DOUBLE.pack(n))[0], 0
+            else:
+                data = int_bytes(n)
+                value = self.allocate(LENGTH.size + len(data))
+                if value is None:
+                    return
+                LENGTH.pack_into(buf, self.side + value, len(data))
+                start = self.side + value + LENGTH.size
+                buf[start:start + len(data)] = data
+                kind, extra = INT, int_digest(data)
+            # Le premier mot (qui marque la case prise) est écrit en dernier
+            control = check(h1, h2, kind, value, extra)
+            struct.pack_into('<QQQQQ', buf, position + 8, h2, kind, value, extra, control)
+            WORD.pack_into(buf, position, h1)
+            self.stores += 1
+            return
+
+    def allocate(self, size):
+        # Réserve size octets dans la zone annexe : renvoie leur position, ou None si elle est pleine.
+        # Les octets sont pris dans la part de ce processus ; une nouvelle part est réservée sous le verrou
+        if self.arena + size > self.arena_end:
+            if self.lock is None:
+                return None
+            with self.lock:
+                used = HEADER.unpack_from(self.buf, 0)[3]
+                take = min(max(size, min(ARENA_BYTES, self.side_bytes // 16)), self.side_bytes - used)
+                if take < size:
+                    return None
+                WORD.pack_into(self.buf, 3 * WORD.size, used + take) # quatrième mot de l'en-tête
+            self.arena, self.arena_end = used, used + take
+        offset = self.arena
+        self.arena += size
+        return offset
+
+
+#####
+# Évaluation d'un arbre à travers le cache
+
+def digest(data):
+    return hashlib.blake2b(data, digest_size=16).digest()
+
+def constant_digest(value):
+    # Comme compiler.constant_key : 1 et 1.0, 0.0 et -0.0, nan et -nan sont des valeurs différentes
+    if type(value) is float:
+        return digest(b'f' + DOUBLE.pack(value))
+    return digest(b'i' + int_bytes(value))
+
+def costly(code, operands):
+    # Seuls les sous-résultats coûteux passent par le cache : !, ^ et les calculs sur de grands entiers
+    return code in (FACT, POW) or any(type(n) is int and n.bit_length() > 64 for n in operands)
+
+def evaluate(tree, r, cache):
+    """
+    Valeur de l'arbre tree (voir engine.TreeActions), les #i étant lus dans r (indices à partir
+    de 0), comme compiler.lower(tree)(r) : les sous-résultats coûteux sont cherchés dans le
+    SharedCache cache, et y sont rangés après calcul.
+    """
+    values = []  # pile des (valeur, empreinte sur 16 octets) des nœuds déjà évalués
+    stack = [(tree, False)]
+    while stack:
+        node, ready = stack.pop()
+        code = node[0]
+        if code == NUM:
+            values.append((node[1], constant_digest(node[1])))
+            continue
+        if code == CALC:
+            n = r[node[1] - 1] # IndexError si le calcul #i n'existe pas (encore)
+            values.append((n, constant_digest(n)))
+            continue
+        if not ready:
+            stack.append((node, True))
+            stack.extend((child, False) for child in reversed(node[1:]))
+            continue
+        arity = len(node) - 1
+        operands = values[-arity:]
+        del values[-arity:]
+        key = digest(bytes((code,)) + b''.join(d for _, d in operands)) # 16 octets par opérande
+        numbers = [n for n, _ in operands]
+        found = cache.get(key) if costly(code, numbers) else None
+        if found is not None:
+            n = found[0]
+        else:
+            if code == NEG:
+                n = -numbers[0]
+            elif code == FACT:
+                n = math.factorial(int(numbers[0]))
+            elif code == POW:
+                n = math.pow(*numbers)
+            else:
+                n = compiler.OPERATOR[code](*numbers)
+            if costly(code, numbers):
+                cache.put(key, n)
+        values.append((n, key))
+    return values[0][0]
@@ -0,0 +1,201 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Projet TL : cache persistant des résultats dans une base SQLite - requires Python version >= 3.10
+
+Même principe que resultcache.ResultCache (mêmes clés : tokens normalisés, #i remplacés par
+leur valeur), mais les résultats sont gardés dans un fichier SQLite et survivent au processus.
+La table ne contient que l'empreinte SHA-256 de la clé et la valeur sous forme binaire :
+8 octets pour un flottant (au bit près, -0.0 et nan compris), int.to_bytes pour un entier.
+
+La base est en mode WAL : plusieurs processus peuvent la lire et l'écrire en même temps.
+Pendant l'évaluation d'une entrée, la base n'est que lue : les résultats nouveaux et les dates
+d'utilisation sont écrits ensuite, en une seule transaction courte. La taille des entrées est
+tenue à jour dans la base ; quand elle dépasse max_bytes, les moins récemment utilisées
+sont supprimées.
+"""
+
+import hashlib
+import os
+import sqlite3
+import struct
+import sys
+import time
+
+assert sys.version_info >= (3, 10), "Use Python 3.10 or newer !"
+
+import codecache
+import definitions as defs
+import resultcache
+
+MAX_BYTES = 256 << 20
+OVERHEAD = 32     # taille estimée d'une ligne en plus de la clé et de la valeur
+
+FLOAT, INT = 0, 1
+DOUBLE = struct.Struct('<d')
+LENGTH = struct.Struct('<I')
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS results (
+    key BLOB PRIMARY KEY,
+    kind INTEGER NOT NULL,
+    data BLOB NOT NULL,
+    used INTEGER NOT NULL
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS results_used ON results (used);
+CREATE TABLE IF NOT EXISTS size (
+    id INTEGER PRIMARY KEY CHECK (id = 0),
+    bytes INTEGER NOT NULL
+);
+INSERT OR IGNORE INTO size
+    SELECT 0, COALESCE(SUM(LENGTH(key) + LENGTH(data)), 0) + {0} * COUNT(*) FROM results;
+""".format(OVERHEAD)
+
+def default_path():
+    return os.path.join(codecache.default_directory(), 'results.sqlite')
+
+
+#####
+# Formes binaires des clés et des valeurs
+
+def int_bytes(n):
+    return n.to_bytes((n.bit_length() + 8) // 8, 'little', signed=True)
+
+def digest(key):
+    """
+    Empreinte d'une clé de resultcache.ResultCache.key, indépendante du processus.
+    """
+    codes, attributes = key
+    h = hashlib.sha256('{0}\0'.format(defs.GRAMMAR_VERSION).encode())
+    h.update(LENGTH.pack(len(codes)) + codes)
+    for a in attributes:
+        if type(a) is float:
+            h.update(b'f' + DOUBLE.pack(a)) # littéral d'un NUM
+        elif len(a) == 2:
+            h.update(b'd' + a[1]) # flottant, ses 8 octets
+        else:
+            data = int_bytes(a[2])
+            h.update(b'i' + LENGTH.pack(len(data)) + data)
+    return h.digest()
+
+def encode(value):
+    if type(value) is float:
+        return FLOAT, DOUBLE.pack(value)
+    return INT, int_bytes(value)
+
+def decode(kind, data):
+    if kind == FLOAT:
+        return DOUBLE.unpack(data)[0]
+    return int.from_bytes(data, 'little', signed=True)
+
+
+#####
+# Le cache
+
+class SQLiteCache(resultcache.ResultCache):
+    """
+    Cache des valeurs des calculs dans la base SQLite path, limité à max_bytes octets.
+    hits, misses et evictions comptent ce qu'a fait cette instance.
+    """
+    def __init__(self, path=None, max_bytes=MAX_BYTES, timeout=30.0):
+        # La table en mémoire de ResultCache ne sert pas, seuls ses compteurs et ses lexers
+        super().__init__(max_bytes=max_bytes)
+        self.pending = {} # empreinte -> (type, données) des résultats pas encore écrits
+        self.used = set() # empreintes des résultats trouvés, dont la date est à mettre à jour
+        self.path = path if path is not None else default_path()
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.db = sqlite3.connect(self.path, timeout=timeout)
+        self.db.execute('PRAGMA journal_mode=WAL')
+        self.db.execute('PRAGMA synchronous=NORMAL')
+        with self.db:
+            self.db.executescript(SCHEMA)
+
+    def close(self):
+        self.flush()
+        self.evict()
+        self.db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __len__(self):
+        return self.db.execute('SELECT COUNT(*) FROM results').fetchone()[0]
+
+    def stored_size(self):
+        return self.db.execute('SELECT bytes FROM size').fetchone()[0]
+
+    def stats(self):
+        return {'entries': len(self), 'bytes': self.stored_size(),
+                'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions}
+
+    def clear(self):
+        self.pending.clear()
+        self.used.clear()
+        with self.db:
+            self.db.execute('DELETE FROM results')
+            self.db.execute('UPDATE size SET bytes = 0')
+
+    def get(self, key):
+        key = digest(key)
+        row = self.pending.get(key)
+        if row is None:
+            row = self.db.execute('SELECT kind, data FROM results WHERE key = ?', (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.used.add(key)
+        self.hits += 1
+        return (decode(*row),)
+
+    def put(self, key, value):
+        self.pending[digest(key)] = encode(value)
+
+    def flush(self):
+        # Écrit en une transaction les résultats nouveaux et les dates d'utilisation
+        if not self.pending and not self.used:
+            return
+        now = time.time_ns()
+        with self.db:
+            added = 0
+            for key, (kind, data) in self.pending.items():
+                # Un autre processus a pu ranger la même clé entre temps, avec la même valeur
+                if self.db.execute('INSERT OR IGNORE INTO results VALUES (?, ?, ?, ?)',
+                                   (key, kind, data, now)).rowcount:
+                    added += len(key) + len(data) + OVERHEAD
+            self.db.executemany('UPDATE results SET used = ? WHERE key = ?', ((now, key) for key in self.used))
+            self.db.execute('UPDATE size SET bytes = bytes + ?', (added,))
+        self.pending.clear()
+        self.used.clear()
+
+    def evict(self):
+        # Supprime les entrées les moins récemment utilisées jusqu'à repasser sous max_bytes
+        with self.db:
+            excess = self.stored_size() - self.max_bytes
+            while excess > 0:
+                rows = self.db.execute('SELECT key, LENGTH(key) + LENGTH(data) FROM results ORDER BY used LIMIT 256').fetchall()
+                if not rows:
+                    break
+                freed = 0
+                for key, size in rows:
+                    # Seules comptent les lignes supprimées ici, pas celles qu'un autre processus a déjà enlevées
+                    if self.db.execute('DELETE FROM results WHERE key = ?', (key,)).rowcount:
+                        self.evictions += 1
+                        freed += size + OVERHEAD
+                    excess -= size + OVERHEAD
+                    if excess <= 0:
+                        break
+                self.db.execute('UPDATE size SET bytes = bytes - ?', (freed,))
+
+    def evaluate(self, tokens):
+        # Les valeurs déjà calculées sont gardées même si un calcul suivant lève une erreur
+        try:
+            return super().evaluate(tokens)
+        finally:
+            self.flush()
+            if self.stored_size() > self.max_bytes:
+                self.evict()
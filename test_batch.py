@@ -0,0 +1,49 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+test the evaluation of many small inputs
+"""
+
+import io
+import definitions as defs
+from calc import parse, evaluate_many, ParserError
+
+inputs = ["1;2;#1+#2;", "", "   ", "1+;", "1;e;2;", "3!!;", "1;#5;", "1/0;", "#0;", "1;2", "x;", "1e400;",
+          "  7 ;" + defs.EOI + " 9;", "1;#3;", "()", "1;;", "-0; 0*-1; -#1;", "2^1^3^2;", "25!;#1/#1;",
+          "+43e1772+", "1;43e1772;", "(1;1e999999;"]
+
+# chaque entrée a les valeurs ou l'erreur que donne calc.parse
+results = evaluate_many(inputs)
+assert len(results) == len(inputs)
+for k, text in enumerate(inputs):
+    try:
+        expected = parse(io.StringIO(text + defs.EOI))
+    except Exception as e:
+        assert results.values[k] is None
+        assert type(results.errors[k]) is type(e) and str(results.errors[k]) == str(e)
+        try:
+            results[k]
+            assert False
+        except type(e):
+            pass
+        continue
+    assert k not in results.errors
+    assert repr(results[k]) == repr(expected)
+assert sorted(results.errors) == [3, 6, 7, 8, 9, 10, 11, 13, 14, 15, 19, 20, 21]
+# indices négatifs
+assert results[-4] == results[18] == parse(io.StringIO("25!;#1/#1;" + defs.EOI))
+try:
+    results[-1]
+    assert False
+except ParserError:
+    pass
+
+# un itérateur, et beaucoup d'entrées
+N = 10000
+results = evaluate_many("{0} + #1 ;".format(k) if k % 100 else "{0} ; #1 * 2 ;".format(k) for k in range(N))
+assert len(results) == N and len(results.errors) == N - N // 100
+assert list(results)[100] == [100.0, 200.0]
+assert isinstance(results.errors[1], IndexError)
+
+# autre caractère de fin
+assert evaluate_many(["1 ; 2 ; $ 3 ;", "4 ;\n 5 ;"], eoi="$").values == [[1.0, 2.0], [4.0, 5.0]]
@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+test the bytecode of the stack machine
+"""
+
+import io
+import pickle
+import definitions as defs
+from bytecode import Bytecode, PUSH, LOAD, OP_ADD, OP_MUL, STORE
+from calc import parse, compile_bytecode, ParserError
+
+#################################
+## Fonctions génériques de test
+
+def test_same(calc_input):
+    print("@ test bytecode on input:", repr(calc_input))
+    expected = parse(io.StringIO(calc_input + defs.EOI))
+    code = compile_bytecode(calc_input)
+    assert len(code) == len(expected)
+    # le code relu depuis son bloc binaire, ou reçu par pickle, donne les mêmes résultats
+    for program in [code, Bytecode.from_bytes(code.to_bytes()), pickle.loads(pickle.dumps(code))]:
+        assert program == code
+        found = program.run()
+        assert found == expected, "found {0} vs {1} expected".format(found, expected)
+        assert [type(n) for n in found] == [type(n) for n in expected]
+    print("@ => OK")
+
+def test_error(calc_input, error):
+    print("@ test bytecode on input:", repr(calc_input))
+    try:
+        compile_bytecode(calc_input).run()
+        assert False
+    except error as e:
+        print("@ error found:", repr(e))
+    print("@ => OK")
+
+
+#################################
+## Mêmes résultats que calc.parse
+
+k_parmi_n = "#2-#1;#1!;#2!;#3!;#5/#4/#6;"
+for calc_input in ["  \n \n  ", "7;", "123+321;", "1-2;", "12*3;", "12/3;", "12^3;", "5!;", "0;",
+                   "3 * 4 + 1 - 3 ; #1 * (#1 / 2) ;", "1 + 2 * 3 ; -4 + #1 * #1 ;",
+                   "1 - 1 - 1 ; 1 - (1 - 1) ;", "1 - - 1 - 1 ; 1 - (-1 - 1) ; 1 - -(1 - 1) ;",
+                   "60 / 10 / 2 ; 60 / (10 / 2) ;", "- ((1 + 2) * - ((3 - 5))) ; ",
+                   "2^1^3^2;", "(2^1)^3^2;", "2^3!;", "-3!;", "-2^2;", "2*-3!;", "3!!;", "(3!)^2;",
+                   "2^3^2!;", "2*3^2!/4;", "-(2)^2 - -2!;", "2^(-1);", "1.5e+2 * .5 ; 2.5! ;",
+                   "1;3;" + k_parmi_n, "3;6;" + k_parmi_n]:
+    test_same(calc_input)
+
+N = 20000
+test_same("(" * N + "1" + ")" * N + ";" + "-" * N + "2;" + "1;" + "".join("#{0}+{1};".format(i, i + 1) for i in range(1, N)))
+
+# Les erreurs d'analyse sont levées à la compilation, les autres à l'exécution
+test_error("1 + ;", ParserError)
+test_error("#0;", ParserError)
+test_error("1;#3;", IndexError)
+test_error("1;#1234567890123456;", IndexError)
+test_error("1/0;", ZeroDivisionError)
+
+
+#################################
+## Format du code
+
+code = compile_bytecode("2 * 3 + #1 ; 4 ;")
+assert list(code.code) == [PUSH, PUSH, OP_MUL, LOAD, OP_ADD, STORE, PUSH, STORE]
+assert list(code.consts) == [2.0, 3.0, 4.0]
+assert list(code.args) == [0]
+assert len(code.to_bytes()) == 21 + 8 + 4 + 3 * 8
+
+for blob in [b"", b"XXXX" + code.to_bytes()[4:], code.to_bytes()[:-1], code.to_bytes().replace(bytes([STORE]), bytes([42]), 1)]:
+    try:
+        Bytecode.from_bytes(blob)
+        assert False
+    except ValueError as e:
+        print("@ invalid bytecode:", e)
@@ -101,3 +101,105 @@ test_parsing_error("- ((1 + 2 * - ((3 - 5))) ; ")
 test_parsing_error("- (1 + 2)) * - ((3 - 5)) ; ")
 test_parsing_error("!5;")
 test_parsing_error("5! / ;")
+
+# Les zéros sont des nombres comme les autres
+test_result("0;", [0])
+test_result("0 + 1 ; #1 * 0 ;", [1, 0])
+test_parsing_error("#0;")
+
+# Mêmes résultats depuis une suite de tokens produite en une fois par le lexer
+from calc import parse_tokens
+from lexer import tokenize_all
+
+for calc_input in ["7;", "3 * 4 + 1 - 3 ; #1 * (#1 / 2) ;", "2^1^3^2;", "1;3;"+k_parmi_n]:
+    assert parse_tokens(tokenize_all(calc_input+defs.EOI)) == run(calc_input)
+for calc_input in [";", "123+321", "(1 2 ;"]:
+    try:
+        parse_tokens(tokenize_all(calc_input+defs.EOI))
+        assert False, "parsing error expected on " + repr(calc_input)
+    except ParserError:
+        pass
+
+# Entrées longues et profondes, sans récursion
+N2 = 20000
+assert parse(io.StringIO("1;" + "#1+1;" * N2 + defs.EOI))[-1] == 2
+assert parse(io.StringIO("1" + "+1" * N2 + ";" + defs.EOI)) == [N2 + 1]
+assert parse(io.StringIO("(" * N2 + "2" + ")" * N2 + ";" + defs.EOI)) == [2]
+assert parse(io.StringIO("-" * N2 + "2;" + "1^" * N2 + "1;" + defs.EOI)) == [2, 1]
+
+# Plusieurs calculs en même temps dans des threads différents
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+inputs = ["{0};".format(k) + "".join("#{0}*2+{1};".format(i, k) for i in range(1, 30)) for k in range(1, 40)]
+inputs += ["1;{0};".format(n) + k_parmi_n for n in range(2, 8)]
+expected = [run(calc_input) for calc_input in inputs]
+interval = sys.getswitchinterval()
+sys.setswitchinterval(1e-6)  # pour forcer les changements de thread au milieu des analyses
+try:
+    with ThreadPoolExecutor(8) as pool:
+        for _ in range(10):
+            assert list(pool.map(run, inputs)) == expected
+finally:
+    sys.setswitchinterval(interval)
+
+# Lecture directe d'une entrée binaire
+from calc import parse_bytes
+from lexer import LexerError
+
+for calc_input in inputs[-3:]:
+    assert parse_bytes(calc_input.encode()) == run(calc_input)
+    assert parse_bytes(memoryview(bytearray((calc_input + defs.EOI).encode()))) == run(calc_input)
+# un octet hors de V est signalé comme par parse, même après un lexème qui arrête le lexer
+for calc_input in ["1;e\xe9", "1 2 \xe9;", "1;#\xe9;"]:
+    try:
+        parse_bytes((calc_input + defs.EOI).encode('latin-1'))
+        assert False, "lexer error expected"
+    except LexerError:
+        pass
+
+# Lecture d'un fichier projeté en mémoire, avec ou sans EOI à la fin
+import os
+import tempfile
+from calc import parse_file
+
+def run_file(content):
+    with tempfile.NamedTemporaryFile('w', suffix='.calc', delete=False) as f:
+        f.write(content)
+    try:
+        return parse_file(f.name)
+    finally:
+        os.unlink(f.name)
+
+assert run_file(inputs[-1] + defs.EOI + "ignored after EOI") == run(inputs[-1])
+assert run_file(inputs[0]) == run(inputs[0])
+assert run_file("") == []
+# un octet hors de V est signalé comme sur le texte, même après un lexème qui arrête le lexer
+def run_file_bytes(content):
+    with tempfile.NamedTemporaryFile('wb', suffix='.calc', delete=False) as f:
+        f.write(content)
+    try:
+        return parse_file(f.name)
+    finally:
+        os.unlink(f.name)
+
+for content in [b"1;e\xe9" + defs.EOI.encode(), b"1 2 \xe9;"]:
+    try:
+        run_file_bytes(content)
+        assert False, "lexer error expected"
+    except LexerError:
+        pass
+assert run_file_bytes(b"1;" + defs.EOI.encode() + b"\xe9") == [1.0]
+try:
+    run_file("1+2")
+    assert False, "parsing error expected"
+except ParserError:
+    pass
+
+# import calc ne charge pas les caches persistant et partagé, ni l'évaluation parallèle
+import subprocess
+import sys
+loaded = subprocess.run([sys.executable, "-c", "import sys, calc; print(sorted(m for m in ('sqlite3', 'multiprocessing', "
+                         "'sqlitecache', 'sharedcache', 'parallel') if m in sys.modules))"],
+                        cwd=os.path.dirname(os.path.abspath(__file__)), capture_output=True, text=True, check=True).stdout
+assert loaded.strip() == "[]", loaded
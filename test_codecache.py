@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+test the on-disk cache of compiled calculations
+"""
+
+import os
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import definitions as defs
+from calc import parse_file
+from codecache import CodeCache, SUFFIX
+from lexer import LexerError
+
+def write(path, text):
+    with open(path, 'w') as f:
+        f.write(text)
+
+def compile_in_process(directory, path):
+    cache = CodeCache(directory)
+    return cache.compile_file(path).run()
+
+if __name__ == "__main__":
+    with tempfile.TemporaryDirectory() as tmp:
+        directory = os.path.join(tmp, 'cache')
+        source = os.path.join(tmp, 'input.txt')
+        write(source, "1 + 2 ; #1 * 10 ; 5! ;" + defs.EOI)
+        expected = parse_file(source)
+
+        # la deuxième compilation vient du cache
+        cache = CodeCache(directory)
+        assert cache.compile_file(source).run() == expected
+        assert cache.compile_file(source).run() == expected
+        assert (cache.hits, cache.misses) == (1, 1)
+        # partagé entre instances, et même clé pour le texte déjà lu
+        cache = CodeCache(directory)
+        assert cache.compile("1 + 2 ; #1 * 10 ; 5! ;" + defs.EOI).run() == expected
+        assert (cache.hits, cache.misses) == (1, 0)
+
+        # un fichier modifié est recompilé
+        write(source, "2 + 2 ;" + defs.EOI)
+        assert cache.compile_file(source).run() == [4]
+        assert cache.misses == 1
+
+        # un fichier abîmé compte comme absent
+        key = cache.key("2 + 2 ;" + defs.EOI)
+        write(cache.path(key), "garbage")
+        assert cache.compile_file(source).run() == [4]
+        assert cache.misses == 2
+
+        # fichier vide
+        write(source, "")
+        assert cache.compile_file(source).run() == []
+
+        # une entrée refusée par le lexer n'est jamais mise dans le cache, en binaire comme en texte
+        invalid = "1;e\xe9" + defs.EOI
+        with open(source, 'wb') as f:
+            f.write(invalid.encode('latin-1'))
+        for compile_invalid in [lambda: cache.compile(invalid), lambda: cache.compile_file(source),
+                                lambda: cache.compile(invalid)]:
+            try:
+                compile_invalid()
+                assert False
+            except LexerError:
+                pass
+        assert cache.get(cache.key(invalid)) is None
+
+        # éviction des moins récemment utilisés au delà de la taille limite
+        cache.clear()
+        assert cache.size() == 0
+        size = len(cache.compile("1;").to_bytes())
+        cache = CodeCache(directory, max_bytes=3 * size)
+        for i in range(1, 6):
+            cache.compile(str(i) + ";")
+            time.sleep(0.01)
+            cache.compile("1;") # reste le plus récemment utilisé
+            time.sleep(0.01)
+        assert cache.size() <= 3 * size
+        assert len(cache.entries()) == 3
+        hits = cache.hits
+        cache.compile("1;")
+        cache.compile("5;")
+        assert cache.hits == hits + 2
+
+        # plusieurs processus compilent le même fichier en même temps
+        cache.clear()
+        write(source, "".join("{0} * 2 + #{1};".format(i, i - 1) if i > 1 else "1;" for i in range(1, 2000)) + defs.EOI)
+        expected = parse_file(source)
+        with ProcessPoolExecutor(4) as executor:
+            results = list(executor.map(compile_in_process, [directory] * 8, [source] * 8))
+        assert all(result == expected for result in results)
+        assert len(cache.entries()) == 1
+        assert not [name for name in os.listdir(directory) if not name.endswith(SUFFIX)]
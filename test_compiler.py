@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+test the compiled calculations
+"""
+
+import io
+import math
+import definitions as defs
+from calc import parse, compile, ParserError
+from engine import NUM, CALC
+
+#################################
+## Fonctions génériques de test
+
+def test_same(calc_input):
+    print("@ test compile on input:", repr(calc_input))
+    expected = parse(io.StringIO(calc_input + defs.EOI))
+    for optimize in (False, True):
+        program = compile(calc_input, optimize=optimize)
+        assert len(program) == len(expected)
+        for _ in range(2): # un programme peut être exécuté plusieurs fois
+            found = program.run()
+            assert found == expected, "found {0} vs {1} expected".format(found, expected)
+            # mêmes valeurs au bit près (signe des zéros compris) et mêmes types
+            assert repr(found) == repr(expected)
+            assert [type(n) for n in found] == [type(n) for n in expected]
+        assert repr(list(program.iter_run())) == repr(expected)
+    print("@ => OK")
+
+def test_error(calc_input, error):
+    print("@ test compile on input:", repr(calc_input))
+    for optimize in (False, True):
+        try:
+            compile(calc_input, optimize=optimize).run()
+            assert False
+        except error as e:
+            print("@ error found:", repr(e))
+        try:
+            list(compile(calc_input, optimize=optimize).iter_run())
+            assert False
+        except error:
+            pass
+    print("@ => OK")
+
+
+#################################
+## Mêmes résultats que calc.parse
+
+k_parmi_n = "#2-#1;#1!;#2!;#3!;#5/#4/#6;"
+for calc_input in ["  \n \n  ", "7;", "123+321;", "1-2;", "12*3;", "12/3;", "12^3;", "5!;", "0;",
+                   "3 * 4 + 1 - 3 ; #1 * (#1 / 2) ;", "1 + 2 * 3 ; -4 + #1 * #1 ;",
+                   "1 - 1 - 1 ; 1 - (1 - 1) ;", "1 - - 1 - 1 ; 1 - (-1 - 1) ; 1 - -(1 - 1) ;",
+                   "60 / 10 / 2 ; 60 / (10 / 2) ; 2 * 3 / 4 * 5 ;", "- ((1 + 2) * - ((3 - 5))) ; ",
+                   "2^1^3^2;", "(2^1)^3^2;", "2^3!;", "-3!;", "-2^2;", "2*-3!;", "3!!;", "3!!!;", "(3!)^2;",
+                   "2^3^2!;", "2*3^2!/4;", "-(2)^2 - -2!;", "2^(-1);", "1.5e+2 * .5 ; 2.5! ;", "- - -0;",
+                   "1;3;" + k_parmi_n, "3;6;" + k_parmi_n, "-0; 0*-1; -#1; #1-#1; 0/-1;",
+                   "2;3;(#1 * #2) + (#1 * #2) - 12! / 12! ; #3 ^ #3 ; 0.5 ^ 1e300 ; -#5 ;"]:
+    test_same(calc_input)
+
+# Les longues suites d'un même opérateur ne sont pas limitées par la pile de Python
+N = 20000
+test_same("1" + "+1" * N + ";" + "-" * N + "2;" + "2" + "/1*1" * N + ";")
+test_same("1;" + "".join("#{0}+{1};".format(i, i + 1) for i in range(1, N)))
+
+# Ni l'imbrication des parenthèses : au-delà de compiler.MAX_DEPTH niveaux, l'arbre est
+# évalué sans fermetures imbriquées
+D = 3000
+test_same("1-(" * D + "1" + ")" * D + ";")
+test_same("1;" + "-(" * D + "#1^(1*(" * D + "3!" + "))" * D + ")" * D + ";" + "(" * D + "#2" + ")" * D + ";")
+test_error("1;" + "1-(" * D + "#1/(#1-1)" + ")" * D + ";", ZeroDivisionError)
+test_error("1-(" * D + "#2" + ")" * D + ";", IndexError)
+
+# Les erreurs d'analyse sont levées par compile, les autres par run
+test_error("1 + ;", ParserError)
+test_error("#0;", ParserError)
+test_error("1;#3;", IndexError)
+test_error("1/0;", ZeroDivisionError)
+test_error("1;2;#1 / (#2 - 2);", ZeroDivisionError)
+test_error("(0-1)!;", ValueError)
+test_error("1;#1 + #3;", IndexError)
+test_error("1e308 * 10 ; #1 ! ;", OverflowError)
+
+# Optimisation : sans erreur, tous les calculs deviennent des constantes ;
+# un sous-arbre qui lève une erreur reste, et n'est calculé qu'une fois s'il est partagé
+program = compile("2 ; 3 ; #1 * #2 + 4! ;", optimize=True)
+assert program.roots == [(NUM, 2.0), (NUM, 3.0), (NUM, 30.0)] and program.shared == []
+program = compile("1 ; ((0-#1)! + 1) * ((0-1)! + 1) ;", optimize=True)
+assert len(program.shared) == 2 # la somme, utilisée deux fois, et le résultat du calcul
+program = compile("1;#3;")
+assert program.trees == [(NUM, 1.0), (CALC, 3)]
+# nan et -nan ont le même repr mais ne sont pas la même constante
+nan_input = "1e308*10 - 1e308*10 ; -(1e308*10 - 1e308*10) ;"
+expected = [math.copysign(1, n) for n in parse(io.StringIO(nan_input + defs.EOI))]
+for optimize in (False, True):
+    assert [math.copysign(1, n) for n in compile(nan_input, optimize=optimize).run()] == expected
+
+
+#################################
+## Évaluation des seuls calculs demandés
+
+from calc import evaluate_selected
+
+source = "1 ; 2 ; #1 + #2 ; 1 / 0 ; 100000! ; #3 * 10 ; #6 - #2 ;"
+assert compile(source).dependencies() == [(), (), (0, 1), (), (), (2,), (1, 5)]
+assert compile(source).needed([7]) == [0, 1, 2, 5, 6]
+# 1 / 0 et 100000! ne sont pas calculés
+assert evaluate_selected(source, [7]) == {7: 28.0}
+assert evaluate_selected(source, {3, 1}) == {1: 1.0, 3: 3.0}
+assert evaluate_selected(source + "1-(" * D + "#7" + ")" * D + ";", [8]) == {8: 28.0}
+for optimize in (False, True):
+    assert compile(source[:-8].replace("1 / 0", "7 / 2"), optimize=optimize).evaluate([6, 4]) == {6: 30.0, 4: 3.5}
+
+expected = parse(io.StringIO(k_parmi_n.join(["3;6;", ""]) + defs.EOI))
+program = compile("3;6;" + k_parmi_n)
+for i in range(1, len(expected) + 1):
+    assert program.evaluate([i]) == {i: expected[i - 1]}
+
+# les erreurs des calculs demandés sont levées comme par run
+for calc_input, wanted, error in [(source, [4], ZeroDivisionError), ("1 ; 1 / 0 + #3 ; 2;", [2], ZeroDivisionError),
+                                  ("1 ; #3 + 1 / 0 ; 2;", [2], IndexError), (source, [8], IndexError), (source, [0], IndexError)]:
+    try:
+        evaluate_selected(calc_input, wanted)
+        assert False
+    except error:
+        pass
+
+
+#################################
+## Durée de vie des résultats
+
+import tracemalloc
+from calc import iter_values
+
+assert compile(source).last_uses() == [2, 6, 5, -1, -1, 6, -1]
+assert compile("1;#3;#1+#2;").last_uses() == [2, 2, -1] # #3 dans le calcul 2 n'existe pas encore
+
+# les valeurs sont produites au fur et à mesure : les erreurs arrivent à leur place
+values = iter_values("1 ; #1 + 1 ; 1 / 0 ; 2 ;")
+assert next(values) == 1.0 and next(values) == 2.0
+try:
+    next(values)
+    assert False
+except ZeroDivisionError:
+    pass
+
+# 1000 grands entiers, chacun repris une fois par #i puis plus jamais : la mémoire occupée
+# ne dépend que des résultats encore utiles
+text = "".join("3000! ; #{0} ;".format(2 * i + 1) for i in range(1000))
+expected = parse(io.StringIO(text + defs.EOI))
+program = compile(text)
+program.dependencies() # le graphe des #i reste avec le programme
+tracemalloc.start()
+for value, expected_value in zip(program.iter_run(), expected):
+    assert value == expected_value
+peak_iter = tracemalloc.get_traced_memory()[1]
+tracemalloc.reset_peak()
+program.run()
+peak_run = tracemalloc.get_traced_memory()[1]
+tracemalloc.stop()
+assert peak_iter * 10 < peak_run, (peak_iter, peak_run)
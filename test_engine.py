@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+test the token by token evaluator
+"""
+
+import asyncio
+import io
+import definitions as defs
+import lexer
+from calc import parse
+from engine import Evaluator, ChunkEvaluator, ParserError, aiter_results
+
+#################################
+## Fonctions génériques de test
+
+def tokens_of(string):
+    tokens = lexer.tokenize_all(string + defs.EOI)
+    return [tokens.token(k) for k in range(len(tokens))]
+
+def evaluate(string):
+    evaluator = Evaluator()
+    for tok, value in tokens_of(string):
+        evaluator.feed(tok, value)
+    assert evaluator.finished()
+    return evaluator.results.tolist()
+
+def test_same(calc_input):
+    print("@ test engine on input:", repr(calc_input))
+    expected = parse(io.StringIO(calc_input + defs.EOI))
+    found = evaluate(calc_input)
+    assert found == expected, "found {0} vs {1} expected".format(found, expected)
+    assert [type(n) for n in found] == [type(n) for n in expected]
+    print("@ => OK")
+
+def test_parsing_error(calc_input):
+    print("@ test engine on input:", repr(calc_input))
+    try:
+        result = evaluate(calc_input)
+        print("@ unexpected result:", result)
+        assert False
+    except ParserError as e:
+        print("@ parsing error found:", e)
+    print("@ => OK")
+
+
+#################################
+## Mêmes résultats que calc.parse
+
+k_parmi_n = "#2-#1;#1!;#2!;#3!;#5/#4/#6;"
+for calc_input in ["  \n \n  ", "7;", "123+321;", "1-2;", "12*3;", "12/3;", "12^3;", "5!;", "0;",
+                   "3 * 4 + 1 - 3 ; #1 * (#1 / 2) ;", "1 + 2 * 3 ; -4 + #1 * #1 ;",
+                   "1 - 1 - 1 ; 1 - (1 - 1) ;", "1 - - 1 - 1 ; 1 - (-1 - 1) ; 1 - -(1 - 1) ;",
+                   "60 / 10 / 2 ; 60 / (10 / 2) ;", "- ((1 + 2) * - ((3 - 5))) ; ",
+                   "2^1^3^2;", "(2^1)^3^2;", "2^3!;", "-3!;", "-2^2;", "2*-3!;", "3!!;", "(3!)^2;",
+                   "2^3^2!;", "2*3^2!/4;", "-(2)^2 - -2!;", "2^(-1);", "1.5e+2 * .5 ; 2.5! ;",
+                   "1;3;" + k_parmi_n, "3;6;" + k_parmi_n]:
+    test_same(calc_input)
+
+for calc_input in [";", "123+321", "123+321; 1", "3 * 4 + 1 - 3 ; #1 (#1 / 2) ;", "3 * / 1 - 3 ;",
+                   "(1 2 ;", "- ((1 + 2 * - ((3 - 5))) ; ", "- (1 + 2)) * - ((3 - 5)) ; ",
+                   "!5;", "5! / ;", "2^-1;", "3!^2;", "();", "1;#0;", "(1;"]:
+    test_parsing_error(calc_input)
+
+
+#################################
+## Entrée reçue par morceaux : chaque résultat est donné dès son ';'
+
+evaluator = ChunkEvaluator()
+assert evaluator.feed("1 + 2 ; 3") == [3]
+assert evaluator.feed(" * #1 ") == []
+assert evaluator.feed("; 4!;5") == [9, 24]
+assert evaluator.feed("0;") == [50]
+assert evaluator.close() == []
+assert evaluator.results.tolist() == [3, 9, 24, 50]
+
+evaluator = ChunkEvaluator()
+evaluator.feed("1 + 2 ; 3 *")
+try:
+    evaluator.close()
+    assert False
+except ParserError:
+    pass
+
+
+#################################
+## Lecture asynchrone sur un asyncio.StreamReader
+
+async def read_all(chunks):
+    reader = asyncio.StreamReader()
+    found = []
+
+    async def consume():
+        async for n in aiter_results(reader):
+            found.append((n, len(fed)))
+
+    fed = []
+    task = asyncio.ensure_future(consume())
+    for chunk in chunks:
+        fed.append(chunk)
+        reader.feed_data(chunk)
+        await asyncio.sleep(0)
+    reader.feed_eof()
+    await task
+    return found
+
+# chaque valeur est reçue avant que le morceau suivant ne soit donné
+assert asyncio.run(read_all([b"1+", b"2;", b" #1*10", b";3!", b";"])) == [(3, 2), (30, 4), (6, 5)]
+assert asyncio.run(read_all([b"1;2", b";\n", b"3;"])) == [(1, 1), (2, 2)]
+
+
+#################################
+## Les mêmes actions sémantiques pour toutes les calculatrices
+
+import contextlib
+import calc
+import parser
+import rattrapage
+from engine import NUM, CALC, NEG, FACT, ADD, MUL, POW
+
+def run_quiet(parse_function, string):
+    with contextlib.redirect_stdout(io.StringIO()) as out:
+        result = parse_function(io.StringIO(string + defs.EOI))
+    return result, out.getvalue().count("contient une erreur")
+
+# reconnaissance seule
+assert parser.parse(io.StringIO("1 + 2 * #1 ; -3^2! ;" + defs.EOI)) is None
+
+# rattrapage : le calcul erroné est ignoré, l'analyse continue après son ';'
+assert run_quiet(rattrapage.parse, "1;2 3;#1+1;#1+#2;") == ([1, 2, 3], 1)
+assert run_quiet(rattrapage.parse, "#3;1;(2;3!;") == ([1, 6], 2)
+assert run_quiet(rattrapage.parse, "1;2+") == ([1], 1)
+assert run_quiet(rattrapage.parse, "#5;;1;") == ([1], 2)
+assert run_quiet(rattrapage.parse, "#0;)2;3;") == ([3], 2)
+try:
+    rattrapage.parse(io.StringIO(";1;" + defs.EOI))
+    assert False
+except ParserError:
+    pass
+
+# construction d'arbres
+assert calc.parse_trees(io.StringIO("1+2*3; -#1^2!;" + defs.EOI)) == [
+    (ADD, (NUM, 1.0), (MUL, (NUM, 2.0), (NUM, 3.0))),
+    (NEG, (FACT, (POW, (CALC, 1), (NUM, 2.0))))]
@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+test the history of results
+"""
+
+import io
+import math
+import os
+import definitions as defs
+from calc import parse_history
+from history import History
+
+# Flottants dans le tableau, valeurs exactes à part
+h = History([1.5, 2.0])
+assert h.exact == {} and len(h) == 2
+h.append(math.factorial(30))
+h.append(-0.0)
+assert h.tolist() == [1.5, 2.0, math.factorial(30), -0.0]
+assert type(h[2]) is int and h[2] == math.factorial(30)
+assert h[-2] == math.factorial(30) and h[-1] == 0.0 and math.copysign(1, h[-1]) == -1
+assert list(h.floats) == [1.5, 2.0, 0.0, -0.0] and list(h.exact) == [2]
+try:
+    h[4]
+    assert False
+except IndexError:
+    pass
+
+# Historique renvoyé par calc.parse_history, sans passer par une liste
+h = parse_history(io.StringIO("3!; #1 / 4; 25!; #3 - #3;" + defs.EOI))
+assert isinstance(h, History)
+assert h.tolist() == [6, 1.5, math.factorial(25), 0]
+assert [type(n) for n in h] == [int, float, int, int]
+
+# Beaucoup de calculs : l'historique grandit en temps linéaire
+N = 100000
+h = parse_history(io.StringIO("1;" + "".join("#{0}+1;".format(i) for i in range(1, N)) + defs.EOI))
+assert len(h) == N and h[N - 1] == N
+
+# Historique paginé : au delà de la fenêtre, les résultats sont relus sur disque
+import tempfile
+from calc import parse, iter_results
+from history import PagedHistory
+
+values = [1.5, -0.0, math.factorial(40), -math.factorial(30), 0, -1, float('inf'), 2.0 ** 80, 255, -256] * 3
+with tempfile.TemporaryDirectory() as tmp:
+    with PagedHistory(window=3, directory=tmp) as h:
+        for k, n in enumerate(values):
+            h.append(n)
+            assert len(h.recent) < 2 * h.window
+            assert h[k] == n and h[-1] == n
+        assert len(h) == len(values) and h.start > 0
+        assert repr(h.tolist()) == repr(values)
+        assert [type(n) for n in h] == [type(n) for n in values]
+        assert h[-len(values)] == values[0]
+        for i in [len(values), -len(values) - 1]:
+            try:
+                h[i]
+                assert False
+            except IndexError:
+                pass
+    assert os.listdir(tmp) == []
+
+# Résultats produits au fur et à mesure, avec des #i loin derrière la fenêtre
+text = "1;" + "".join("#{0}/2+#{1}/2;".format(i, max(1, i - 50)) if i % 7 else "{0}!;".format(i % 30) for i in range(1, 2000))
+expected = parse(io.StringIO(text + defs.EOI))
+for window in (1, 10, 100000):
+    assert list(iter_results(io.StringIO(text + defs.EOI), window=window, size=100)) == expected
+assert list(iter_results(io.BytesIO((text + defs.EOI).encode()), window=5)) == expected
+
+class Chunks:
+    # Flux qui compte ce qui a été lu
+    def __init__(self, chunks):
+        self.chunks = iter(chunks)
+        self.read_count = 0
+    def read(self, size):
+        self.read_count += 1
+        return next(self.chunks, "")
+
+stream = Chunks(["1 + 2 ; 3", " * #1 ;", " 4! ; 5", ";" + defs.EOI])
+results = iter_results(stream)
+assert next(results) == 3 and stream.read_count == 1
+assert next(results) == 9 and stream.read_count == 2
+assert list(results) == [24, 5]
+
+# les erreurs sont levées à leur place
+results = iter_results(io.StringIO("1; 2; #5;" + defs.EOI), window=1)
+assert next(results) == 1 and next(results) == 2
+try:
+    next(results)
+    assert False
+except IndexError:
+    pass
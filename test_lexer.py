@@ -6,6 +6,10 @@ Test du lexer du projet de TL
 
 import io
 import math
+import mmap
+import os
+import tempfile
+import threading
 import definitions as defs
 import lexer
 
@@ -261,8 +265,201 @@ def exec_test_next_token():
          ])
     ])
 
+# Lecture par blocs : le découpage de l'entrée ne doit rien changer
+def exec_test_buffer():
+    print("@---- lexer buffer")
+    text = "1 + 2^3! / (4*5-6) ; #1 * .5e+2 ;"
+    lexer.reinit(io.StringIO(text+defs.EOI))
+    expected = []
+    token = lexer.next_token()
+    while token[0] != defs.V_T.END:
+        expected.append(token)
+        token = lexer.next_token()
+    saved = lexer.BLOCK_SIZE
+    try:
+        for size in (1, 2, 3, 4, 7):
+            lexer.BLOCK_SIZE = size
+            stream = io.StringIO(text+defs.EOI+"ignored after EOI")
+            lexer.reinit(stream)
+            found = []
+            token = lexer.next_token()
+            while token[0] != defs.V_T.END:
+                found.append(token)
+                token = lexer.next_token()
+            test("@ block size " + str(size), found == expected, "found " + repr(found))
+            lexer.consume_char()
+            test("@ block size " + str(size), lexer.peek_char3() == defs.EOI*3, "EOI expected after the end")
+            rest = stream.read()
+            test("@ block size " + str(size), rest == "ignored after EOI", "found " + repr(rest) + " left after EOI")
+        lexer.BLOCK_SIZE = 4
+        lexer.reinit(io.StringIO("12+3"+defs.EOI))
+        test("@ peek_char3", lexer.peek_char3() == "12+", "found " + repr(lexer.peek_char3()))
+        lexer.consume_char()
+        lexer.consume_char()
+        lexer.consume_char()
+        test("@ peek_char3", lexer.peek_char3() == "3"+defs.EOI*2, "found " + repr(lexer.peek_char3()))
+        for text, offset in (("1+a", 2), ("12345678 x", 9), ("1+2", 3)):
+            try:
+                lexer.reinit(io.StringIO(text+(defs.EOI if offset < len(text) else "")))
+                while lexer.next_token()[0] != defs.V_T.END:
+                    pass
+                test("@ offset", False, "an exception is expected on " + repr(text))
+            except lexer.LexerError as e:
+                test("@ offset", str(e).endswith("offset " + str(offset)), "unexpected " + repr(e))
+    finally:
+        lexer.BLOCK_SIZE = saved
+    # Sur un tube, on n'attend pas un bloc complet : le lexer lit ce qui est déjà écrit
+    r, w = os.pipe()
+    with open(r) as reading, open(w, 'w') as writing:
+        writing.write("1 + 2" + defs.EOI + "\n")
+        writing.flush()
+        found = []
+        def read_all():
+            lexer.reinit(reading)
+            found.append(lexer.next_token())
+            while found[-1][0] != defs.V_T.END:
+                found.append(lexer.next_token())
+        thread = threading.Thread(target=read_all, daemon=True)
+        thread.start()
+        thread.join(10)
+        test("@ pipe", not thread.is_alive() and len(found) == 4, "found " + repr(found))
+    print("@---- lexer buffer PASSED!")
+    print()
+
+# Nombres longs et retours en arrière à cheval sur plusieurs blocs
+def exec_test_long_NUM():
+    print("@---- lexer long NUM")
+    saved = lexer.BLOCK_SIZE
+    try:
+        for size in (2, 3, 5, 64):
+            lexer.BLOCK_SIZE = size
+            test_all_w_result("lexer.read_NUM",
+                              [("1" * 300 + "e-290", float("1" * 300 + "e-290")),
+                               ("." + "5" * 1000, float("." + "5" * 1000)),
+                               ("12345e+", 12345),
+                               ("12345.5e+;", 12345.5),
+                               ("123" * 100 + "ee5", float("123" * 100))])
+            test_all_w_result("lexer.read_INT", [("9" * 300 + ".5", int("9" * 300))])
+    finally:
+        lexer.BLOCK_SIZE = saved
+
+# Découpage d'une entrée complète : mêmes tokens que next_token
+def exec_test_tokenize_all():
+    print("@---- lexer.tokenize_all")
+    for text in ["", "1 2.0 3e-1 .4", "1 + 2^3! / (4*5-6)", "0 ; #0 + #12 ;", "1e+ 2ee", "3 + e 4",
+                 "  \t 12.5e-3 * #3;  "]:
+        lexer.reinit(io.StringIO(text+defs.EOI))
+        expected = [lexer.next_token()]
+        while expected[-1][0] != defs.V_T.END:
+            expected.append(lexer.next_token())
+        tokens = lexer.tokenize_all(text+defs.EOI+"ignored")
+        found = [tokens.token(k) for k in range(len(tokens))]
+        test("@ tokenize_all on " + repr(text), found == expected, "found " + repr(found) + " instead of " + repr(expected))
+        cursor = tokens.cursor()
+        found = [cursor.next_token() for _ in range(len(tokens) + 2)]
+        test("@ cursor on " + repr(text), found == expected + [expected[-1]] * 2, "found " + repr(found))
+    tokens = lexer.tokenize_all("12 + (#3)")
+    test("@ offsets", list(tokens.offsets) == [0, 3, 5, 6, 8, 9], "found " + repr(tokens.offsets))
+    try:
+        lexer.tokenize_all("1 + 2 a")
+        test("@ tokenize_all", False, "an exception is expected")
+    except lexer.LexerError as e:
+        test("@ tokenize_all", str(e).endswith("offset 6"), "unexpected " + repr(e))
+    # un nombre trop grand n'est signalé qu'une fois les tokens qui le précèdent lus
+    tokens = lexer.tokenize_all("1 + 43e1772 + 2")
+    cursor = tokens.cursor()
+    test("@ tokenize_all overflow", [cursor.next_token() for _ in range(2)] == [(defs.V_T.NUM, 1.0), (defs.V_T.ADD, None)],
+         "found " + repr(list(tokens.kinds)))
+    try:
+        cursor.next_token()
+        test("@ tokenize_all overflow", False, "an exception is expected")
+    except OverflowError:
+        pass
+    print("@---- lexer.tokenize_all PASSED!")
+    print()
+
+# Lexer sur une entrée binaire : mêmes tokens que next_token
+def exec_test_bytes():
+    print("@---- lexer.BytesLexer")
+    for text in ["", "1 2.0 3e-1 .4", "1 + 2^3! / (4*5-6)", "0 ; #0 + #12 ;", "1e+ 2ee", "3 + e 4",
+                 "  \t 12.5e-3 * #3;  ", "1.5E+2 .5e1 7E3"]:
+        lexer.reinit(io.StringIO(text+defs.EOI))
+        expected = [lexer.next_token()]
+        while expected[-1][0] != defs.V_T.END:
+            expected.append(lexer.next_token())
+        for data in [text.encode(), bytearray((text+defs.EOI+"ignored").encode()), memoryview(text.encode())]:
+            lex = lexer.BytesLexer(data)
+            found = [lex.next_token()]
+            while found[-1][0] != defs.V_T.END:
+                found.append(lex.next_token())
+            lex.release()
+            test("@ BytesLexer on " + repr(data), found == expected, "found " + repr(found) + " instead of " + repr(expected))
+    try:
+        lex = lexer.BytesLexer(b"1 + 2 \xe9")
+        while lex.next_token()[0] != defs.V_T.END:
+            pass
+        test("@ BytesLexer", False, "an exception is expected")
+    except lexer.LexerError as e:
+        test("@ BytesLexer", str(e).endswith("offset 6"), "unexpected " + repr(e))
+    # un octet hors de V est signalé même après un lexème qui arrête le lexer, mais pas après EOI
+    with tempfile.TemporaryFile() as f:
+        for text, offset in (("1;e\xe9", 3), ("1 2 \xe9;", 4), ("1;#\xe9", 3), (". \xe9", 2), ("1;" + defs.EOI + "\xe9", -1)):
+            data = text.encode('latin-1')
+            f.seek(0)
+            f.truncate()
+            f.write(data)
+            f.flush()
+            with mmap.mmap(f.fileno(), 0) as mapped:
+                for source in [data, bytearray(data), memoryview(data), mapped]:
+                    try:
+                        lex = lexer.BytesLexer(source)
+                        while lex.next_token()[0] != defs.V_T.END:
+                            pass
+                        lex.release()
+                        test("@ BytesLexer on " + repr(text), offset < 0, "an exception is expected")
+                    except lexer.LexerError as e:
+                        test("@ BytesLexer on " + repr(text), str(e).endswith("offset " + str(offset)), "unexpected " + repr(e))
+    print("@---- lexer.BytesLexer PASSED!")
+    print()
+
+# Lexer incrémental : mêmes tokens quel que soit le découpage en morceaux
+def exec_test_push():
+    print("@---- lexer.PushLexer")
+    for text in ["", "1 2.0 3e-1 .4", "1 + 2^3! / (4*5-6)", "0 ; #0 + #12 ;", "1e+ 2ee", "3 + e 4",
+                 "  \t 12.5e-3 * #3;  ", "1.5E+2 .5e1 7E3", "#", "12#"]:
+        lexer.reinit(io.StringIO(text+defs.EOI))
+        expected = [lexer.next_token()]
+        while expected[-1][0] != defs.V_T.END:
+            expected.append(lexer.next_token())
+        for end in ["", defs.EOI, defs.EOI + "1+2"]:
+            full = text + end
+            for size in range(1, len(full) + 2):
+                lex = lexer.PushLexer()
+                found = []
+                for k in range(0, len(full), size):
+                    found += lex.feed(full[k:k + size])
+                found += lex.close()
+                test("@ PushLexer on " + repr(full) + " by " + str(size), found == expected,
+                     "found " + repr(found) + " instead of " + repr(expected))
+    lex = lexer.PushLexer()
+    test("@ PushLexer", lex.feed("12+1.5e") == [(defs.V_T.NUM, 12), (defs.V_T.ADD, None)], "'1.5e' must be pending")
+    test("@ PushLexer", lex.pending == "1.5e", "found pending " + repr(lex.pending))
+    test("@ PushLexer", lex.feed("2;") == [(defs.V_T.NUM, 150), (defs.V_T.SEQ, None)], "'1.5e2' expected")
+    try:
+        lex.feed("1 a")
+        test("@ PushLexer", False, "an exception is expected")
+    except lexer.LexerError as e:
+        test("@ PushLexer", str(e).endswith("offset 11"), "unexpected " + repr(e))
+    print("@---- lexer.PushLexer PASSED!")
+    print()
+
 # Si ce fichier est lancé directement, on exécute les tests
 if __name__ == '__main__':
+    exec_test_buffer()
+    exec_test_long_NUM()
+    exec_test_tokenize_all()
+    exec_test_bytes()
+    exec_test_push()
     exec_test_INT_to_EOI()
     exec_test_FLOAT_to_EOI()
     exec_test_INT()
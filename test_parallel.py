@@ -0,0 +1,47 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+test the parallel evaluation of calculations
+"""
+
+import io
+from concurrent.futures import ProcessPoolExecutor
+
+import definitions as defs
+import parallel
+from calc import parse, compile, evaluate_parallel
+
+def test_same(executor, calc_input, batch_size=None):
+    print("@ test parallel on input:", repr(calc_input[:60]))
+    expected = parse(io.StringIO(calc_input + defs.EOI))
+    found = parallel.run(compile(calc_input), executor, batch_size=batch_size)
+    assert repr(found) == repr(expected), "found {0} vs {1} expected".format(found, expected)
+    print("@ => OK")
+
+def test_error(executor, calc_input, error):
+    print("@ test parallel on input:", repr(calc_input[:60]))
+    try:
+        parallel.run(compile(calc_input), executor)
+        assert False
+    except error as e:
+        print("@ error found:", repr(e))
+    print("@ => OK")
+
+if __name__ == "__main__":
+    with ProcessPoolExecutor(2) as executor:
+        k_parmi_n = "#2-#1;#1!;#2!;#3!;#5/#4/#6;"
+        for calc_input in ["", "7;", "1 + 2 * 3 ; -4 + #1 * #1 ;", "1;3;" + k_parmi_n, "3;6;" + k_parmi_n,
+                           "2^1^3^2; 3!!; -0; 1.5e+2 * .5 ; 2.5! ; #4 * #5;"]:
+            test_same(executor, calc_input)
+        # des chaînes indépendantes : les résultats passent d'un processus à l'autre
+        chains = " ".join("{0}! ;".format(i % 7 + 20) if i % 10 == 0 else "#{0} / 2 + 1 ;".format(i) for i in range(300))
+        test_same(executor, chains)
+        test_same(executor, chains, batch_size=1)
+
+        # l'erreur levée est celle du premier calcul en erreur, comme pour calc.parse
+        test_error(executor, "1 ; 2 ; #1 / 0 ; #2 ; #3 + 1 ; (0-1)! ;", ZeroDivisionError)
+        test_error(executor, "1 ; (0-1)! ; #1 / 0 ;", ValueError)
+        test_error(executor, "1 ; #1 + #3 ; 2 ; 1 / 0 ;", IndexError)
+        test_error(executor, "1 ; 1 / 0 ; #2 + 1 ; #5 ;", ZeroDivisionError)
+
+    assert evaluate_parallel("1 ; #1 + 1 ; 5! ;", max_workers=1) == [1.0, 2.0, 120]
@@ -6,7 +6,8 @@ test the calculator in infix syntax
 
 import io
 import definitions as defs
-from parser import parse, ParserError
+from parser import parse, validate, ParserError
+from lexer import LexerError
 
 PARSER_NAME = 'parser'
 PARSER_UNDER_TEST = parse
@@ -27,6 +28,7 @@ def test_result(calc_input, expected):
     print("@ result expected:", repr(expected))
     found = run(calc_input)
     assert found == None, "Input should have been accepted."
+    assert validate(calc_input+defs.EOI) == -1, "Input should have been validated."
     print("@ => OK")
     print()
 
@@ -40,6 +42,7 @@ def test_parsing_error(calc_input):
     except ParserError as e:
         print("@ parsing error found:", e)
         pass
+    assert validate(calc_input+defs.EOI) >= 0, "Input should have been rejected by validate."
     print("@ => OK")
     print()
 
@@ -101,3 +104,43 @@ test_parsing_error("- ((1 + 2 * - ((3 - 5))) ; ")
 test_parsing_error("- (1 + 2)) * - ((3 - 5)) ; ")
 test_parsing_error("!5;")
 test_parsing_error("5! / ;")
+
+# Les zéros sont des nombres comme les autres
+test_result("0;", None)
+test_result("0 + 1 ; #1 * 0 ;", None)
+test_result("#0;", None)
+
+# Mêmes résultats depuis une suite de tokens produite en une fois par le lexer
+from parser import parse_tokens
+from lexer import tokenize_all
+
+for calc_input in ["7;", "3 * 4 + 1 - 3 ; #1 * (#1 / 2) ;", "2^1^3^2;", "1;3;"+k_parmi_n]:
+    assert parse_tokens(tokenize_all(calc_input+defs.EOI)) == run(calc_input)
+for calc_input in [";", "123+321", "(1 2 ;"]:
+    try:
+        parse_tokens(tokenize_all(calc_input+defs.EOI))
+        assert False, "parsing error expected on " + repr(calc_input)
+    except ParserError:
+        pass
+
+# Reconnaissance directe sur le tampon : position du premier caractère en erreur
+assert validate("1 + 2 ; 3 *" + defs.EOI) == 11
+assert validate("1 + 2") == 5
+assert validate("(1 + 2)) ;") == 7
+assert validate("(1 ; 2) ;") == 3
+assert validate("2^-1;") == 2
+assert validate("1 2;") == 2
+assert validate("1.5e+ ;") == 3
+assert validate("3!^2;") == 2
+assert validate("1;x;") == 2
+# après la fin acceptée, le reste de l'entrée est vérifié jusqu'au EOI, comme par le lexer
+for calc_input, offset in [("1;e x", 4), ("1;#x", 3), ("1;. x", 4), ("1;e 2", -1)]:
+    assert validate(calc_input + defs.EOI) == offset
+    try:
+        parse(io.StringIO(calc_input + defs.EOI))
+        assert offset < 0
+    except LexerError as e:
+        assert str(e).endswith("offset " + str(offset))
+assert validate("1;" + defs.EOI + "x") == -1
+assert validate(b"1+2;" + defs.EOI.encode() + b"garbage") == -1
+assert validate(bytearray(b"2*(3+#1)!;")) == -1
@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+test the in-memory cache of results
+"""
+
+import io
+import math
+import sys
+import threading
+import definitions as defs
+from calc import parse, parse_cached, result_cache, ParserError
+from resultcache import ResultCache
+
+def test_same(calc_input, cache):
+    print("@ test cache on input:", repr(calc_input))
+    try:
+        expected = parse(io.StringIO(calc_input + defs.EOI))
+    except Exception as e:
+        try:
+            parse_cached(calc_input, cache=cache)
+            assert False
+        except type(e) as found:
+            assert str(found) == str(e)
+        print("@ => OK (error)")
+        return
+    for _ in range(2): # la deuxième fois, depuis le cache
+        found = parse_cached(calc_input, cache=cache)
+        assert repr(found) == repr(expected), "found {0} vs {1} expected".format(found, expected)
+        assert [type(n) for n in found] == [type(n) for n in expected]
+    print("@ => OK")
+
+cache = ResultCache()
+for calc_input in ["", "7;", "1 + 2 ; #1 * 10 ; 5! ; 3 - #3 ;", "-0; 0*-1; -#1; #1-#1; 1 / #2 + 1 / #1;",
+                   "1;e;2;", "2^1^3^2;(2^1)^3^2;", "1e308 * 10 ; #1 - #1 ;", "1;#0;", "1;#3;", "1 + ;",
+                   "1;2", "1;2);", "1 ; 1/0 ; 2 ;", "25!;#1/#1;30!;#3/#3;", "3!!;3!!;"]:
+    test_same(calc_input, cache)
+
+# séparateurs et écriture des nombres ne comptent pas, les #i sont remplacés par leur valeur
+cache = ResultCache()
+assert parse_cached("1 + 2 * 3 ; 5 ; #2 ! ;", cache=cache) == [7, 5, 120]
+assert (cache.hits, cache.misses) == (0, 3)
+assert parse_cached("1+2*3;5e0;#2!;  1.00 + 2*3;", cache=cache) == [7, 5, 120, 7]
+assert (cache.hits, cache.misses) == (4, 3)
+assert parse_cached("4 ; #1 + 1 ; 1 ; #3 + 1 ;", cache=cache) == [4, 5, 1, 2]
+assert (cache.hits, cache.misses) == (4, 7)
+assert parse_cached("1 ; #1 + 1 ; 4 ; #3 + 1 ;", cache=cache) == [1, 2, 4, 5]
+assert (cache.hits, cache.misses) == (8, 7)
+# 0.0 et -0.0, 6 et 6.0 sont des valeurs différentes
+assert repr(parse_cached("-0.0 ; #1 * 1 ; 0 ; #3 * 1 ;", cache=cache)) == "[-0.0, -0.0, 0.0, 0.0]"
+assert repr(parse_cached("3! ; #1 * #1 ; 6 ; #3 * #3 ;", cache=cache)) == "[6, 36, 6.0, 36.0]"
+# les erreurs ne sont pas gardées
+hits = cache.hits
+for _ in range(2):
+    try:
+        parse_cached("1 / 0 ;", cache=cache)
+        assert False
+    except ZeroDivisionError:
+        pass
+assert cache.hits == hits
+# un nombre trop grand est signalé après les erreurs des tokens qui le précèdent, comme par calc.parse
+for calc_input, error in [("+43e1772+", ParserError), ("1 ; 43e1772 ;", OverflowError)]:
+    try:
+        parse_cached(calc_input, cache=cache)
+        assert False
+    except error:
+        pass
+
+# éviction des moins récemment utilisés : nombre d'entrées...
+cache = ResultCache(max_entries=3)
+parse_cached("1;2;3;", cache=cache)
+parse_cached("1;4;", cache=cache)
+assert len(cache) == 3 and cache.evictions == 1
+hits = cache.hits
+parse_cached("1;3;4;", cache=cache)
+assert cache.hits == hits + 3
+parse_cached("2;", cache=cache)
+assert cache.hits == hits + 3
+# ... et octets
+cache = ResultCache(max_bytes=20000)
+parse_cached("".join("{0}!;".format(i) for i in range(1000, 1100)), cache=cache)
+assert cache.size <= 20000 and cache.evictions > 0
+assert cache.stats()['bytes'] == cache.size == sum(size for _, size in cache.entries.values())
+cache = ResultCache(max_bytes=100)
+assert parse_cached("3000!;3000!;", cache=cache) == [math.factorial(3000)] * 2
+assert len(cache) == 0
+
+# cache partagé par défaut, et lecture dans un flux
+result_cache.clear()
+assert parse_cached(io.StringIO("1 + 1 ; 1+1;" + defs.EOI + "garbage")) == [2, 2]
+assert result_cache.stats()['hits'] >= 1
+
+# un même cache partagé par plusieurs threads
+switch = sys.getswitchinterval()
+sys.setswitchinterval(1e-6)
+try:
+    cache = ResultCache(max_entries=20)
+    texts = ["".join("{0} * {1} ; #1 + 1 ;".format(t + k % 30, k % 7) for k in range(50)) for t in range(8)]
+    found = [None] * len(texts)
+    def work(t):
+        for _ in range(5):
+            found[t] = parse_cached(texts[t], cache=cache)
+    threads = [threading.Thread(target=work, args=(t,)) for t in range(len(texts))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+finally:
+    sys.setswitchinterval(switch)
+assert found == [parse(io.StringIO(text + defs.EOI)) for text in texts]
+assert cache.hits + cache.misses == 8 * 5 * 100 and len(cache) <= 20
+assert cache.size == sum(size for _, size in cache.entries.values())
@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+test the incremental editing sessions
+"""
+
+import io
+import math
+import definitions as defs
+from calc import parse, open_session, ParserError
+
+def check(session):
+    # Toujours les mêmes résultats que calc.parse sur le texte entier
+    try:
+        expected = parse(io.StringIO(session.text() + defs.EOI))
+    except Exception as e:
+        try:
+            session.results()
+            assert False
+        except type(e):
+            return
+    assert repr(session.results()) == repr(expected), (session.results(), expected)
+
+text = " 1 + 2 ;\t #1 * 10 ;  5! ; #2 - #1 ; 7 ;\t #4 / 3 ;  "
+session = open_session(text + defs.EOI + "garbage")
+assert len(session) == 6 and session.text() == text
+assert session.source(2) == "\t #1 * 10 ;"
+assert session.spans()[1] == (8, 19) and text[8:19] == session.source(2)
+check(session)
+
+# seuls le calcul modifié et ceux qui en dépendent sont recalculés
+assert session.edit(3, " 6! ;") == [3]
+assert session.value(3) == 720
+assert session.edit(1, " 2 + 2 ;") == [1, 2, 4, 6]
+assert session.results() == [4.0, 40.0, 720, 36.0, 7.0, 12.0]
+check(session)
+# les séparateurs seuls ne changent rien, une valeur identique arrête la propagation
+assert session.edit(1, "2+2;") == []
+assert session.edit(1, "3+1;") == [1]
+assert session.text().startswith("3+1;")
+# les dépendances suivent le nouveau texte
+assert session.edit(4, " #3 - #5 ;") == [4, 6] # #5 n'existe pas encore
+check(session)
+assert session.edit(4, " #3 - #2 ;") == [4, 6]
+assert session.edit(1, "1;") == [1, 2, 4, 6]
+assert session.results() == [1.0, 10.0, 720, 710.0, 7.0, 710.0 / 3]
+check(session)
+
+# erreurs : celle du premier calcul en erreur, comme calc.parse, et elles disparaissent avec leur cause
+session = open_session("1 ; #1 / #2 ; 2 ; #2 + 1 ; #9 ;")
+try:
+    session.results()
+    assert False
+except IndexError:
+    pass
+session.edit(5, " 3 ;")
+session.edit(2, " #1 / (#1 - 1) ;")
+try:
+    session.value(4)
+    assert False
+except ZeroDivisionError:
+    pass
+check(session)
+session.edit(1, "2 ;")
+assert session.results() == [2.0, 2.0, 2.0, 3.0, 3.0]
+check(session)
+assert session.edit(3, "-0 ;") == [3]
+assert math.copysign(1, session.value(3)) == -1
+# un zéro de l'autre signe change les calculs qui en dépendent
+session.edit(4, " #3 * 5 ;")
+assert math.copysign(1, session.value(4)) == -1
+assert session.edit(3, "0 ;") == [3, 4]
+assert math.copysign(1, session.value(4)) == 1
+check(session)
+
+# un texte qui n'est pas un seul calcul est refusé et ne change rien
+for source in ["1 + ;", "1 ; 2 ;", "1", "", " ;", "(1 ;", "1;\n"]:
+    try:
+        session.edit(1, source)
+        assert False
+    except ParserError:
+        pass
+assert repr(session.results()) == repr([2.0, 2.0, 0.0, 0.0, 3.0])
+for i in [0, 6]:
+    try:
+        session.edit(i, "1;")
+        assert False
+    except IndexError:
+        pass
+
+# les erreurs d'un calcul viennent dans l'ordre de son évaluation
+session = open_session("(0-1)! + #2 ; 1 ;")
+try:
+    session.value(1)
+    assert False
+except ValueError:
+    pass
+check(session)
+session.edit(1, " 3! + #2 ;")
+try:
+    session.value(1)
+    assert False
+except IndexError:
+    pass
+check(session)
+
+# calculs plus imbriqués que la pile de Python
+D = 3000
+session = open_session("2;" + "1-(" * D + "#1" + ")" * D + ";")
+assert session.results() == [2.0, 2.0]
+assert session.edit(2, "1-(" * D + "#1" + ")" * D + " ;") == []
+assert session.edit(1, "3;") == [1, 2]
+assert session.edit(2, "1-(" * D + "#1*2" + ")" * D + ";") == [2]
+check(session)
+
+# entrée incomplète ou vide
+try:
+    open_session("1 ; 2")
+    assert False
+except ParserError:
+    pass
+session = open_session("  \n")
+assert len(session) == 0 and session.results() == []
+session.append("7;")
+session.append("#1 * 2 ;")
+assert session.results() == [7.0, 14.0]
+
+# beaucoup de calculs : une modification ne touche que sa chaîne de dépendances
+N = 10000
+session = open_session("".join("{0} ; #{1} + 1 ;".format(i, 2 * i + 1) for i in range(N)))
+assert session.edit(2 * N - 1, "100 ;") == [2 * N - 1, 2 * N]
+assert session.value(2 * N) == 101.0
+check(session)
@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+test the subresult cache shared between processes
+"""
+
+import io
+import math
+import os
+import subprocess
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+import compiler
+import definitions as defs
+import parallel
+from calc import parse, compile, evaluate_parallel
+from sharedcache import SharedCache, evaluate, digest, SLOT, HEADER
+
+def evaluate_all(calc_input, cache):
+    # Comme calc.parse, en passant par le cache
+    r = []
+    for tree in compiler.parse_trees(calc_input):
+        r.append(evaluate(tree, r, cache))
+    return r
+
+def put_in_process(cache, values, prefix=b"p"):
+    for k, n in enumerate(values):
+        cache.put(digest(prefix + str(k).encode()), n)
+    return cache.stores
+
+def get_in_process(cache, n_values):
+    return [cache.get(digest(b"p" + str(k).encode())) for k in range(n_values)]
+
+def attached_in_process():
+    return list(parallel.attached)
+
+if __name__ == "__main__":
+    with SharedCache(n_slots=1000, side_bytes=1 << 20) as cache:
+        assert cache.n_slots == 1024 and len(cache) == 0
+
+        # les valeurs sont rendues exactement : types, signe des zéros, nan, grands entiers
+        values = [1.5, -0.0, math.inf, math.nan, math.factorial(500), -math.factorial(30), 0, 7]
+        for k, n in enumerate(values):
+            cache.put(digest(str(k).encode()), n)
+        for k, n in enumerate(values):
+            found, = cache.get(digest(str(k).encode()))
+            assert type(found) is type(n) and repr(found) == repr(n)
+        assert cache.get(digest(b"absent")) is None
+        assert (cache.hits, cache.misses, len(cache)) == (len(values), 1, len(values))
+
+        # une case abîmée (écriture concurrente) compte comme absente
+        position = HEADER.size + (int.from_bytes(digest(b"0")[:8], 'little') & (cache.n_slots - 1)) * SLOT.size
+        cache.buf[position + 24] ^= 1
+        assert cache.get(digest(b"0")) is None and len(cache) == len(values) - 1
+
+        # d'autres processus lisent et écrivent le même bloc, sans copie
+        with ProcessPoolExecutor(2) as executor:
+            more = [float(k) / 3 for k in range(200)] + [math.factorial(k) for k in range(100, 300)]
+            assert executor.submit(put_in_process, cache, more).result() == len(more)
+            found = executor.submit(get_in_process, cache, len(more)).result()
+        assert [n for n, in found] == more
+
+        # des processus qui rangent en même temps de grands entiers ne s'écrasent pas
+        big = [[math.factorial(200 + 10 * w + k) for k in range(40)] for w in range(4)]
+        with ProcessPoolExecutor(4) as executor:
+            stores = list(executor.map(put_in_process, [cache] * 4, big, [b"w" + bytes([w]) for w in range(4)]))
+        assert stores == [40] * 4
+        for w in range(4):
+            assert [cache.get(digest(b"w" + bytes([w]) + str(k).encode())) for k in range(40)] == [(n,) for n in big[w]]
+
+        # ouvert sans le verrou, le cache ne range plus de grands entiers
+        other = SharedCache.attach(cache.name)
+        other.put(digest(b"sans verrou"), math.factorial(100))
+        other.put(digest(b"flottant"), 0.5)
+        assert other.stores == 1 and cache.get(digest(b"flottant")) == (0.5,)
+        other.close()
+
+        # un processus qui n'est pas lancé par multiprocessing a son propre resource_tracker :
+        # le bloc qu'il a ouvert n'est pas détruit à sa fin, et rien n'est écrit sur stderr
+        script = "import sharedcache; sharedcache.SharedCache.attach({0!r}).close()".format(cache.name)
+        done = subprocess.run([sys.executable, "-c", script], cwd=os.path.dirname(os.path.abspath(__file__)),
+                              capture_output=True, text=True)
+        assert done.returncode == 0 and done.stderr == "", done.stderr
+        other = SharedCache.attach(cache.name)
+        assert other.get(digest(b"flottant")) == (0.5,)
+        other.close()
+
+    # mêmes valeurs que calc.parse, et les sous-résultats coûteux ne sont calculés qu'une fois
+    with SharedCache() as cache:
+        for calc_input in ["2^0.5 + 20!; (2^0.5) * 20!; #1 - #2; 3!!; -3^2!; 1;#6^#6;",
+                           "25!;#1/#1;30!;#3/#3; 1000! / 999!; 1000! - 999!;", "-0; #1 * 2^1;"]:
+            expected = parse(io.StringIO(calc_input + defs.EOI))
+            for _ in range(2):
+                assert repr(evaluate_all(calc_input, cache)) == repr(expected)
+        hits = cache.hits
+        assert hits > 0
+        # nan et -nan ont le même repr mais pas le même sous-résultat
+        nan_input = "1e308*10 - 1e308*10 ; -#1 ; #1 ^ 1 ; #2 ^ 1 ;"
+        expected = [math.copysign(1, n) for n in parse(io.StringIO(nan_input + defs.EOI))]
+        assert [math.copysign(1, n) for n in evaluate_all(nan_input, cache)] == expected
+        for calc_input, error in [("1/0;", ZeroDivisionError), ("(0-1)!;", ValueError), ("1;#3!;", IndexError)]:
+            try:
+                evaluate_all(calc_input, cache)
+                assert False
+            except error:
+                pass
+
+        # évaluation en parallèle : les processus partagent les sous-résultats
+        text = " ".join("{0}! / {1}! ;".format(1000 + i % 20, 999 + i % 20) if i % 3 else "#{0} * 2 ^ 0.5 ;".format(i)
+                        if i else "1;" for i in range(300))
+        expected = parse(io.StringIO(text + defs.EOI))
+        with ProcessPoolExecutor(2) as executor:
+            program = compile(text)
+            assert parallel.run(program, executor, cache=cache) == expected
+            stored = len(cache)
+            assert parallel.run(program, executor, cache=cache) == expected
+            assert len(cache) == stored
+        assert evaluate_parallel(text, 2, cache=cache) == expected
+        # un processus ne garde ouvert que le dernier cache qu'il a utilisé
+        with ProcessPoolExecutor(1) as executor:
+            assert parallel.run(program, executor, cache=cache) == expected
+            with SharedCache() as other:
+                assert parallel.run(program, executor, cache=other) == expected
+                assert executor.submit(attached_in_process).result() == [other.name]
+            assert parallel.run(program, executor) == expected
+            assert executor.submit(attached_in_process).result() == []
+
+        # une table pleine ne garde plus rien, mais les valeurs restent justes
+        with SharedCache(n_slots=4, side_bytes=64) as small:
+            assert repr(evaluate_all(text, small)) == repr(expected)
+            assert len(small) <= 4
@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+test the persistent cache of results in SQLite
+"""
+
+import io
+import math
+import os
+import subprocess
+import sys
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+
+import definitions as defs
+from calc import parse, parse_cached
+from sqlitecache import SQLiteCache
+
+class ReadOnlyWhileEvaluating(SQLiteCache):
+    # Pendant l'évaluation, aucune transaction d'écriture ne bloque les autres processus
+    def get(self, key):
+        assert not self.db.in_transaction
+        return super().get(key)
+
+    def put(self, key, value):
+        super().put(key, value)
+        assert not self.db.in_transaction
+
+def parse_in_process(path, text):
+    with SQLiteCache(path) as cache:
+        return parse_cached(text, cache=cache)
+
+if __name__ == "__main__":
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'results.sqlite')
+        text = "1000! ; #1 / #1 ; 1e308 * 10 ; #3 - #3 ; -0 ; 0 * -1 ; 2 ^ 0.5 ; 1000! - 3! ;"
+        expected = parse(io.StringIO(text + defs.EOI))
+
+        # les valeurs relues sont exactement celles calculées : types, signe des zéros, nan
+        with SQLiteCache(path) as cache:
+            assert repr(parse_cached(text, cache=cache)) == repr(expected)
+            assert cache.hits == 0 and len(cache) == 8
+        with ReadOnlyWhileEvaluating(path) as cache:
+            found = parse_cached(text, cache=cache)
+            assert repr(found) == repr(expected)
+            assert [type(n) for n in found] == [type(n) for n in expected]
+            assert (cache.hits, cache.misses) == (8, 0)
+            # les #i sont remplacés par leur valeur
+            assert parse_cached("2 ; 1000 ! ; #2 / #2 ;", cache=cache) == [2, expected[0], 1.0]
+            assert (cache.hits, cache.misses) == (10, 1)
+            # les erreurs ne sont pas gardées, les calculs qui les précèdent si
+            try:
+                parse_cached("123 ; 1 / 0 ;", cache=cache)
+                assert False
+            except ZeroDivisionError:
+                pass
+        with SQLiteCache(path) as cache:
+            assert parse_cached("123;", cache=cache) == [123] and cache.hits == 1
+            cache.clear()
+            assert len(cache) == 0
+
+        # éviction des moins récemment utilisés au delà de la taille limite
+        with SQLiteCache(path, max_bytes=20000) as cache:
+            for i in range(200):
+                parse_cached("{0}! ;".format(1000 + i), cache=cache)
+            cache.evict()
+            assert cache.stored_size() <= 20000 and cache.evictions > 0
+            hits = cache.hits
+            parse_cached("1199! ;", cache=cache)
+            assert cache.hits == hits + 1
+            parse_cached("1000! ;", cache=cache)
+            assert cache.hits == hits + 1
+            # la taille tenue à jour est celle des entrées
+            assert cache.stored_size() == cache.db.execute(
+                'SELECT SUM(LENGTH(key) + LENGTH(data)) + 32 * COUNT(*) FROM results').fetchone()[0]
+
+        # plusieurs processus lisent et écrivent la même base en même temps
+        path = os.path.join(tmp, 'shared.sqlite')
+        texts = ["".join("{0}! / {1} ;".format(100 + (i + j) % 50, j + 1) for j in range(50)) for i in range(16)]
+        with ProcessPoolExecutor(4) as executor:
+            results = list(executor.map(parse_in_process, [path] * len(texts), texts))
+        assert results == [parse(io.StringIO(t + defs.EOI)) for t in texts]
+        with SQLiteCache(path) as cache:
+            assert len(cache) == 16 * 50
+
+        # option --cache de la ligne de commande : le deuxième lancement relit la base
+        command = [sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'calc.py'), '--cache', path]
+        for _ in range(2):
+            out = subprocess.run(command, input="25! ; #1 - 3! ;\n", capture_output=True, text=True, check=True).stdout
+            assert repr([math.factorial(25), math.factorial(25) - 6]) in out
+        with SQLiteCache(path) as cache:
+            assert parse_cached("25!;", cache=cache) and cache.hits == 1